@@ -0,0 +1,135 @@
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Database (see app/database.py)
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./sql_app.db")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# Seconds before a connection is replaced; -1 keeps connections forever
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+SQLITE_BUSY_TIMEOUT = float(os.getenv("SQLITE_BUSY_TIMEOUT", "5"))
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_CACHE_KB = int(os.getenv("SQLITE_CACHE_KB", "65536"))
+
+# Outbound delivery (see app/services/delivery.py)
+DELIVERY_MAX_CONNECTIONS = int(os.getenv("DELIVERY_MAX_CONNECTIONS", "200"))
+DELIVERY_MAX_KEEPALIVE = int(os.getenv("DELIVERY_MAX_KEEPALIVE", "100"))
+DELIVERY_PER_HOST_LIMIT = int(os.getenv("DELIVERY_PER_HOST_LIMIT", "20"))
+DELIVERY_CONNECT_TIMEOUT = float(os.getenv("DELIVERY_CONNECT_TIMEOUT", "3"))
+DELIVERY_READ_TIMEOUT = float(os.getenv("DELIVERY_READ_TIMEOUT", "10"))
+DELIVERY_KEEPALIVE_EXPIRY = float(os.getenv("DELIVERY_KEEPALIVE_EXPIRY", "30"))
+
+# Fair per-subscription scheduling (see app/services/delivery_scheduler.py)
+# Deliveries attempted at once across all subscriptions; the rest wait in
+# per-subscription queues
+DELIVERY_SCHEDULER_CONCURRENCY = int(os.getenv("DELIVERY_SCHEDULER_CONCURRENCY", str(DELIVERY_MAX_CONNECTIONS)))
+
+# Bulk ingest limits, enforced while the body streams in
+# (see app/services/bulk_ingest.py)
+BULK_MAX_BYTES = int(os.getenv("BULK_MAX_BYTES", str(10 * 1024 * 1024)))
+BULK_MAX_ITEMS = int(os.getenv("BULK_MAX_ITEMS", "10000"))
+
+# Payload handling (see app/services/payloads.py)
+# "auto" uses orjson when it is installed, "json" forces the stdlib
+JSON_BACKEND = os.getenv("JSON_BACKEND", "auto")
+SIGNATURE_CACHE_SIZE = int(os.getenv("SIGNATURE_CACHE_SIZE", "10000"))
+
+# Per-destination health (see app/services/host_health.py)
+# DELIVERY_PER_HOST_LIMIT is the starting concurrency; AIMD moves it
+# between these bounds
+DELIVERY_PER_HOST_MIN_LIMIT = int(os.getenv("DELIVERY_PER_HOST_MIN_LIMIT", "1"))
+DELIVERY_PER_HOST_MAX_LIMIT = int(os.getenv("DELIVERY_PER_HOST_MAX_LIMIT", "100"))
+DELIVERY_LATENCY_TARGET = float(os.getenv("DELIVERY_LATENCY_TARGET", "2"))
+DELIVERY_LIMIT_DECREASE = float(os.getenv("DELIVERY_LIMIT_DECREASE", "0.7"))
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_OPEN_SECONDS = float(os.getenv("BREAKER_OPEN_SECONDS", "30"))
+BREAKER_MAX_OPEN_SECONDS = float(os.getenv("BREAKER_MAX_OPEN_SECONDS", "600"))
+# Parked deliveries resume spread over this many seconds after the breaker
+# lets traffic through again
+BREAKER_PARK_JITTER = float(os.getenv("BREAKER_PARK_JITTER", "5"))
+
+# Idempotency-Key dedup store (see app/services/idempotency.py)
+IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL", str(24 * 3600)))
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "100000"))
+IDEMPOTENCY_FILTER_CAPACITY = int(os.getenv("IDEMPOTENCY_FILTER_CAPACITY", "1000000"))
+IDEMPOTENCY_FILTER_ERROR_RATE = float(os.getenv("IDEMPOTENCY_FILTER_ERROR_RATE", "0.01"))
+IDEMPOTENCY_FLUSH_INTERVAL = float(os.getenv("IDEMPOTENCY_FLUSH_INTERVAL", "0.05"))
+# How often keys recorded by other processes are added to the filter
+IDEMPOTENCY_REFRESH_INTERVAL = float(os.getenv("IDEMPOTENCY_REFRESH_INTERVAL", "5"))
+IDEMPOTENCY_CLEANUP_INTERVAL = float(os.getenv("IDEMPOTENCY_CLEANUP_INTERVAL", "300"))
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+
+# Retry scheduling (see app/services/retry_scheduler.py)
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_RETRY_BACKOFF = "10,30,60,300,900"
+DEFAULT_RETRY_JITTER = 0.1
+RETRY_LEASE_SECONDS = float(os.getenv("RETRY_LEASE_SECONDS", "120"))
+# Delay before re-running a retry whose outcome couldn't be recorded
+RETRY_ERROR_DELAY = float(os.getenv("RETRY_ERROR_DELAY", "30"))
+
+# Subscription lookup cache (see app/services/subscription_cache.py)
+SUBSCRIPTION_CACHE_SIZE = int(os.getenv("SUBSCRIPTION_CACHE_SIZE", "10000"))
+SUBSCRIPTION_CACHE_TTL = float(os.getenv("SUBSCRIPTION_CACHE_TTL", "60"))
+# Redis URL for cross-process invalidation; unset keeps invalidation local
+SUBSCRIPTION_CACHE_INVALIDATION_URL = os.getenv("SUBSCRIPTION_CACHE_INVALIDATION_URL")
+
+# Event-type fan-out index (see app/services/event_index.py): full reload
+# interval, bounding staleness from other processes' writes like the cache TTL
+EVENT_INDEX_RELOAD_INTERVAL = float(os.getenv("EVENT_INDEX_RELOAD_INTERVAL", str(SUBSCRIPTION_CACHE_TTL)))
+
+# Buffered DeliveryLog writes (see app/services/log_writer.py)
+LOG_WRITER_BATCH_SIZE = int(os.getenv("LOG_WRITER_BATCH_SIZE", "500"))
+LOG_WRITER_FLUSH_INTERVAL = float(os.getenv("LOG_WRITER_FLUSH_INTERVAL", "0.05"))
+LOG_WRITER_MAX_QUEUE = int(os.getenv("LOG_WRITER_MAX_QUEUE", "10000"))
+# A failed batch is retried with doubling backoff (capped at
+# LOG_WRITER_RETRY_MAX_BACKOFF seconds) before its records are written one by one
+LOG_WRITER_RETRY_ATTEMPTS = int(os.getenv("LOG_WRITER_RETRY_ATTEMPTS", "8"))
+LOG_WRITER_RETRY_BACKOFF = float(os.getenv("LOG_WRITER_RETRY_BACKOFF", "0.1"))
+LOG_WRITER_RETRY_MAX_BACKOFF = float(os.getenv("LOG_WRITER_RETRY_MAX_BACKOFF", "5"))
+
+# Delivery log retention (see app/services/log_archive.py)
+LOG_RETENTION_DAYS = float(os.getenv("LOG_RETENTION_DAYS", "7"))
+LOG_ERROR_MAX_CHARS = int(os.getenv("LOG_ERROR_MAX_CHARS", "2048"))
+LOG_ARCHIVE_DIR = os.getenv("LOG_ARCHIVE_DIR", "./archive")
+LOG_ARCHIVE_ENABLED = os.getenv("LOG_ARCHIVE_ENABLED", "true").lower() == "true"
+LOG_ARCHIVE_INTERVAL = float(os.getenv("LOG_ARCHIVE_INTERVAL", "300"))
+LOG_ARCHIVE_CHUNK = int(os.getenv("LOG_ARCHIVE_CHUNK", "5000"))
+
+# Where ingest hands deliveries: "background" (in-process fair scheduler),
+# "celery" (app/workers/celery_worker.py) or "queue" (durable on-disk queue,
+# consumed in the API process and/or app/workers/queue_worker.py)
+DELIVERY_BACKEND = os.getenv("DELIVERY_BACKEND", "background")
+CELERY_BROKER_URL = os.getenv("CELERY_BROKER_URL", "redis://kv-store-url:6379")
+# Folder for the filesystem:// broker, a no-server stand-in for local runs
+CELERY_BROKER_DIR = os.getenv("CELERY_BROKER_DIR", "./broker")
+
+# Durable on-disk ingest queue for DELIVERY_BACKEND=queue
+# (see app/services/ingest_queue.py)
+QUEUE_DIR = os.getenv("QUEUE_DIR", "./queue")
+QUEUE_PARTITIONS = int(os.getenv("QUEUE_PARTITIONS", "4"))
+QUEUE_SEGMENT_BYTES = int(os.getenv("QUEUE_SEGMENT_BYTES", str(64 * 1024 * 1024)))
+QUEUE_COMMIT_BATCH = int(os.getenv("QUEUE_COMMIT_BATCH", "1000"))
+# Entries being handed to the delivery scheduler at once per partition
+QUEUE_CONSUMER_CONCURRENCY = int(os.getenv("QUEUE_CONSUMER_CONCURRENCY", "100"))
+# Entries read and not yet acked per partition, including those waiting in
+# the delivery scheduler (behind a rate limit or an ordered delivery)
+QUEUE_CONSUMER_MAX_PENDING = int(os.getenv("QUEUE_CONSUMER_MAX_PENDING", "10000"))
+# Partitions one consumer process may own; 0 takes every free one
+QUEUE_CONSUMER_PARTITIONS = int(os.getenv("QUEUE_CONSUMER_PARTITIONS", "0"))
+QUEUE_CONSUME_IN_API = os.getenv("QUEUE_CONSUME_IN_API", "true").lower() == "true"
+QUEUE_POLL_INTERVAL = float(os.getenv("QUEUE_POLL_INTERVAL", "0.05"))
+QUEUE_ACK_INTERVAL = float(os.getenv("QUEUE_ACK_INTERVAL", "0.1"))
+QUEUE_COMPACT_INTERVAL = float(os.getenv("QUEUE_COMPACT_INTERVAL", "5"))
+# A delivery whose dispatch raises is retried with exponential backoff
+# (QUEUE_DISPATCH_BACKOFF doubling up to QUEUE_DISPATCH_MAX_BACKOFF seconds);
+# after QUEUE_DISPATCH_MAX_ATTEMPTS it goes to the partition's dead-letter file
+QUEUE_DISPATCH_MAX_ATTEMPTS = int(os.getenv("QUEUE_DISPATCH_MAX_ATTEMPTS", "10"))
+QUEUE_DISPATCH_BACKOFF = float(os.getenv("QUEUE_DISPATCH_BACKOFF", "1"))
+QUEUE_DISPATCH_MAX_BACKOFF = float(os.getenv("QUEUE_DISPATCH_MAX_BACKOFF", "60"))
+
+# Prometheus metrics at /metrics (see app/services/metrics.py)
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
@@ -1,19 +1,169 @@
-from sqlalchemy import create_engine
+"""
+The one database layer for the API, the queue worker and the Celery worker.
+
+A single pooled engine is built from DATABASE_URL. Blocking ORM work from
+async code goes through run_db(), whose thread pool has one thread per
+pooled connection: the event loop never waits on the database, and DB
+throughput grows with the pool instead of one thread.
+"""
+import asyncio
+import functools
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from sqlalchemy import create_engine, event, inspect, literal
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool, StaticPool
 
-from dotenv import load_dotenv
-import os
+from app import config
+from app.services import metrics
 
-load_dotenv()
+logger = logging.getLogger(__name__)
 
-SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./sql_app.db")
+SQLALCHEMY_DATABASE_URL = config.DATABASE_URL
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./sql_app.db"
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
+class TimedQueuePool(QueuePool):
+    """
+    QueuePool that records how long each checkout waited for a connection.
+    """
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            metrics.DB_POOL_WAIT.observe(time.perf_counter() - start)
+
+
+def _create_engine(url: str):
+    parsed = make_url(url)
+    if parsed.get_backend_name() != "sqlite":
+        return create_engine(
+            url,
+            poolclass=TimedQueuePool,
+            pool_size=config.DB_POOL_SIZE,
+            max_overflow=config.DB_MAX_OVERFLOW,
+            pool_timeout=config.DB_POOL_TIMEOUT,
+            pool_recycle=config.DB_POOL_RECYCLE,
+            pool_pre_ping=config.DB_POOL_PRE_PING,
+        )
+
+    connect_args = {"check_same_thread": False, "timeout": config.SQLITE_BUSY_TIMEOUT}
+    if parsed.database in (None, "", ":memory:"):
+        # Every connection to :memory: is a new database: share one
+        return create_engine(url, connect_args=connect_args, poolclass=StaticPool)
+
+    engine = create_engine(
+        url,
+        connect_args=connect_args,
+        poolclass=TimedQueuePool,
+        pool_size=config.DB_POOL_SIZE,
+        max_overflow=config.DB_MAX_OVERFLOW,
+        pool_timeout=config.DB_POOL_TIMEOUT,
+    )
+
+    @event.listens_for(engine, "connect")
+    def _sqlite_pragmas(dbapi_connection, connection_record):
+        # WAL lets readers run alongside the single writer; NORMAL only
+        # fsyncs at checkpoints, which is still safe against corruption
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute(f"PRAGMA synchronous={config.SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA busy_timeout={int(config.SQLITE_BUSY_TIMEOUT * 1000)}")
+        cursor.execute(f"PRAGMA cache_size=-{config.SQLITE_CACHE_KB}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.close()
+
+    return engine
+
+
+engine = _create_engine(SQLALCHEMY_DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
+
+def init_db(bind=None):
+    """
+    Create missing tables, then bring existing ones up to the models.
+
+    create_all never alters a table that already exists, so columns and
+    indexes added to the models since a database was created are added
+    here: ALTER TABLE ... ADD COLUMN (NOT NULL columns get their model
+    default for existing rows) and CREATE INDEX. Changes are additive only;
+    nothing is dropped, renamed or retyped.
+    """
+    from app import models  # noqa: F401 (registers every table on Base)
+
+    bind = bind or engine
+    Base.metadata.create_all(bind=bind)
+    inspector = inspect(bind)
+    with bind.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            columns = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in columns:
+                    logger.warning(f"Adding column {table.name}.{column.name}")
+                    conn.exec_driver_sql(_add_column_sql(table, column, conn.dialect))
+            indexes = {i["name"] for i in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in indexes:
+                    logger.warning(f"Creating index {index.name} on {table.name}")
+                    index.create(conn)
+
+
+def _add_column_sql(table, column, dialect) -> str:
+    preparer = dialect.identifier_preparer
+    sql = (
+        f"ALTER TABLE {preparer.format_table(table)} "
+        f"ADD COLUMN {preparer.format_column(column)} {column.type.compile(dialect=dialect)}"
+    )
+    default = column.default.arg if column.default is not None and column.default.is_scalar else None
+    if default is not None:
+        value = literal(default, column.type).compile(dialect=dialect, compile_kwargs={"literal_binds": True})
+        sql += f" DEFAULT {value}"
+        if not column.nullable:
+            sql += " NOT NULL"
+    return sql
+
+
+db_executor = ThreadPoolExecutor(
+    max_workers=config.DB_POOL_SIZE + config.DB_MAX_OVERFLOW, thread_name_prefix="db"
+)
+
+
+async def run_db(fn, *args, **kwargs):
+    """
+    Run blocking ORM work on the database thread pool.
+    """
+    return await asyncio.get_running_loop().run_in_executor(
+        db_executor, functools.partial(fn, *args, **kwargs)
+    )
+
+
+def get_db():
+    """
+    A session closed when the caller is done with it: a FastAPI dependency,
+    or `with db_session() as db:` anywhere else.
+    """
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+db_session = contextmanager(get_db)
+
+metrics.CallbackMetric(
+    "db_pool_connections", "Pooled database connections by state",
+    lambda: {
+        ("checked_out",): engine.pool.checkedout(),
+        ("idle",): engine.pool.checkedin(),
+    } if isinstance(engine.pool, QueuePool) else {},
+    labelnames=["state"],
+)
@@ -1,14 +1,85 @@
 from fastapi import FastAPI, HTTPException, Security, Depends
 from fastapi.security import APIKeyHeader
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 import os
 from dotenv import load_dotenv
 
+from . import config
+from .database import SessionLocal, engine, init_db
+from .routers import webhooks_router, subscriptions_router, destinations_router
+from .routers.webhooks import deliver_webhook
+from .services.delivery import engine as delivery_engine
+from .services.delivery_scheduler import delivery_scheduler
+from .services.event_index import event_index
+from .services.idempotency import idempotency_store
+from .services.ingest_queue import ingest_queue, queue_consumer
+from .services.log_archive import log_archiver
+from .services.log_writer import log_writer
+from .services import metrics
+from .services.retry_scheduler import retry_scheduler
+from .services.subscription_cache import subscription_cache
+
 # Load environment variables
 load_dotenv()
 
 app = FastAPI()
 
+app.include_router(webhooks_router)
+app.include_router(subscriptions_router, prefix="/subscriptions", tags=["subscriptions"])
+app.include_router(destinations_router)
+
+if config.METRICS_ENABLED:
+    metrics.instrument_engine(engine)
+    app.add_middleware(
+        metrics.RequestTimingMiddleware,
+        routes={
+            "/api/webhooks/ingest/": "ingest",
+            "/api/webhooks/events/": "events",
+            "/api/webhooks/bulk": "bulk",
+        },
+    )
+
+    @app.get("/metrics", include_in_schema=False)
+    async def prometheus_metrics():
+        return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.on_event("startup")
+async def start_background_services():
+    init_db()
+    subscription_cache.enable_invalidation_channel()
+    db = SessionLocal()
+    try:
+        event_index.load(db)
+    finally:
+        db.close()
+    subscription_cache.add_listener(event_index.refresh)
+    event_index.start()
+    subscription_cache.add_listener(delivery_scheduler.refresh)
+    log_writer.start()
+    idempotency_store.start()
+    # Every delivery attempt, first or retry, goes through the fair scheduler
+    delivery_scheduler.start(dispatch=deliver_webhook)
+    retry_scheduler.start(dispatch=delivery_scheduler.deliver)
+    if config.DELIVERY_BACKEND == "queue":
+        ingest_queue.start()
+        if config.QUEUE_CONSUME_IN_API:
+            queue_consumer.start(dispatch=delivery_scheduler.submit)
+    if config.LOG_ARCHIVE_ENABLED:
+        log_archiver.start()
+
+@app.on_event("shutdown")
+async def stop_background_services():
+    await log_archiver.stop()
+    await event_index.stop()
+    # Stop taking new entries before the consumer gives up its partitions
+    await ingest_queue.stop()
+    await queue_consumer.stop()
+    await retry_scheduler.stop()
+    await delivery_scheduler.stop()
+    await idempotency_store.stop()
+    await delivery_engine.aclose()
+    await log_writer.stop()
+
 # API Key Configuration
 API_KEY_NAME = "x-api-key"
 api_key_header = APIKeyHeader(name=API_KEY_NAME, auto_error=False)
@@ -17,9 +88,9 @@ api_key_header = APIKeyHeader(name=API_KEY_NAME, auto_error=False)
 API_KEYS = os.getenv("API_KEYS", "test-key,another-key")
 VALID_API_KEYS = (
     {key.strip(): f"user-{i}" 
-     for i, key in enumerate(API_KEYS.split(","), 1)
-     if API_KEYS.strip() 
-     else {"test-key": "test-user"}  # Fallback if empty
+     for i, key in enumerate(API_KEYS.split(","), 1)}
+    if API_KEYS.strip() 
+    else {"test-key": "test-user"}  # Fallback if empty
 )
 
 # Debug endpoint
@@ -0,0 +1,8 @@
+# app/models/__init__.py
+from .subscription import Subscription
+from .delivery_log import DeliveryLog
+from .delivery_status import DeliveryStatus
+from .retry_entry import RetryEntry
+from .idempotency_key import IdempotencyKey
+
+__all__ = ["Subscription", "DeliveryLog", "DeliveryStatus", "RetryEntry", "IdempotencyKey"]
@@ -1,13 +1,20 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, Index
 from datetime import datetime
 from ..database import Base
 
 class DeliveryLog(Base):
     __tablename__ = "delivery_logs"
+    __table_args__ = (
+        # Status lookups and per-subscription listings (keyset pagination)
+        Index("ix_delivery_logs_webhook_attempt", "webhook_id", "attempt_number"),
+        Index("ix_delivery_logs_subscription_timestamp", "subscription_id", "timestamp"),
+        # Retention: archiving walks expired rows in timestamp order
+        Index("ix_delivery_logs_timestamp", "timestamp"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
-    subscription_id = Column(Integer, index=True)
-    webhook_id = Column(String, index=True)
+    subscription_id = Column(Integer)
+    webhook_id = Column(String)
     target_url = Column(String)
     timestamp = Column(DateTime, default=datetime.utcnow)
     attempt_number = Column(Integer)
@@ -0,0 +1,19 @@
+from sqlalchemy import Column, Integer, String, DateTime, Boolean
+from ..database import Base
+
+class DeliveryStatus(Base):
+    """
+    One row per webhook, kept current as attempts are logged, so a status
+    poll is a primary-key read instead of an aggregate over delivery_logs.
+    """
+    __tablename__ = "delivery_statuses"
+
+    webhook_id = Column(String, primary_key=True)
+    subscription_id = Column(Integer)
+    target_url = Column(String)
+    attempts = Column(Integer, default=0)
+    delivered = Column(Boolean, default=False)
+    final_status = Column(String)
+    last_attempt_at = Column(DateTime, index=True)  # retention expires by this
+    last_status_code = Column(Integer, nullable=True)
+    last_error = Column(String, nullable=True)
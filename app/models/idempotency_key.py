@@ -0,0 +1,9 @@
+from sqlalchemy import Column, String, DateTime, Text
+from ..database import Base
+
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+
+    key = Column(String, primary_key=True)  # "<route scope>:<Idempotency-Key header>"
+    response = Column(Text)  # JSON body of the original 202
+    created_at = Column(DateTime, index=True)
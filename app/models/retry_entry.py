@@ -0,0 +1,13 @@
+from sqlalchemy import Column, Integer, String, DateTime, Text
+from ..database import Base
+
+class RetryEntry(Base):
+    __tablename__ = "retry_entries"
+
+    id = Column(Integer, primary_key=True, index=True)
+    webhook_id = Column(String, index=True)
+    subscription_id = Column(Integer)
+    payload = Column(Text)  # JSON-encoded
+    attempt = Column(Integer)
+    due_at = Column(DateTime, index=True)
+    locked_until = Column(DateTime, nullable=True)  # lease held by the dispatching worker
@@ -1,5 +1,6 @@
-from sqlalchemy import Column, String, Integer
+from sqlalchemy import Column, String, Integer, Float, Boolean
 from ..database import Base
+from .. import config
 
 class Subscription(Base):
     __tablename__ = "subscriptions"
@@ -7,4 +8,17 @@ class Subscription(Base):
     id = Column(Integer, primary_key=True, index=True)
     target_url = Column(String, nullable=False)
     secret = Column(String, nullable=True)
-    event_type = Column(String, nullable=True)  # For bonus points
+    event_type = Column(String, nullable=True, index=True)  # For bonus points
+
+    # Retry policy: total attempts, comma-separated backoff seconds, +/- jitter fraction
+    max_retries = Column(Integer, nullable=False, default=config.DEFAULT_MAX_RETRIES)
+    retry_backoff = Column(String, nullable=False, default=config.DEFAULT_RETRY_BACKOFF)
+    retry_jitter = Column(Float, nullable=False, default=config.DEFAULT_RETRY_JITTER)
+
+    # Delivery scheduling: share of delivery capacity relative to other
+    # subscriptions, optional token bucket (deliveries/second, burst size),
+    # and one-at-a-time dispatch in arrival order
+    delivery_weight = Column(Float, nullable=False, default=1.0)
+    rate_limit = Column(Float, nullable=True)
+    rate_limit_burst = Column(Integer, nullable=True)
+    ordered_delivery = Column(Boolean, nullable=False, default=False)
@@ -1,6 +1,6 @@
 # app/routers/__init__.py
 from .webhooks import router as webhooks_router
 from .subscriptions import router as subscriptions_router
-from .status import router as status_router
+from .destinations import router as destinations_router
 
-__all__ = ["webhooks_router", "subscriptions_router", "status_router"]
+__all__ = ["webhooks_router", "subscriptions_router", "destinations_router"]
@@ -0,0 +1,30 @@
+from fastapi import APIRouter, HTTPException
+
+from ..services.delivery import engine as delivery_engine
+
+router = APIRouter(prefix="/api/destinations", tags=["destinations"])
+
+# async: breaker and limiter state belongs to the event loop that delivers,
+# so these must not run in the threadpool
+@router.get("/")
+async def list_destinations(state: str = None):
+    """
+    Circuit breaker and adaptive concurrency state for every destination
+    this process has delivered to (optionally only those in `state`)
+    """
+    hosts = delivery_engine.hosts.snapshot()
+    if state:
+        hosts = [h for h in hosts if h["state"] == state]
+    return {"destinations": hosts}
+
+@router.post("/reset")
+async def reset_destination(host: str):
+    """
+    Close a destination's breaker by hand, e.g. once the subscriber reports
+    it is back. `host` is the scheme://host:port key from the listing.
+    """
+    state = delivery_engine.hosts.find(host)
+    if state is None:
+        raise HTTPException(status_code=404, detail="Destination not found")
+    state.breaker.reset()
+    return state.snapshot()
@@ -1,8 +1,14 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query, Response
+from sqlalchemy import and_, or_
 from sqlalchemy.orm import Session
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+from typing import Optional
 from ..models.subscription import Subscription
+from ..models.delivery_log import DeliveryLog
 from ..database import get_db
-from ..schemas import SubscriptionCreate, SubscriptionResponse
+from ..schemas import SubscriptionCreate, SubscriptionResponse, SubscriptionUpdate
+from ..services.subscription_cache import subscription_cache
 
 router = APIRouter()
 
@@ -12,6 +18,88 @@ def create_subscription(subscription: SubscriptionCreate, db: Session = Depends(
     db.add(db_subscription)
     db.commit()
     db.refresh(db_subscription)
+    subscription_cache.invalidate(db_subscription.id)
     return db_subscription
 
-# Add GET, PUT, DELETE endpoints similarly
+@router.get("/cache/stats")
+def subscription_cache_stats():
+    return subscription_cache.stats()
+
+@router.get("/{subscription_id}", response_model=SubscriptionResponse)
+def get_subscription(subscription_id: int, db: Session = Depends(get_db)):
+    db_subscription = db.query(Subscription).filter(Subscription.id == subscription_id).first()
+    if not db_subscription:
+        raise HTTPException(status_code=404, detail="Subscription not found")
+    return db_subscription
+
+@router.put("/{subscription_id}", response_model=SubscriptionResponse)
+def update_subscription(subscription_id: int, changes: SubscriptionUpdate, db: Session = Depends(get_db)):
+    db_subscription = db.query(Subscription).filter(Subscription.id == subscription_id).first()
+    if not db_subscription:
+        raise HTTPException(status_code=404, detail="Subscription not found")
+    for field, value in changes.dict(exclude_unset=True).items():
+        setattr(db_subscription, field, value)
+    db.commit()
+    db.refresh(db_subscription)
+    subscription_cache.invalidate(subscription_id)
+    return db_subscription
+
+@router.delete("/{subscription_id}", status_code=204)
+def delete_subscription(subscription_id: int, db: Session = Depends(get_db)):
+    deleted = db.query(Subscription).filter(Subscription.id == subscription_id).delete()
+    db.commit()
+    subscription_cache.invalidate(subscription_id)
+    if not deleted:
+        raise HTTPException(status_code=404, detail="Subscription not found")
+    return Response(status_code=204)
+
+def _encode_cursor(log: DeliveryLog) -> str:
+    return urlsafe_b64encode(f"{log.timestamp.isoformat()}|{log.id}".encode()).decode()
+
+def _decode_cursor(cursor: str):
+    try:
+        timestamp, log_id = urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(timestamp), int(log_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+@router.get("/{subscription_id}/deliveries")
+def list_deliveries(
+    subscription_id: int,
+    success: Optional[bool] = None,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Newest-first delivery attempts for a subscription. Keyset-paginated on
+    (timestamp, id) so each page is an index range scan however deep it is.
+    """
+    query = db.query(DeliveryLog).filter(DeliveryLog.subscription_id == subscription_id)
+    if success is not None:
+        query = query.filter(DeliveryLog.success == success)
+    if cursor:
+        timestamp, log_id = _decode_cursor(cursor)
+        query = query.filter(or_(
+            DeliveryLog.timestamp < timestamp,
+            and_(DeliveryLog.timestamp == timestamp, DeliveryLog.id < log_id)
+        ))
+
+    rows = query.order_by(DeliveryLog.timestamp.desc(), DeliveryLog.id.desc()).limit(limit + 1).all()
+    page = rows[:limit]
+
+    return {
+        "subscription_id": subscription_id,
+        "deliveries": [
+            {
+                "webhook_id": log.webhook_id,
+                "attempt_number": log.attempt_number,
+                "timestamp": log.timestamp.isoformat(),
+                "success": log.success,
+                "status_code": log.status_code,
+                "error": log.error
+            }
+            for log in page
+        ],
+        "next_cursor": _encode_cursor(page[-1]) if len(rows) > limit else None
+    }
@@ -1,15 +1,29 @@
-from fastapi import APIRouter, BackgroundTasks, HTTPException, Request, Depends
+from fastapi import APIRouter, HTTPException, Request, Depends
 from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
 from datetime import datetime
-import requests
-import time
+import asyncio
 from typing import Optional
 import logging
 
 # Import your database models and setup
-from app.database import get_db
-from app.models import Subscription, DeliveryLog
+from app import config
+from app.database import SessionLocal, get_db, run_db
+from app.models import DeliveryLog, DeliveryStatus
+from app.services.delivery import DeliveryResult, engine as delivery_engine
+from app.services.delivery_scheduler import delivery_scheduler
+from app.services.delivery_status import apply_attempt, current_status
+from app.services.log_archive import log_archiver
+from app.services.bulk_ingest import BulkBodyTooLarge, BulkFormatError, iter_json_array, iter_ndjson
+from app.services.event_index import event_index
+from app.services.idempotency import idempotency_store
+from app.services.ids import new_webhook_id
+from app.services.ingest_queue import ingest_queue
+from app.services.log_writer import log_writer
+from app.services.payloads import delivery_headers, dumps as dumps_json, validate as validate_json
+from app.services import metrics
+from app.services.retry_scheduler import next_retry_delay, retry_scheduler
+from app.services.subscription_cache import subscription_cache
 
 router = APIRouter(prefix="/api/webhooks", tags=["webhooks"])
 
@@ -19,49 +33,55 @@ logger = logging.getLogger(__name__)
 
 async def deliver_webhook(
     subscription_id: int,
-    payload: dict,
-    db: Session,
+    payload: bytes,
     webhook_id: str,
-    attempt: int = 1,
-    max_retries: int = 5
+    attempt: int = 1
 ):
     """
-    Handles webhook delivery with retry mechanism
+    Makes one delivery attempt and hands failures to the retry scheduler.
+    payload is the raw request body and is sent exactly as received
     """
+    # Own session: this outlives the request that queued it. Only the HTTP
+    # attempt is guarded below: a failure to log the attempt or to schedule
+    # its retry propagates, so the retry scheduler, queue consumer or Celery
+    # task that called us keeps the delivery instead of acking it
+    db = SessionLocal()
     try:
-        subscription = db.query(Subscription).filter(Subscription.id == subscription_id).first()
+        subscription = await subscription_cache.get_async(db, subscription_id)
         if not subscription:
             logger.error(f"Subscription {subscription_id} not found")
             return
 
-        # Calculate backoff (10s, 30s, 1m, 5m, 15m)
-        backoff = [10, 30, 60, 300, 900][min(attempt-1, 4)]
-        
+        # Attempt delivery (non-blocking, pooled connections)
         try:
-            # Attempt delivery
-            start_time = datetime.utcnow()
-            response = requests.post(
+            result = await delivery_engine.deliver(
                 subscription.target_url,
-                json=payload,
-                timeout=10,
-                headers={
-                    "User-Agent": "WebhookDeliveryService/1.0",
-                    "X-Webhook-Attempt": str(attempt),
-                    "X-Webhook-ID": webhook_id
-                }
+                content=payload,
+                headers=delivery_headers(subscription, webhook_id, attempt, payload)
             )
-            
-            success = response.status_code // 100 == 2
-            status_code = response.status_code
-            error = None if success else response.text
-
-        except requests.exceptions.RequestException as e:
-            success = False
-            status_code = None
-            error = str(e)
-
-        # Log the attempt
-        delivery_log = DeliveryLog(
+        except Exception as e:
+            logger.error(f"Error delivering webhook {webhook_id}: {str(e)}")
+            result = DeliveryResult(success=False, status_code=None, error=f"System error: {str(e)}", elapsed=0.0)
+
+        if result.retry_after is not None:
+            # Destination's circuit is open: park the delivery until the
+            # breaker lets traffic through, without spending an attempt
+            await retry_scheduler.schedule(
+                db,
+                webhook_id=webhook_id,
+                subscription_id=subscription_id,
+                payload=payload,
+                attempt=attempt,
+                delay=result.retry_after
+            )
+            return
+
+        success = result.success
+        status_code = result.status_code
+        error = result.error
+
+        # Log the attempt (group-committed with other in-flight deliveries)
+        delivery_log = dict(
             subscription_id=subscription_id,
             webhook_id=webhook_id,
             target_url=subscription.target_url,
@@ -71,113 +91,325 @@ async def deliver_webhook(
             error=error,
             timestamp=datetime.utcnow()
         )
-        db.add(delivery_log)
-        db.commit()
-
-        # Retry logic
-        if not success and attempt < max_retries:
-            logger.info(f"Retrying webhook {webhook_id} in {backoff}s (attempt {attempt+1}/{max_retries})")
-            time.sleep(backoff)
-            await deliver_webhook(
-                subscription_id=subscription_id,
-                payload=payload,
-                db=db,
-                webhook_id=webhook_id,
-                attempt=attempt+1,
-                max_retries=max_retries
-            )
+        await log_writer.write(delivery_log)
 
-    except Exception as e:
-        logger.error(f"Error processing webhook {webhook_id}: {str(e)}")
-        # Log final failure if we couldn't even record it
-        if 'delivery_log' not in locals():
-            db.rollback()
-            delivery_log = DeliveryLog(
-                subscription_id=subscription_id,
-                webhook_id=webhook_id,
-                target_url="unknown",
-                attempt_number=attempt,
-                success=False,
-                status_code=None,
-                error=f"System error: {str(e)}",
-                timestamp=datetime.utcnow()
-            )
-            db.add(delivery_log)
-            db.commit()
+        # Retry logic (per-subscription backoff policy with jitter)
+        if not success:
+            delay = next_retry_delay(subscription, attempt)
+            if delay is not None:
+                logger.info(f"Retrying webhook {webhook_id} in {delay:.0f}s (attempt {attempt+1}/{subscription.max_retries})")
+                await retry_scheduler.schedule(
+                    db,
+                    webhook_id=webhook_id,
+                    subscription_id=subscription_id,
+                    payload=payload,
+                    attempt=attempt+1,
+                    delay=delay
+                )
+    finally:
+        db.close()
+
+REPLAYED_HEADERS = {"Idempotent-Replayed": "true"}
+
+def idempotency_scope(request: Request, scope: str) -> Optional[str]:
+    """
+    Dedup key for the request's Idempotency-Key header, namespaced by route
+    so one key sent to two endpoints doesn't collide
+    """
+    key = request.headers.get("idempotency-key")
+    if key is None:
+        return None
+    if not key or len(key) > config.IDEMPOTENCY_KEY_MAX_LENGTH:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Idempotency-Key must be 1-{config.IDEMPOTENCY_KEY_MAX_LENGTH} characters"
+        )
+    return f"{scope}:{key}"
+
+async def enqueue_deliveries(payload: bytes, deliveries: list):
+    """
+    Hands deliveries to the configured backend (DELIVERY_BACKEND)
+    """
+    await enqueue_batch([(payload, deliveries)])
+
+async def enqueue_batch(batch: list):
+    """
+    Hands a batch of (payload, deliveries) pairs to the configured backend
+    in one go: one group commit for the queue, straight into the
+    per-subscription queues of the fair scheduler otherwise
+    """
+    batch = [(payload, deliveries) for payload, deliveries in batch if deliveries]
+    if not batch:
+        return
+    count = sum(len(deliveries) for _, deliveries in batch)
+    if config.DELIVERY_BACKEND == "queue":
+        # Returns once the entries are fsynced, so the 202 means they are durable
+        try:
+            await ingest_queue.enqueue_many([
+                ([(d["subscription_id"], d["webhook_id"]) for d in deliveries], payload)
+                for payload, deliveries in batch
+            ])
+        except OSError as e:
+            logger.error(f"Failed to enqueue {count} deliveries: {str(e)}")
+            raise HTTPException(status_code=503, detail="Delivery queue unavailable")
+    elif config.DELIVERY_BACKEND == "celery":
+        # Imported lazily: the worker module sets up its own broker connection
+        from app.workers.celery_worker import deliver_webhook as deliver_webhook_task
+        for payload, deliveries in batch:
+            # Sent as text: the broker serializes to JSON anyway
+            body = payload.decode()
+            for d in deliveries:
+                deliver_webhook_task.delay(d["subscription_id"], body, d["webhook_id"])
+    else:
+        # Fan-out deliveries share one body rather than a per-subscriber copy
+        for payload, deliveries in batch:
+            for d in deliveries:
+                await delivery_scheduler.enqueue(d["subscription_id"], payload, d["webhook_id"])
 
 @router.post("/ingest/{subscription_id}")
 async def ingest_webhook(
     subscription_id: int,
     request: Request,
-    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db)
 ):
     """
     Endpoint to receive webhooks and initiate delivery
     """
     # Verify subscription exists
-    subscription = db.query(Subscription).filter(Subscription.id == subscription_id).first()
+    subscription = await subscription_cache.get_async(db, subscription_id)
     if not subscription:
         raise HTTPException(status_code=404, detail="Subscription not found")
 
-    # Get payload
-    try:
-        payload = await request.json()
-    except Exception as e:
+    # Get payload (validated once; the original bytes are what gets delivered)
+    payload = await request.body()
+    metrics.PAYLOAD_SIZE.observe(len(payload), "ingest")
+    if not validate_json(payload):
         raise HTTPException(status_code=400, detail="Invalid JSON payload")
 
-    # Generate unique ID for this webhook
-    webhook_id = f"wh_{int(time.time())}_{subscription_id}"
+    # A producer retry with the same Idempotency-Key gets the original response
+    idempotency_key = idempotency_scope(request, f"ingest:{subscription_id}")
+    replay = await idempotency_store.begin(db, idempotency_key)
+    if replay is not None:
+        return JSONResponse(content=replay, status_code=202, headers=REPLAYED_HEADERS)
 
-    # Add to background tasks
-    background_tasks.add_task(
-        deliver_webhook,
-        subscription_id=subscription_id,
-        payload=payload,
-        db=db,
-        webhook_id=webhook_id
-    )
+    # Generate unique ID for this webhook (time-ordered, no cross-process coordination)
+    webhook_id = new_webhook_id()
+
+    try:
+        await enqueue_deliveries(
+            payload,
+            [{"subscription_id": subscription_id, "webhook_id": webhook_id}]
+        )
+    except BaseException:
+        idempotency_store.abort(idempotency_key)
+        raise
 
     logger.info(f"Queued webhook {webhook_id} for delivery to {subscription.target_url}")
 
-    return JSONResponse(
-        content={
-            "status": "queued",
-            "webhook_id": webhook_id,
-            "subscription_id": subscription_id
-        },
-        status_code=202
-    )
+    content = {
+        "status": "queued",
+        "webhook_id": webhook_id,
+        "subscription_id": subscription_id
+    }
+    idempotency_store.finish(idempotency_key, content)
+    return JSONResponse(content=content, status_code=202)
+
+def _bulk_item_error(item) -> Optional[str]:
+    if not isinstance(item, dict):
+        return "Item must be an object"
+    subscription_id = item.get("subscription_id")
+    if not isinstance(subscription_id, int) or isinstance(subscription_id, bool):
+        return "subscription_id must be an integer"
+    if "payload" not in item:
+        return "payload is required"
+    return None
+
+@router.post("/bulk")
+async def ingest_bulk(
+    request: Request,
+    db: Session = Depends(get_db)
+):
+    """
+    Endpoint to receive many webhooks in one request, as NDJSON
+    (application/x-ndjson) or a JSON array of
+    {"subscription_id": ..., "payload": ...} items. Returns a webhook id or
+    an error for every item
+    """
+    declared = request.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > config.BULK_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"Request body exceeds {config.BULK_MAX_BYTES} bytes")
+
+    content_type = request.headers.get("content-type", "")
+    parse = iter_ndjson if "ndjson" in content_type or "jsonlines" in content_type else iter_json_array
+
+    # Parsed as the body streams in; only the re-encoded payloads are kept
+    results = []
+    items = []
+    try:
+        async for index, item, error in parse(request.stream(), config.BULK_MAX_BYTES):
+            if index >= config.BULK_MAX_ITEMS:
+                raise HTTPException(status_code=413, detail=f"More than {config.BULK_MAX_ITEMS} items")
+            error = error or _bulk_item_error(item)
+            if error:
+                results.append({"index": index, "error": error})
+                continue
+            payload = dumps_json(item["payload"])
+            metrics.PAYLOAD_SIZE.observe(len(payload), "bulk")
+            items.append((index, item["subscription_id"], payload))
+    except BulkBodyTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except BulkFormatError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # One lookup for every referenced subscription
+    subscriptions = await subscription_cache.get_many_async(db, {subscription_id for _, subscription_id, _ in items})
+
+    idempotency_key = idempotency_scope(request, "bulk")
+    replay = await idempotency_store.begin(db, idempotency_key)
+    if replay is not None:
+        return JSONResponse(content=replay, status_code=202, headers=REPLAYED_HEADERS)
+
+    batch = []
+    for index, subscription_id, payload in items:
+        if subscription_id not in subscriptions:
+            results.append({"index": index, "subscription_id": subscription_id, "error": "Subscription not found"})
+            continue
+        webhook_id = new_webhook_id()
+        batch.append((payload, [{"subscription_id": subscription_id, "webhook_id": webhook_id}]))
+        results.append({"index": index, "subscription_id": subscription_id, "webhook_id": webhook_id})
+
+    # Enqueue the whole batch at once
+    try:
+        await enqueue_batch(batch)
+    except BaseException:
+        idempotency_store.abort(idempotency_key)
+        raise
+
+    logger.info(f"Queued bulk request: {len(batch)} accepted, {len(results) - len(batch)} rejected")
+
+    content = {
+        "status": "queued",
+        "accepted": len(batch),
+        "rejected": len(results) - len(batch),
+        "items": sorted(results, key=lambda r: r["index"])
+    }
+    idempotency_store.finish(idempotency_key, content)
+    return JSONResponse(content=content, status_code=202)
+
+@router.post("/events/{event_type}")
+async def ingest_event(
+    event_type: str,
+    request: Request,
+    db: Session = Depends(get_db)
+):
+    """
+    Endpoint to receive an event once and deliver it to every subscription
+    for its event type
+    """
+    # Get payload (validated once; the original bytes are what gets delivered)
+    payload = await request.body()
+    metrics.PAYLOAD_SIZE.observe(len(payload), "events")
+    if not validate_json(payload):
+        raise HTTPException(status_code=400, detail="Invalid JSON payload")
+
+    # Resolve subscribers from the in-memory index, then warm the cache for
+    # all of them in one query so the deliveries don't each hit the DB
+    subscriptions = await subscription_cache.get_many_async(db, event_index.subscribers(event_type))
+
+    idempotency_key = idempotency_scope(request, f"events:{event_type}")
+    replay = await idempotency_store.begin(db, idempotency_key)
+    if replay is not None:
+        return JSONResponse(content=replay, status_code=202, headers=REPLAYED_HEADERS)
+
+    deliveries = [
+        {"subscription_id": subscription_id, "webhook_id": new_webhook_id()}
+        for subscription_id in subscriptions
+    ]
+
+    # Enqueue the whole batch at once
+    try:
+        await enqueue_deliveries(payload, deliveries)
+    except BaseException:
+        idempotency_store.abort(idempotency_key)
+        raise
+
+    logger.info(f"Queued event {event_type} for delivery to {len(deliveries)} subscriptions")
+
+    content = {
+        "status": "queued",
+        "event_type": event_type,
+        "deliveries": deliveries
+    }
+    idempotency_store.finish(idempotency_key, content)
+    return JSONResponse(content=content, status_code=202)
 
 @router.get("/status/{webhook_id}")
 async def get_webhook_status(
     webhook_id: str,
+    include_attempts: bool = False,
     db: Session = Depends(get_db)
 ):
     """
-    Check delivery status of a webhook
+    Check delivery status of a webhook (a primary-key read of its summary;
+    pass include_attempts=true for the full attempt history)
     """
-    attempts = db.query(DeliveryLog).filter(
-        DeliveryLog.webhook_id == webhook_id
-    ).order_by(DeliveryLog.attempt_number).all()
-
-    if not attempts:
-        raise HTTPException(status_code=404, detail="Webhook not found")
+    # Read-your-writes: fold in attempts still buffered in the log writer
+    pending = log_writer.pending(webhook_id)
+    status = await run_db(current_status, db, webhook_id, pending)
+    archived = None
+    if status is None:
+        # Miss: the webhook may only exist in the compressed archive
+        archived = await asyncio.get_running_loop().run_in_executor(
+            None, log_archiver.find_attempts, webhook_id
+        )
+        if not archived:
+            raise HTTPException(status_code=404, detail="Webhook not found")
+        status = DeliveryStatus(webhook_id=webhook_id, attempts=0, delivered=False)
+        for record in archived:
+            apply_attempt(status, record)
 
-    return {
+    response = {
         "webhook_id": webhook_id,
-        "subscription_id": attempts[0].subscription_id,
-        "target_url": attempts[0].target_url,
-        "attempts": [
+        "subscription_id": status.subscription_id,
+        "target_url": status.target_url,
+        "attempt_count": status.attempts,
+        "last_attempt_at": status.last_attempt_at.isoformat(),
+        "last_status_code": status.last_status_code,
+        "last_error": status.last_error,
+        "delivered": status.delivered,
+        "final_status": status.final_status
+    }
+
+    if include_attempts:
+        rows = await run_db(
+            lambda: db.query(DeliveryLog).filter(
+                DeliveryLog.webhook_id == webhook_id
+            ).order_by(DeliveryLog.attempt_number).all()
+        )
+
+        by_attempt = {r["attempt_number"]: r for r in pending}
+        for row in rows:
+            by_attempt[row.attempt_number] = {
+                column: getattr(row, column)
+                for column in ("attempt_number", "timestamp", "success", "status_code", "error")
+            }
+        if archived is None and len(by_attempt) < status.attempts:
+            # Older attempts have been moved out by retention
+            archived = await asyncio.get_running_loop().run_in_executor(
+                None, log_archiver.find_attempts, webhook_id, status.last_attempt_at
+            )
+        for record in archived or ():
+            by_attempt.setdefault(record["attempt_number"], record)
+
+        response["attempts"] = [
             {
-                "attempt_number": a.attempt_number,
-                "timestamp": a.timestamp.isoformat(),
-                "success": a.success,
-                "status_code": a.status_code,
-                "error": a.error
+                "attempt_number": a["attempt_number"],
+                "timestamp": a["timestamp"].isoformat(),
+                "success": a["success"],
+                "status_code": a["status_code"],
+                "error": a["error"]
             }
-            for a in attempts
-        ],
-        "delivered": any(a.success for a in attempts),
-        "final_status": "delivered" if attempts[-1].success else "failed"
-    }
+            for a in (by_attempt[n] for n in sorted(by_attempt))
+        ]
+
+    return response
@@ -1,8 +1,45 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+
+from . import config
 
 class SubscriptionCreate(BaseModel):
     target_url: str
     secret: str = None
+    event_type: str = None
+    max_retries: int = config.DEFAULT_MAX_RETRIES
+    retry_backoff: str = config.DEFAULT_RETRY_BACKOFF
+    retry_jitter: float = config.DEFAULT_RETRY_JITTER
+    delivery_weight: float = Field(1.0, gt=0)
+    rate_limit: float = Field(None, gt=0)
+    rate_limit_burst: int = Field(None, ge=1)
+    ordered_delivery: bool = False
+
+class SubscriptionResponse(BaseModel):
+    id: int
+    target_url: str
+    event_type: str = None
+    max_retries: int
+    retry_backoff: str
+    retry_jitter: float
+    delivery_weight: float
+    rate_limit: float = None
+    rate_limit_burst: int = None
+    ordered_delivery: bool
+
+    class Config:
+        orm_mode = True
 
 class WebhookCreate(BaseModel):
     payload: dict
+
+class SubscriptionUpdate(BaseModel):
+    target_url: str = None
+    secret: str = None
+    event_type: str = None
+    max_retries: int = None
+    retry_backoff: str = None
+    retry_jitter: float = None
+    delivery_weight: float = Field(None, gt=0)
+    rate_limit: float = Field(None, gt=0)
+    rate_limit_burst: int = Field(None, ge=1)
+    ordered_delivery: bool = None
@@ -0,0 +1 @@
+# app/services/__init__.py
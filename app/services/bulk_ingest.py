@@ -0,0 +1,148 @@
+"""
+Incremental parsing of bulk ingest bodies, as NDJSON (one item per line)
+or a single JSON array of items. Both read the request stream chunk by
+chunk and stop as soon as max_bytes is exceeded, so an oversized body is
+never held in memory.
+"""
+import codecs
+import json
+from typing import AsyncIterator, Optional, Tuple
+
+from app.services import payloads
+
+BulkItem = Tuple[int, object, Optional[str]]
+
+# Characters a number can continue with after a chunk boundary
+_NUMBER_CHARS = frozenset("0123456789+-.eE")
+
+
+class BulkBodyTooLarge(Exception):
+    pass
+
+
+class BulkFormatError(ValueError):
+    """
+    The body as a whole can't be parsed any further (array framing broke).
+    """
+
+
+async def _limited(chunks: AsyncIterator[bytes], max_bytes: int) -> AsyncIterator[bytes]:
+    received = 0
+    async for chunk in chunks:
+        received += len(chunk)
+        if received > max_bytes:
+            raise BulkBodyTooLarge(f"Request body exceeds {max_bytes} bytes")
+        if chunk:
+            yield chunk
+
+
+async def iter_ndjson(chunks: AsyncIterator[bytes], max_bytes: int) -> AsyncIterator[BulkItem]:
+    """
+    Yield (index, value, error) per non-empty line. A bad line only fails
+    its own item.
+    """
+    buffer = bytearray()
+    index = 0
+
+    def parse(line: bytes) -> BulkItem:
+        try:
+            return index, payloads.loads(line), None
+        except ValueError:
+            return index, None, "Invalid JSON"
+
+    async for chunk in _limited(chunks, max_bytes):
+        start = len(buffer)
+        buffer.extend(chunk)
+        newline = buffer.find(b"\n", start)
+        if newline < 0:
+            continue
+        lines = buffer[:buffer.rfind(b"\n")].split(b"\n")
+        del buffer[:buffer.rfind(b"\n") + 1]
+        for line in lines:
+            if line.strip():
+                yield parse(bytes(line))
+                index += 1
+    if buffer.strip():
+        yield parse(bytes(buffer))
+
+
+async def iter_json_array(chunks: AsyncIterator[bytes], max_bytes: int) -> AsyncIterator[BulkItem]:
+    """
+    Yield (index, value, None) per element of a top-level JSON array,
+    decoding each element as soon as it is complete. Malformed framing
+    raises BulkFormatError, since later elements can't be located.
+    """
+    decoder = json.JSONDecoder()
+    text = codecs.getincrementaldecoder("utf-8")()
+    stream = _limited(chunks, max_bytes).__aiter__()
+    buffer, pos, eof = "", 0, False
+    state = "open"  # open -> value | value_or_close -> separator -> ...
+    index = 0
+
+    async def more(minimum: int = 1) -> bool:
+        # Read until at least `minimum` unparsed characters are buffered;
+        # False at end of stream
+        nonlocal buffer, pos, eof
+        buffer = buffer[pos:]
+        pos = 0
+        while not eof and len(buffer) < minimum:
+            try:
+                buffer += text.decode(await stream.__anext__())
+            except StopAsyncIteration:
+                buffer += text.decode(b"", final=True)
+                eof = True
+            except UnicodeDecodeError:
+                raise BulkFormatError("Body is not valid UTF-8")
+        return len(buffer) > 0
+
+    while True:
+        while pos < len(buffer) and buffer[pos] in " \t\r\n":
+            pos += 1
+        if pos == len(buffer):
+            if not await more():
+                if state == "done":
+                    return
+                raise BulkFormatError("Unexpected end of JSON array")
+            continue
+
+        char = buffer[pos]
+        if state == "done":
+            raise BulkFormatError("Unexpected data after JSON array")
+        if state == "open":
+            if char != "[":
+                raise BulkFormatError("Expected a JSON array or NDJSON body")
+            pos += 1
+            state = "value_or_close"
+        elif state == "separator" or (state == "value_or_close" and char == "]"):
+            if char == "]":
+                pos += 1
+                state = "done"
+            elif char == ",":
+                pos += 1
+                state = "value"
+            else:
+                raise BulkFormatError(f"Expected ',' or ']' after item {index - 1}")
+        else:
+            try:
+                value, end = decoder.raw_decode(buffer, pos)
+                # A number can be cut anywhere ("1." + "5", "1e" + "3"), and
+                # raw_decode accepts the part before the cut: it is only
+                # complete once something other than number text follows
+                tail = end
+                if not isinstance(value, (dict, list, str)):
+                    while tail < len(buffer) and buffer[tail] in _NUMBER_CHARS:
+                        tail += 1
+                complete = tail < len(buffer) or eof
+            except json.JSONDecodeError:
+                if eof:
+                    raise BulkFormatError(f"Invalid JSON in item {index}")
+                complete = False
+            if not complete:
+                # Incomplete element: wait for twice as much text before
+                # retrying, so a large element is re-scanned O(log n) times
+                await more(2 * (len(buffer) - pos))
+                continue
+            yield index, value, None
+            index += 1
+            pos = end
+            state = "separator"
@@ -0,0 +1,208 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from typing import NamedTuple, Optional
+
+import httpx
+
+from app import config
+from app.services import metrics
+from app.services.delivery_status import truncate_error
+from app.services.host_health import HostHealth
+
+logger = logging.getLogger(__name__)
+
+USER_AGENT = "WebhookDeliveryService/1.0"
+
+
+class DeliveryResult(NamedTuple):
+    success: bool
+    status_code: Optional[int]
+    error: Optional[str]
+    elapsed: float
+    # Set when the destination's circuit breaker is open and nothing was
+    # sent: park the delivery for this many seconds without using an attempt
+    retry_after: Optional[float] = None
+
+
+class DeliveryEngine:
+    """
+    Async HTTP delivery with keep-alive connection pooling.
+
+    A single engine is bound to the event loop it is first used on. Concurrency
+    is capped globally and per destination host so one slow subscriber cannot
+    take every connection; the per-host cap adapts to the host's latency and
+    errors, and a host that keeps failing is cut off by its circuit breaker.
+    """
+
+    def __init__(
+        self,
+        max_connections: int = config.DELIVERY_MAX_CONNECTIONS,
+        max_keepalive: int = config.DELIVERY_MAX_KEEPALIVE,
+        connect_timeout: float = config.DELIVERY_CONNECT_TIMEOUT,
+        read_timeout: float = config.DELIVERY_READ_TIMEOUT,
+        keepalive_expiry: float = config.DELIVERY_KEEPALIVE_EXPIRY,
+    ):
+        self.max_connections = max_connections
+        self._limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive_expiry,
+        )
+        # Pool waits are bounded by our own semaphores, so no pool timeout
+        self._timeout = httpx.Timeout(
+            connect=connect_timeout, read=read_timeout, write=read_timeout, pool=None
+        )
+        self._client: Optional[httpx.AsyncClient] = None
+        self._global_slots: Optional[asyncio.Semaphore] = None
+        self.hosts = HostHealth()
+        self.in_flight = 0
+
+    def _ensure_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                limits=self._limits,
+                timeout=self._timeout,
+                headers={"User-Agent": USER_AGENT},
+            )
+            self._global_slots = asyncio.Semaphore(self.max_connections)
+        return self._client
+
+    @staticmethod
+    def host_key(url: httpx.URL) -> str:
+        return f"{url.scheme}://{url.host}:{url.port or ''}"
+
+    async def deliver(
+        self,
+        url: str,
+        *,
+        json=None,
+        content: Optional[bytes] = None,
+        headers: Optional[dict] = None,
+    ) -> DeliveryResult:
+        """
+        POST a payload to url and report the outcome. Never raises for
+        transport errors; they are returned as an unsuccessful result. If
+        the host's breaker is open nothing is sent and retry_after is set.
+        """
+        client = self._ensure_client()
+        start = time.perf_counter()
+        try:
+            target = httpx.URL(url)
+        except httpx.InvalidURL as e:
+            return self._observe("invalid", DeliveryResult(False, None, str(e), time.perf_counter() - start))
+
+        host = self.hosts.get(self.host_key(target))
+        retry_after = host.admit()
+        if retry_after is not None:
+            metrics.DELIVERY_PARKED.inc(target.host)
+            return DeliveryResult(
+                success=False,
+                status_code=None,
+                error=f"Circuit open for {host.key}",
+                elapsed=0.0,
+                retry_after=retry_after,
+            )
+
+        # Host slot first, so deliveries queued behind a slow host don't
+        # hold global slots other hosts could use
+        await host.limiter.acquire()
+        self.in_flight += 1
+        sent = time.perf_counter()
+        try:
+            async with self._global_slots:
+                sent = time.perf_counter()
+                response = await client.post(
+                    target, json=json, content=content, headers=headers
+                )
+            success = response.status_code // 100 == 2
+            result = DeliveryResult(
+                success=success,
+                status_code=response.status_code,
+                error=None if success else response.text,
+                elapsed=time.perf_counter() - start,
+            )
+        except (httpx.HTTPError, httpx.InvalidURL) as e:
+            result = DeliveryResult(
+                success=False,
+                status_code=None,
+                error=str(e) or e.__class__.__name__,
+                elapsed=time.perf_counter() - start,
+            )
+        finally:
+            self.in_flight -= 1
+            host.limiter.release()
+
+        # Health is judged on the request itself, not time spent queued. The
+        # error is kept as the breaker's last_error (shown by the destinations
+        # API): cap it like the delivery log does rather than hold a whole body
+        host.record(result.status_code, time.perf_counter() - sent, truncate_error(result.error))
+        return self._observe(target.host, result)
+
+    @staticmethod
+    def _observe(host: str, result: DeliveryResult) -> DeliveryResult:
+        metrics.DELIVERY_LATENCY.observe(result.elapsed, host)
+        metrics.DELIVERY_ATTEMPTS.inc(
+            "success" if result.success else "failure",
+            f"{result.status_code // 100}xx" if result.status_code else "error",
+        )
+        return result
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        self.hosts.clear()
+
+
+# Engine used by the API process (bound to uvicorn's event loop)
+engine = DeliveryEngine()
+
+metrics.CallbackMetric(
+    "webhook_destination_circuit_open", "1 while a destination's circuit breaker is not closed",
+    lambda: {(h["host"],): int(h["state"] != "closed") for h in engine.hosts.snapshot()},
+    labelnames=["host"],
+)
+metrics.CallbackMetric(
+    "webhook_destination_concurrency_limit", "Adaptive concurrency limit per destination",
+    lambda: {(h["host"],): h["concurrency_limit"] for h in engine.hosts.snapshot()},
+    labelnames=["host"],
+)
+metrics.CallbackMetric(
+    "webhook_deliveries_in_flight", "Delivery attempts currently in progress",
+    lambda: engine.in_flight + (_sync_engine.in_flight if _sync_engine is not None else 0),
+)
+
+
+# Synchronous callers (Celery workers) share one engine running on a
+# dedicated background loop per process, so keep-alive pools survive between
+# tasks instead of being rebuilt for each asyncio.run().
+_sync_lock = threading.Lock()
+_sync_loop: Optional[asyncio.AbstractEventLoop] = None
+_sync_engine: Optional[DeliveryEngine] = None
+_sync_pid: Optional[int] = None
+
+
+def _get_sync_loop() -> asyncio.AbstractEventLoop:
+    global _sync_loop, _sync_engine, _sync_pid
+    with _sync_lock:
+        # Threads do not survive fork, so prefork children build their own
+        if _sync_loop is None or _sync_pid != os.getpid():
+            _sync_loop = asyncio.new_event_loop()
+            _sync_engine = DeliveryEngine()
+            _sync_pid = os.getpid()
+            threading.Thread(
+                target=_sync_loop.run_forever, name="delivery-loop", daemon=True
+            ).start()
+        return _sync_loop
+
+
+def deliver_sync(url: str, **kwargs) -> DeliveryResult:
+    """
+    Blocking wrapper around DeliveryEngine.deliver for non-async callers.
+    """
+    loop = _get_sync_loop()
+    future = asyncio.run_coroutine_threadsafe(_sync_engine.deliver(url, **kwargs), loop)
+    return future.result()
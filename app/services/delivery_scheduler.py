@@ -0,0 +1,358 @@
+"""
+Fair in-process delivery scheduling.
+
+Deliveries wait in one FIFO per subscription and are dispatched by deficit
+round-robin over the subscriptions that have work: each turn a
+subscription may send delivery_weight / (smallest weight in the ring)
+deliveries, so a burst from one tenant queues behind its own earlier
+events instead of everyone else's. Normalising by the smallest weight
+keeps every quantum at least one delivery, so fractional weights never
+cost extra passes over the ring.
+On top of that a subscription can have a token-bucket rate limit and ask
+for ordered delivery (one delivery in flight at a time, in arrival order;
+a failed attempt's retries still run later, outside the order).
+
+Enqueue and dequeue are O(1): a subscription that is throttled or waiting
+for its in-flight ordered delivery leaves the round-robin ring and is put
+back by a timer or by the completion, so blocked tenants are never
+scanned. At most `concurrency` deliveries run at once; the default matches
+the outbound connection limit so the wait happens here, where it is fair,
+rather than in the HTTP client's FIFO.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, Optional, Set, Tuple
+
+from app import config
+from app.database import SessionLocal
+from app.services import metrics
+from app.services.subscription_cache import CachedSubscription, subscription_cache
+
+logger = logging.getLogger(__name__)
+
+# Floor for delivery_weight, bounding how large other quanta can get
+MIN_WEIGHT = 0.01
+
+# (enqueued at, payload, webhook_id, attempt, completion future or None)
+QueuedDelivery = Tuple[float, bytes, str, int, Optional[asyncio.Future]]
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def take(self) -> float:
+        """
+        Take a token. Returns 0 on success, otherwise the seconds until one
+        is available (nothing is taken).
+        """
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class _Tenant:
+    __slots__ = (
+        "subscription_id", "queue", "deficit", "in_flight", "active", "throttled",
+        "weight", "ring_weight", "ordered", "bucket",
+    )
+
+    def __init__(self, subscription: CachedSubscription):
+        self.subscription_id = subscription.id
+        self.queue: Deque[QueuedDelivery] = deque()
+        self.deficit = 0.0
+        self.in_flight = 0
+        self.active = False  # in the round-robin ring
+        self.ring_weight = 0.0  # weight it was counted with when it joined the ring
+        self.throttled = False  # out of the ring until its rate limit allows
+        self.apply(subscription)
+
+    def apply(self, subscription: CachedSubscription):
+        self.weight = max(subscription.delivery_weight or 1.0, MIN_WEIGHT)
+        self.ordered = bool(subscription.ordered_delivery)
+        rate = subscription.rate_limit
+        self.bucket = TokenBucket(rate, subscription.rate_limit_burst or max(1, int(rate))) if rate else None
+
+    @property
+    def blocked(self) -> bool:
+        return self.throttled or (self.ordered and self.in_flight > 0)
+
+
+class DeliveryScheduler:
+    def __init__(self, concurrency: int = config.DELIVERY_SCHEDULER_CONCURRENCY):
+        self.concurrency = concurrency
+        self.in_flight = 0
+        self._tenants: Dict[int, _Tenant] = {}
+        self._ring: Deque[_Tenant] = deque()
+        # Weights of the tenants in the ring (weight -> count), for the
+        # smallest one that quanta are normalised by
+        self._ring_weights: Dict[float, int] = {}
+        self._min_weight = 1.0
+        self._stale: Set[int] = set()
+        self._loading: Dict[int, asyncio.Future] = {}
+        self._queued = 0
+        self._dispatched: Dict[int, int] = {}
+        self._waited: Dict[int, float] = {}
+        self._dispatch: Optional[Callable] = None
+        self._ready: Optional[asyncio.Event] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._runner: Optional[asyncio.Task] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    def start(self, dispatch: Callable):
+        """
+        dispatch(subscription_id=, payload=, webhook_id=, attempt=) makes
+        one delivery attempt (routers.webhooks.deliver_webhook).
+        """
+        if self._runner is None:
+            self._dispatch = dispatch
+            self._ready = asyncio.Event()
+            self._slots = asyncio.Semaphore(self.concurrency)
+            self._runner = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        # Queued deliveries are dropped, as BackgroundTasks were; durable
+        # backends redeliver theirs after a restart
+        tasks = list(self._tasks)
+        if self._runner is not None:
+            tasks.append(self._runner)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for tenant in self._tenants.values():
+            for item in tenant.queue:
+                if item[4] is not None:
+                    item[4].cancel()
+        self._tenants.clear()
+        self._ring.clear()
+        self._ring_weights.clear()
+        self._min_weight = 1.0
+        self._queued = 0
+        self._runner = None
+
+    async def enqueue(self, subscription_id: int, payload: bytes, webhook_id: str, attempt: int = 1):
+        """
+        Queue a delivery and return without waiting for it.
+        """
+        await self._put(subscription_id, payload, webhook_id, attempt, None)
+
+    async def submit(
+        self, subscription_id: int, payload: bytes, webhook_id: str, attempt: int = 1
+    ) -> Optional[asyncio.Future]:
+        """
+        Queue a delivery and return a future that resolves (or raises) once
+        its attempt has run, or None if the subscription doesn't exist. For
+        callers that must not let go of the delivery before then but have
+        other work while it waits its turn (queue consumer).
+        """
+        waiter = asyncio.get_running_loop().create_future()
+        if await self._put(subscription_id, payload, webhook_id, attempt, waiter):
+            return waiter
+        return None
+
+    async def deliver(self, subscription_id: int, payload: bytes, webhook_id: str, attempt: int = 1):
+        """
+        Queue a delivery and wait until its attempt has run (retries).
+        """
+        waiter = await self.submit(subscription_id, payload, webhook_id, attempt)
+        if waiter is not None:
+            await waiter
+
+    def refresh(self, subscription_id: int):
+        """
+        Re-read the subscription's scheduling settings on its next delivery.
+        Wired to subscription cache invalidations.
+        """
+        self._stale.add(subscription_id)
+
+    async def _put(self, subscription_id, payload, webhook_id, attempt, waiter) -> bool:
+        tenant = self._tenants.get(subscription_id)
+        if tenant is None or subscription_id in self._stale or subscription_id in self._loading:
+            tenant = await self._load(subscription_id)
+            if tenant is None:
+                logger.error(f"Subscription {subscription_id} not found")
+                return False
+
+        tenant.queue.append((time.monotonic(), payload, webhook_id, attempt, waiter))
+        self._queued += 1
+        self._activate(tenant)
+        return True
+
+    async def _load(self, subscription_id: int) -> Optional[_Tenant]:
+        """
+        The tenant with current settings. Deliveries arriving while a lookup
+        is in progress wait for it, so they are still queued in arrival order.
+        """
+        while subscription_id in self._loading:
+            await asyncio.shield(self._loading[subscription_id])
+            tenant = self._tenants.get(subscription_id)
+            if tenant is not None and subscription_id not in self._stale:
+                return tenant
+
+        loading = self._loading[subscription_id] = asyncio.get_running_loop().create_future()
+        self._stale.discard(subscription_id)
+        db = SessionLocal()
+        try:
+            subscription = await subscription_cache.get_async(db, subscription_id)
+        finally:
+            db.close()
+            del self._loading[subscription_id]
+            loading.set_result(None)
+        if subscription is None:
+            return None
+        tenant = self._tenants.get(subscription_id)
+        if tenant is None:
+            tenant = self._tenants[subscription_id] = _Tenant(subscription)
+        else:
+            tenant.apply(subscription)
+        return tenant
+
+    def _activate(self, tenant: _Tenant):
+        if tenant.queue and not tenant.active and not tenant.blocked:
+            tenant.active = True
+            tenant.ring_weight = weight = tenant.weight
+            self._ring_weights[weight] = self._ring_weights.get(weight, 0) + 1
+            if weight < self._min_weight or len(self._ring) == 0:
+                self._min_weight = weight
+            self._ring.append(tenant)
+            if self._ready is not None:
+                self._ready.set()
+
+    def _deactivate_head(self, tenant: _Tenant):
+        self._ring.popleft()
+        tenant.active = False
+        weight = tenant.ring_weight
+        count = self._ring_weights[weight] - 1
+        if count:
+            self._ring_weights[weight] = count
+        else:
+            del self._ring_weights[weight]
+            if weight == self._min_weight:
+                # O(distinct weights), and only when the smallest one leaves
+                self._min_weight = min(self._ring_weights, default=1.0)
+
+    def _unthrottle(self, tenant: _Tenant):
+        tenant.throttled = False
+        self._activate(tenant)
+
+    def _pop(self) -> Optional[Tuple[_Tenant, QueuedDelivery]]:
+        ring = self._ring
+        while ring:
+            tenant = ring[0]
+            if tenant.blocked:
+                # Put back by _unthrottle or the in-flight delivery's completion
+                self._deactivate_head(tenant)
+                continue
+            if tenant.deficit < 1:
+                # Start of this tenant's turn: at least one delivery
+                tenant.deficit += max(1.0, tenant.weight / self._min_weight)
+            if tenant.bucket is not None:
+                wait = tenant.bucket.take()
+                if wait > 0:
+                    self._deactivate_head(tenant)
+                    tenant.throttled = True
+                    asyncio.get_running_loop().call_later(wait, self._unthrottle, tenant)
+                    continue
+
+            item = tenant.queue.popleft()
+            self._queued -= 1
+            tenant.deficit -= 1
+            tenant.in_flight += 1
+            if not tenant.queue:
+                self._deactivate_head(tenant)
+                tenant.deficit = 0.0
+            elif tenant.deficit < 1:
+                # Turn used up: to the back of the ring
+                ring.rotate(-1)
+            return tenant, item
+        return None
+
+    async def _run(self):
+        while True:
+            await self._slots.acquire()
+            picked = self._pop()
+            while picked is None:
+                self._ready.clear()
+                await self._ready.wait()
+                picked = self._pop()
+            task = asyncio.ensure_future(self._send(*picked))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, tenant: _Tenant, item: QueuedDelivery):
+        enqueued_at, payload, webhook_id, attempt, waiter = item
+        subscription_id = tenant.subscription_id
+        waited = time.monotonic() - enqueued_at
+        metrics.SCHEDULER_WAIT.observe(waited)
+        self._waited[subscription_id] = self._waited.get(subscription_id, 0.0) + waited
+        self._dispatched[subscription_id] = self._dispatched.get(subscription_id, 0) + 1
+        self.in_flight += 1
+        try:
+            await self._dispatch(
+                subscription_id=subscription_id, payload=payload, webhook_id=webhook_id, attempt=attempt
+            )
+        except Exception as e:
+            if waiter is not None and not waiter.done():
+                waiter.set_exception(e)
+            else:
+                logger.error(f"Delivery of webhook {webhook_id} failed: {str(e)}")
+        finally:
+            self.in_flight -= 1
+            self._slots.release()
+            if waiter is not None and not waiter.done():
+                waiter.set_result(None)
+            tenant.in_flight -= 1
+            self._activate(tenant)
+            self._forget_if_idle(tenant)
+
+    def _forget_if_idle(self, tenant: _Tenant):
+        # Rate-limited tenants are kept so a new burst can't reset the bucket
+        if tenant.queue or tenant.in_flight or tenant.throttled or tenant.bucket is not None:
+            return
+        if self._tenants.get(tenant.subscription_id) is tenant:
+            del self._tenants[tenant.subscription_id]
+
+    @property
+    def queued(self) -> int:
+        return self._queued
+
+    def depths(self) -> Dict[tuple, int]:
+        return {(str(t.subscription_id),): len(t.queue) for t in self._tenants.values() if t.queue}
+
+    def oldest_waits(self) -> Dict[tuple, float]:
+        now = time.monotonic()
+        return {(str(t.subscription_id),): now - t.queue[0][0] for t in self._tenants.values() if t.queue}
+
+
+delivery_scheduler = DeliveryScheduler()
+
+metrics.CallbackMetric(
+    "webhook_scheduler_queue_depth", "Deliveries waiting per subscription",
+    delivery_scheduler.depths, labelnames=["subscription"],
+)
+metrics.CallbackMetric(
+    "webhook_scheduler_oldest_wait_seconds", "Age of the oldest waiting delivery per subscription",
+    delivery_scheduler.oldest_waits, labelnames=["subscription"],
+)
+metrics.CallbackMetric(
+    "webhook_scheduler_dispatched_total", "Deliveries dispatched per subscription",
+    lambda: {(str(k),): v for k, v in delivery_scheduler._dispatched.items()},
+    labelnames=["subscription"], type="counter",
+)
+metrics.CallbackMetric(
+    "webhook_scheduler_wait_seconds_total", "Time deliveries spent queued, per subscription",
+    lambda: {(str(k),): v for k, v in delivery_scheduler._waited.items()},
+    labelnames=["subscription"], type="counter",
+)
+metrics.CallbackMetric(
+    "webhook_scheduler_in_flight", "Deliveries being attempted", lambda: delivery_scheduler.in_flight
+)
@@ -0,0 +1,75 @@
+from typing import Iterable, List, Optional
+
+from sqlalchemy.orm import Session
+
+from app import config
+from app.models import DeliveryLog, DeliveryStatus
+
+
+def truncate_error(error: Optional[str], limit: int = config.LOG_ERROR_MAX_CHARS) -> Optional[str]:
+    if error is None or len(error) <= limit:
+        return error
+    return error[:limit] + f"... [truncated {len(error) - limit} chars]"
+
+
+def apply_attempt(status: DeliveryStatus, record: dict):
+    """
+    Fold one attempt record into a webhook's status summary.
+    """
+    if status.subscription_id is None:
+        status.subscription_id = record["subscription_id"]
+        status.target_url = record["target_url"]
+    if record["success"]:
+        status.delivered = True
+    if record["attempt_number"] >= (status.attempts or 0):
+        status.attempts = record["attempt_number"]
+        status.final_status = "delivered" if record["success"] else "failed"
+        status.last_attempt_at = record["timestamp"]
+        status.last_status_code = record["status_code"]
+        status.last_error = record["error"]
+
+
+def record_attempts(db: Session, records: List[dict]):
+    """
+    Insert attempt records into delivery_logs and update the matching
+    delivery_statuses rows in the caller's transaction. Error bodies are
+    truncated to LOG_ERROR_MAX_CHARS before they are stored.
+    """
+    for record in records:
+        record["error"] = truncate_error(record["error"])
+    db.execute(DeliveryLog.__table__.insert(), records)
+
+    webhook_ids = {r["webhook_id"] for r in records}
+    statuses = {
+        s.webhook_id: s
+        for s in db.query(DeliveryStatus).filter(DeliveryStatus.webhook_id.in_(webhook_ids))
+    }
+    for record in sorted(records, key=lambda r: r["attempt_number"]):
+        status = statuses.get(record["webhook_id"])
+        if status is None:
+            status = statuses[record["webhook_id"]] = DeliveryStatus(
+                webhook_id=record["webhook_id"], attempts=0, delivered=False
+            )
+            db.add(status)
+        apply_attempt(status, record)
+
+
+def current_status(
+    db: Session, webhook_id: str, pending: Iterable[dict] = ()
+) -> Optional[DeliveryStatus]:
+    """
+    Primary-key read of a webhook's summary with not-yet-flushed attempts
+    applied on top. The result is a detached copy; changes are not saved.
+    """
+    row = db.query(DeliveryStatus).get(webhook_id)
+    pending = sorted(pending, key=lambda r: r["attempt_number"])
+    if row is None and not pending:
+        return None
+
+    status = DeliveryStatus(webhook_id=webhook_id, attempts=0, delivered=False)
+    if row is not None:
+        for column in DeliveryStatus.__table__.columns:
+            setattr(status, column.name, getattr(row, column.name))
+    for record in pending:
+        apply_attempt(status, record)
+    return status
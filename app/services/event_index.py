@@ -0,0 +1,122 @@
+import asyncio
+import logging
+import threading
+from typing import Dict, List, Optional, Set
+
+from sqlalchemy.orm import Session
+
+from app import config
+from app.database import SessionLocal, run_db
+from app.models import Subscription
+
+logger = logging.getLogger(__name__)
+
+
+class EventTypeIndex:
+    """
+    In-memory event_type -> subscription ids index used for fan-out ingest.
+
+    Loaded at startup and updated per subscription through refresh(), which
+    is wired to subscription cache invalidations. Without a cross-process
+    invalidation channel, other processes' writes are only seen by the full
+    reload every reload_interval seconds, the same bound the cache's TTL gives.
+    """
+
+    def __init__(self, reload_interval: float = config.EVENT_INDEX_RELOAD_INTERVAL):
+        self.reload_interval = reload_interval
+        self._by_type: Dict[str, Set[int]] = {}
+        self._type_of: Dict[int, str] = {}
+        # Ids set or removed while a reload is reading the table; their live
+        # entries are newer than the reload's snapshot
+        self._changed: Optional[Set[int]] = None
+        self._lock = threading.Lock()
+        self._runner: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._runner is None:
+            self._runner = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._runner is not None:
+            self._runner.cancel()
+            await asyncio.gather(self._runner, return_exceptions=True)
+            self._runner = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.reload_interval)
+            try:
+                await run_db(self.reload)
+            except Exception as e:
+                logger.error(f"Failed to reload the event type index: {str(e)}")
+
+    def reload(self):
+        db = SessionLocal()
+        try:
+            self.load(db)
+        finally:
+            db.close()
+
+    def load(self, db: Session):
+        with self._lock:
+            self._changed = set()
+        try:
+            rows = db.query(Subscription.id, Subscription.event_type).filter(
+                Subscription.event_type != None  # noqa: E711
+            ).all()
+            type_of = {subscription_id: event_type for subscription_id, event_type in rows}
+            with self._lock:
+                for subscription_id in self._changed:
+                    type_of.pop(subscription_id, None)
+                    if subscription_id in self._type_of:
+                        type_of[subscription_id] = self._type_of[subscription_id]
+                by_type: Dict[str, Set[int]] = {}
+                for subscription_id, event_type in type_of.items():
+                    by_type.setdefault(event_type, set()).add(subscription_id)
+                self._by_type = by_type
+                self._type_of = type_of
+        finally:
+            with self._lock:
+                self._changed = None
+
+    def set(self, subscription_id: int, event_type):
+        with self._lock:
+            self._discard(subscription_id)
+            if event_type is not None:
+                self._by_type.setdefault(event_type, set()).add(subscription_id)
+                self._type_of[subscription_id] = event_type
+
+    def remove(self, subscription_id: int):
+        with self._lock:
+            self._discard(subscription_id)
+
+    def _discard(self, subscription_id: int):
+        if self._changed is not None:
+            self._changed.add(subscription_id)
+        old = self._type_of.pop(subscription_id, None)
+        if old is not None:
+            ids = self._by_type.get(old)
+            ids.discard(subscription_id)
+            if not ids:
+                del self._by_type[old]
+
+    def refresh(self, subscription_id: int):
+        """
+        Re-read one subscription's event_type from the database.
+        """
+        db = SessionLocal()
+        try:
+            row = db.query(Subscription.event_type).filter(Subscription.id == subscription_id).first()
+        finally:
+            db.close()
+        if row is None:
+            self.remove(subscription_id)
+        else:
+            self.set(subscription_id, row.event_type)
+
+    def subscribers(self, event_type: str) -> List[int]:
+        with self._lock:
+            return list(self._by_type.get(event_type, ()))
+
+
+event_index = EventTypeIndex()
@@ -0,0 +1,237 @@
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional
+
+from app import config
+
+logger = logging.getLogger(__name__)
+
+
+def is_healthy_response(status_code: Optional[int]) -> bool:
+    """
+    Whether an outcome says the destination is up. 4xx other than 429 is the
+    subscriber rejecting the payload, not the host failing.
+    """
+    return status_code is not None and status_code < 500 and status_code != 429
+
+
+class CircuitBreaker:
+    """
+    closed -> open after failure_threshold consecutive failures. Once the
+    open period has passed one probe is let through (half-open); success
+    closes the breaker, failure re-opens it for twice as long, up to
+    max_open_seconds.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        failure_threshold: int = config.BREAKER_FAILURE_THRESHOLD,
+        open_seconds: float = config.BREAKER_OPEN_SECONDS,
+        max_open_seconds: float = config.BREAKER_MAX_OPEN_SECONDS,
+    ):
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.max_open_seconds = max_open_seconds
+        self.state = self.CLOSED
+        self.failures = 0
+        self.last_error: Optional[str] = None
+        self.changed_at = time.time()
+        self._open_for = open_seconds
+        self._reopen_at = 0.0
+        self._probe_started: Optional[float] = None
+
+    def admit(self) -> Optional[float]:
+        """
+        None if a request may go ahead now, otherwise the number of seconds
+        until the breaker will next let one through.
+        """
+        if self.state == self.CLOSED:
+            return None
+        now = time.monotonic()
+        if self.state == self.OPEN:
+            if now < self._reopen_at:
+                return self._reopen_at - now
+            self._transition(self.HALF_OPEN)
+        # Half-open: a single probe at a time; a probe that never reports
+        # back (cancelled) stops blocking after another open period
+        if self._probe_started is None or now - self._probe_started > self._open_for:
+            self._probe_started = now
+            return None
+        return self._open_for - (now - self._probe_started)
+
+    def record(self, healthy: bool, error: Optional[str] = None):
+        self._probe_started = None
+        if healthy:
+            self.failures = 0
+            self._open_for = self.open_seconds
+            if self.state != self.CLOSED:
+                self._transition(self.CLOSED)
+            return
+
+        self.failures += 1
+        self.last_error = error
+        if self.state == self.HALF_OPEN:
+            self._open_for = min(self._open_for * 2, self.max_open_seconds)
+            self._open()
+        elif self.state == self.CLOSED and self.failures >= self.failure_threshold:
+            self._open()
+
+    def reset(self):
+        self.failures = 0
+        self._open_for = self.open_seconds
+        self._probe_started = None
+        self._transition(self.CLOSED)
+
+    @property
+    def retry_in(self) -> float:
+        return max(0.0, self._reopen_at - time.monotonic()) if self.state == self.OPEN else 0.0
+
+    def _open(self):
+        self._reopen_at = time.monotonic() + self._open_for
+        self._transition(self.OPEN)
+
+    def _transition(self, state: str):
+        self.state = state
+        self.changed_at = time.time()
+
+
+class AdaptiveLimiter:
+    """
+    Per-host concurrency limit adjusted AIMD-style: +1/limit for each
+    success while the limit is actually in use, x decrease_ratio (at most
+    once per latency_target) on a failure or a response slower than
+    latency_target. Bound to the event loop of its first waiter.
+    """
+
+    def __init__(
+        self,
+        initial: int = config.DELIVERY_PER_HOST_LIMIT,
+        min_limit: int = config.DELIVERY_PER_HOST_MIN_LIMIT,
+        max_limit: int = config.DELIVERY_PER_HOST_MAX_LIMIT,
+        latency_target: float = config.DELIVERY_LATENCY_TARGET,
+        decrease_ratio: float = config.DELIVERY_LIMIT_DECREASE,
+    ):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target = latency_target
+        self.decrease_ratio = decrease_ratio
+        self.limit = float(min(max(initial, min_limit), max_limit))
+        self.in_flight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._saturated = False
+        self._last_decrease = 0.0
+
+    @property
+    def waiting(self) -> int:
+        return sum(1 for w in self._waiters if not w.done())
+
+    async def acquire(self):
+        if self.in_flight < int(self.limit) and not self._waiters:
+            self.in_flight += 1
+        else:
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    # The slot was handed over just as we were cancelled
+                    self.release()
+                raise
+        if self.in_flight >= int(self.limit):
+            self._saturated = True
+
+    def release(self):
+        self.in_flight -= 1
+        self._wake()
+
+    def on_sample(self, elapsed: float, healthy: bool):
+        now = time.monotonic()
+        if not healthy or elapsed > self.latency_target:
+            if now - self._last_decrease >= self.latency_target:
+                self.limit = max(self.min_limit, self.limit * self.decrease_ratio)
+                self._last_decrease = now
+        elif self._saturated:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self._saturated = False
+            self._wake()
+
+    def _wake(self):
+        while self._waiters and self.in_flight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+
+class HostState:
+    def __init__(self, key: str):
+        self.key = key
+        self.breaker = CircuitBreaker()
+        self.limiter = AdaptiveLimiter()
+        self.parked = 0
+
+    def admit(self) -> Optional[float]:
+        """
+        None to go ahead, otherwise how long to park the delivery. Parked
+        deliveries are spread out so they don't all return at once.
+        """
+        wait = self.breaker.admit()
+        if wait is None:
+            return None
+        self.parked += 1
+        return wait + random.uniform(0, config.BREAKER_PARK_JITTER)
+
+    def record(self, status_code: Optional[int], elapsed: float, error: Optional[str] = None):
+        healthy = is_healthy_response(status_code)
+        previous = self.breaker.state
+        self.breaker.record(healthy, error)
+        self.limiter.on_sample(elapsed, healthy)
+        if self.breaker.state != previous:
+            logger.warning(f"Circuit for {self.key} is now {self.breaker.state}")
+
+    def snapshot(self) -> dict:
+        return {
+            "host": self.key,
+            "state": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+            "retry_in": round(self.breaker.retry_in, 3),
+            "last_error": self.breaker.last_error,
+            "state_changed_at": self.breaker.changed_at,
+            "concurrency_limit": round(self.limiter.limit, 2),
+            "in_flight": self.limiter.in_flight,
+            "waiting": self.limiter.waiting,
+            "parked": self.parked,
+        }
+
+
+class HostHealth:
+    """
+    Breaker and concurrency limiter per destination (scheme://host:port).
+    State is per process and per DeliveryEngine.
+    """
+
+    def __init__(self):
+        self._hosts: Dict[str, HostState] = {}
+
+    def get(self, key: str) -> HostState:
+        host = self._hosts.get(key)
+        if host is None:
+            host = self._hosts[key] = HostState(key)
+        return host
+
+    def find(self, key: str) -> Optional[HostState]:
+        return self._hosts.get(key)
+
+    def snapshot(self) -> List[dict]:
+        return [host.snapshot() for host in self._hosts.values()]
+
+    def clear(self):
+        self._hosts.clear()
@@ -0,0 +1,317 @@
+"""
+Idempotent ingest: the response to a request carrying an Idempotency-Key
+is remembered, and a replay of the same key gets that response back
+instead of being enqueued again.
+
+Lookups go through three layers, cheapest first:
+
+  1. an LRU of recent responses (a hit answers the replay in memory)
+  2. a Bloom filter of every key seen within the TTL; a key the filter has
+     never seen is new, which is the answer for almost every request
+  3. the idempotency_keys table, only for filter hits that missed the LRU
+     (an evicted key, a key recorded by another process, or a false positive)
+
+Responses are written to the table in batches, so a key is durable within
+IDEMPOTENCY_FLUSH_INTERVAL. Other processes pick up new keys every
+IDEMPOTENCY_REFRESH_INTERVAL; a replay sent to a different process inside
+that window can still be enqueued twice.
+"""
+import asyncio
+import hashlib
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app import config
+from app.database import SessionLocal, run_db
+from app.models import IdempotencyKey
+from app.services import metrics
+from app.services.payloads import dumps, loads
+
+logger = logging.getLogger(__name__)
+
+
+class BloomFilter:
+    """
+    Fixed-size Bloom filter over strings, sized for `capacity` keys at
+    `error_rate` false positives. Bit positions are 32-bit slices of one
+    blake2b digest, so a check is a single hash call.
+    """
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = capacity
+        self.size = min(2 ** 32, max(64, int(-capacity * math.log(error_rate) / math.log(2) ** 2)))
+        # blake2b digests are at most 64 bytes: 16 positions
+        self.hashes = min(16, max(1, round(self.size / capacity * math.log(2))))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode(), digest_size=4 * self.hashes).digest()
+        return [h % self.size for h in memoryview(digest).cast("I")]
+
+    def add(self, key: str):
+        added = False
+        for position in self._positions(key):
+            mask = 1 << (position & 7)
+            if not self.bits[position >> 3] & mask:
+                self.bits[position >> 3] |= mask
+                added = True
+        if added:
+            self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        bits = self.bits
+        for position in self._positions(key):
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+
+class IdempotencyStore:
+    def __init__(
+        self,
+        ttl: float = config.IDEMPOTENCY_TTL,
+        cache_size: int = config.IDEMPOTENCY_CACHE_SIZE,
+        filter_capacity: int = config.IDEMPOTENCY_FILTER_CAPACITY,
+        filter_error_rate: float = config.IDEMPOTENCY_FILTER_ERROR_RATE,
+        flush_interval: float = config.IDEMPOTENCY_FLUSH_INTERVAL,
+        refresh_interval: float = config.IDEMPOTENCY_REFRESH_INTERVAL,
+    ):
+        self.ttl = ttl
+        self.cache_size = cache_size
+        self.filter_capacity = filter_capacity
+        self.filter_error_rate = filter_error_rate
+        self.flush_interval = flush_interval
+        self.refresh_interval = refresh_interval
+        self.replays = 0
+        self.db_lookups = 0
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._filter = BloomFilter(filter_capacity, filter_error_rate)
+        # Until the filter holds the table's keys, a filter miss proves nothing
+        self._filter_loaded = False
+        self._unflushed: Dict[str, Tuple[str, datetime]] = {}
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self._lock = threading.Lock()
+        self._runner: Optional[asyncio.Task] = None
+        self._stopping: Optional[asyncio.Event] = None
+
+    def start(self):
+        if self._runner is None:
+            self._stopping = asyncio.Event()
+            self._runner = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        """
+        Write out every recorded response, then stop the flusher.
+        """
+        if self._runner is None:
+            return
+        self._stopping.set()
+        await self._runner
+        self._runner = None
+
+    async def begin(self, db: Session, key: Optional[str]) -> Optional[dict]:
+        """
+        The original response if key was already used. Otherwise None, and
+        the key is held until finish() or abort(): a concurrent request with
+        the same key waits for the first one rather than enqueuing again.
+        """
+        if key is None:
+            return None
+        while key in self._in_flight:
+            await asyncio.shield(self._in_flight[key])
+        # Held before the lookup yields, so a duplicate arriving meanwhile
+        # waits for this request instead of looking the key up as well
+        self._in_flight[key] = asyncio.get_running_loop().create_future()
+        try:
+            response = await self.lookup(db, key)
+        except BaseException:
+            self._release(key)
+            raise
+        if response is not None:
+            self.replays += 1
+            self._release(key)
+        return response
+
+    def finish(self, key: Optional[str], response: dict):
+        if key is None:
+            return
+        self.start()
+        text = dumps(response).decode()
+        with self._lock:
+            self._remember(key, text, time.time())
+            self._filter.add(key)
+            self._unflushed[key] = (text, datetime.utcnow())
+        self._release(key)
+
+    def abort(self, key: Optional[str]):
+        """
+        Forget a key whose request failed, so the client can retry it.
+        """
+        if key is not None:
+            self._release(key)
+
+    async def lookup(self, db: Session, key: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.time() - self.ttl:
+                self._entries.move_to_end(key)
+                return loads(entry[1])
+            if self._filter_loaded and key not in self._filter:
+                return None
+            unflushed = self._unflushed.get(key)
+        if unflushed is not None:
+            return loads(unflushed[0])
+
+        self.db_lookups += 1
+        return await run_db(self._load, db, key)
+
+    def _load(self, db: Session, key: str) -> Optional[dict]:
+        row = db.query(IdempotencyKey).filter(IdempotencyKey.key == key).first()
+        if row is None or row.created_at < datetime.utcnow() - timedelta(seconds=self.ttl):
+            return None
+        age = (datetime.utcnow() - row.created_at).total_seconds()
+        with self._lock:
+            self._remember(key, row.response, time.time() - age)
+        return loads(row.response)
+
+    def _remember(self, key: str, text: str, created: float):
+        self._entries[key] = (created, text)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.cache_size:
+            self._entries.popitem(last=False)
+
+    def _release(self, key: str):
+        waiter = self._in_flight.pop(key, None)
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+    async def _run(self):
+        try:
+            await self._rebuild_filter()
+        except Exception as e:
+            logger.error(f"Failed to load idempotency keys: {str(e)}")
+        refreshed_at = datetime.utcnow()
+        next_refresh = next_cleanup = time.monotonic() + self.refresh_interval
+
+        while True:
+            try:
+                await asyncio.wait_for(self._stopping.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            stopping = self._stopping.is_set()
+
+            if self._unflushed:
+                batch = dict(self._unflushed)
+                try:
+                    await run_db(self._insert, batch)
+                    for key, value in batch.items():
+                        if self._unflushed.get(key) is value:
+                            del self._unflushed[key]
+                except Exception as e:
+                    logger.error(f"Failed to write {len(batch)} idempotency keys: {str(e)}")
+            if stopping:
+                return
+
+            try:
+                now = time.monotonic()
+                if now >= next_refresh:
+                    # Keys recorded by other processes; rows are written up
+                    # to a flush interval after created_at, hence the overlap
+                    since = refreshed_at - timedelta(seconds=self.flush_interval * 2 + 1)
+                    refreshed_at = datetime.utcnow()
+                    keys = await run_db(self._load_keys, since)
+                    with self._lock:
+                        for key in keys:
+                            self._filter.add(key)
+                    next_refresh = now + self.refresh_interval
+                if self._filter.count > self._filter.capacity:
+                    # Past capacity the false positive rate climbs; expired
+                    # keys can't be removed from a Bloom filter, so rebuild
+                    await self._rebuild_filter()
+                if now >= next_cleanup:
+                    await run_db(self._expire)
+                    next_cleanup = now + config.IDEMPOTENCY_CLEANUP_INTERVAL
+            except Exception as e:
+                logger.error(f"Idempotency key maintenance failed: {str(e)}")
+
+    async def _rebuild_filter(self):
+        keys = await run_db(self._load_keys, datetime.utcnow() - timedelta(seconds=self.ttl))
+        bloom = BloomFilter(max(self.filter_capacity, 2 * len(keys)), self.filter_error_rate)
+        for key in keys:
+            bloom.add(key)
+        with self._lock:
+            # Recorded while the table was being read
+            for key in self._unflushed:
+                bloom.add(key)
+            self._filter = bloom
+            self._filter_loaded = True
+
+    def _load_keys(self, since: datetime) -> Iterable[str]:
+        db = SessionLocal()
+        try:
+            rows = db.query(IdempotencyKey.key).filter(IdempotencyKey.created_at >= since).all()
+            return [row.key for row in rows]
+        finally:
+            db.close()
+
+    def _insert(self, batch: Dict[str, Tuple[str, datetime]]):
+        db = SessionLocal()
+        try:
+            rows = [
+                {"key": key, "response": text, "created_at": created_at}
+                for key, (text, created_at) in batch.items()
+            ]
+            db.execute(_insert_ignore(db.bind.dialect.name), rows)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _expire(self):
+        db = SessionLocal()
+        try:
+            cutoff = datetime.utcnow() - timedelta(seconds=self.ttl)
+            db.query(IdempotencyKey).filter(IdempotencyKey.created_at < cutoff).delete(synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    @property
+    def cached(self) -> int:
+        return len(self._entries)
+
+
+def _insert_ignore(dialect: str):
+    # A key recorded by two processes at once keeps the first response
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        return IdempotencyKey.__table__.insert()
+    return insert(IdempotencyKey.__table__).on_conflict_do_nothing()
+
+
+idempotency_store = IdempotencyStore()
+
+metrics.CallbackMetric(
+    "idempotency_replays_total", "Ingest requests answered with a stored response",
+    lambda: idempotency_store.replays, type="counter",
+)
+metrics.CallbackMetric(
+    "idempotency_db_lookups_total", "Idempotency checks that had to read the table",
+    lambda: idempotency_store.db_lookups, type="counter",
+)
+metrics.CallbackMetric(
+    "idempotency_cached_keys", "Responses held in the idempotency LRU", lambda: idempotency_store.cached
+)
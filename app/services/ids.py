@@ -0,0 +1,80 @@
+"""
+Webhook ids: ULID-style, 48 bits of millisecond timestamp followed by 80
+random bits, Crockford base32 encoded. Ids sort by creation time and need
+no coordination between processes; within one process they are strictly
+increasing, even inside the same millisecond.
+"""
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+_ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+_RANDOM_BITS = 80
+_RANDOM_MASK = (1 << _RANDOM_BITS) - 1
+_EPOCH = datetime(1970, 1, 1)
+
+
+class UlidGenerator:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._last_ms = -1
+        self._last_random = 0
+        self._pid = os.getpid()
+
+    def new(self) -> str:
+        with self._lock:
+            ms = time.time_ns() // 1_000_000
+            if self._pid != os.getpid():
+                # Forked worker: don't continue the parent's sequence
+                self._pid = os.getpid()
+                self._last_ms = -1
+            random = None
+            if ms <= self._last_ms:
+                # Same millisecond (or the clock stepped back): stay monotonic
+                ms = self._last_ms
+                if self._last_random < _RANDOM_MASK:
+                    random = self._last_random + 1
+                else:
+                    ms += 1
+            if random is None:
+                random = int.from_bytes(os.urandom(10), "big")
+            self._last_ms, self._last_random = ms, random
+
+        value = (ms << _RANDOM_BITS) | random
+        chars = []
+        for _ in range(26):
+            chars.append(_ALPHABET[value & 31])
+            value >>= 5
+        return "".join(reversed(chars))
+
+
+_generator = UlidGenerator()
+
+
+def new_webhook_id() -> str:
+    return "wh_" + _generator.new()
+
+
+def webhook_id_time(webhook_id: str) -> Optional[datetime]:
+    """
+    When a webhook id was issued (naive UTC), from the timestamp it carries:
+    the ULID's milliseconds, or the seconds of older "wh_<unix>_<n>" ids.
+    None for ids that carry no recognisable timestamp.
+    """
+    if not webhook_id.startswith("wh_"):
+        return None
+    body = webhook_id[3:]
+    if len(body) == 26:
+        ms = 0
+        for char in body[:10]:
+            value = _ALPHABET.find(char)
+            if value < 0:
+                return None
+            ms = ms * 32 + value
+        return _EPOCH + timedelta(milliseconds=ms)
+    seconds, _, _ = body.partition("_")
+    if seconds.isdigit():
+        return _EPOCH + timedelta(seconds=int(seconds))
+    return None
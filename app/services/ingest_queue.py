@@ -0,0 +1,718 @@
+"""
+Durable on-disk ingest queue (DELIVERY_BACKEND=queue), no broker needed.
+
+Layout under QUEUE_DIR, one directory per partition:
+
+    p000/00000000000000000001.seg   append-only segments of records
+    p000/write.lock                 serializes appends across processes
+    p000/consumer.lock              held by the process consuming p000
+    p000/checkpoint                 everything before this is acked
+    p000/acks                       acked positions after the checkpoint
+    p000/dead-letter                records whose dispatch kept failing
+
+A record is <length, crc32, header length> + JSON delivery list + raw
+body, and its position is (segment, offset). Every delivery goes to its
+subscription's partition: an entry fanned out to subscriptions in several
+partitions is written as one record per partition (the body repeated), so
+each subscription's deliveries stay in one partition, in order. Producers group-commit:
+entries that arrive while one fsync is running share the next one, and
+enqueue() only returns after its fsync. Consumers own whole partitions
+through consumer.lock, so a crashed consumer's partitions are taken over
+by whoever locks them next and replayed from the checkpoint, skipping
+positions already in the ack log. Delivery is at-least-once: a delivery
+whose dispatch raises is retried with backoff and, once its attempts run
+out, appended to the dead-letter file (same record format) before its
+entry is acked.
+"""
+import asyncio
+import fcntl
+import inspect
+import logging
+import os
+import struct
+import zlib
+from typing import Callable, Dict, List, NamedTuple, Optional, Set, Tuple
+
+from app import config
+from app.services import metrics, payloads
+
+logger = logging.getLogger(__name__)
+
+RECORD_HEADER = struct.Struct("<III")
+POSITION = struct.Struct("<QQ")
+SEGMENT_SUFFIX = ".seg"
+MAX_READ_BYTES = 16 * 1024 * 1024
+
+_datasync = getattr(os, "fdatasync", os.fsync)
+
+Position = Tuple[int, int]
+
+
+class QueueEntry(NamedTuple):
+    position: Position
+    deliveries: List[Tuple[int, str]]
+    body: bytes
+
+
+def encode_record(deliveries: List[Tuple[int, str]], body: bytes) -> bytes:
+    header = payloads.dumps(deliveries)
+    data = header + body
+    return RECORD_HEADER.pack(len(data), zlib.crc32(data), len(header)) + data
+
+
+def _write_all(fd: int, data: bytes):
+    view = memoryview(data)
+    while view:
+        view = view[os.write(fd, view):]
+
+
+def _fsync_dir(path: str):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class PartitionLog:
+    def __init__(self, path: str):
+        self.path = path
+
+    def segments(self) -> List[int]:
+        try:
+            names = os.listdir(self.path)
+        except FileNotFoundError:
+            return []
+        return sorted(
+            int(name[:-len(SEGMENT_SUFFIX)]) for name in names
+            if name.endswith(SEGMENT_SUFFIX) and name[:-len(SEGMENT_SUFFIX)].isdigit()
+        )
+
+    def segment_path(self, segment: int) -> str:
+        return os.path.join(self.path, f"{segment:020d}{SEGMENT_SUFFIX}")
+
+    def file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def scan(self, f, offset: int, limit: int, max_bytes: int = MAX_READ_BYTES) -> Tuple[List[QueueEntry], int, bool]:
+        """
+        Read complete records from an open segment starting at offset.
+        Returns (entries, next offset, corrupt). Stops quietly at a record
+        that is still being written. Files other than segments (the
+        dead-letter file) read with segment 0 in their positions.
+        """
+        name = os.path.basename(f.name)
+        segment = int(name[:-len(SEGMENT_SUFFIX)]) if name.endswith(SEGMENT_SUFFIX) else 0
+        entries = []
+        read = 0
+        f.seek(offset)
+        while len(entries) < limit and read < max_bytes:
+            head = f.read(RECORD_HEADER.size)
+            if len(head) < RECORD_HEADER.size:
+                break
+            length, crc, header_length = RECORD_HEADER.unpack(head)
+            data = f.read(length)
+            if len(data) < length:
+                break
+            if zlib.crc32(data) != crc:
+                # A torn tail is expected after a crash; anything else is damage
+                size = os.fstat(f.fileno()).st_size
+                return entries, offset, offset + RECORD_HEADER.size + length < size
+            deliveries = [tuple(d) for d in payloads.loads(data[:header_length])]
+            entries.append(QueueEntry((segment, offset), deliveries, data[header_length:]))
+            offset += RECORD_HEADER.size + length
+            read += length
+        return entries, offset, False
+
+
+class _PartitionWriter:
+    """
+    Appends to one partition from this process. Any number of processes may
+    append to the same partition; write.lock keeps each batch contiguous.
+
+    Under the lock, nothing past the last complete record can still be in
+    progress, so whatever another producer left there by crashing mid-append
+    is cut off before this one appends. Only bytes written since this
+    writer's own last append are checked.
+    """
+
+    def __init__(self, log: PartitionLog, segment_bytes: int):
+        self.log = log
+        self.segment_bytes = segment_bytes
+        os.makedirs(log.path, exist_ok=True)
+        self._lock_fd = os.open(log.file("write.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+        self._segment: Optional[int] = None
+        self._fd: Optional[int] = None
+        # End of the last record known to be complete in the open segment
+        self._end = 0
+
+    def append(self, data: bytes):
+        fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+        try:
+            segments = self.log.segments()
+            active = segments[-1] if segments else 1
+            if active != self._segment:
+                self._open(active)
+            size = os.fstat(self._fd).st_size
+            if size != self._end:
+                size = self._repair()
+            if size and size + len(data) > self.segment_bytes:
+                self._open(self._segment + 1)
+                size = 0
+            _write_all(self._fd, data)
+            _datasync(self._fd)
+            self._end = size + len(data)
+        finally:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    def _open(self, segment: int):
+        if self._fd is not None:
+            os.close(self._fd)
+        path = self.log.segment_path(segment)
+        created = not os.path.exists(path)
+        self._fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self._segment = segment
+        # A segment this writer didn't just create is checked from the start
+        self._end = 0 if created else -1
+        if created:
+            _fsync_dir(self.log.path)
+
+    def _repair(self) -> int:
+        """
+        Check the records other producers appended since this writer's last
+        append and cut off a torn one (left by a crash during a write).
+        Returns the size of the segment to append to.
+        """
+        path = self.log.segment_path(self._segment)
+        with open(path, "rb") as f:
+            offset = max(self._end, 0)
+            while True:
+                entries, offset, corrupt = self.log.scan(f, offset, 10000)
+                if not entries or corrupt:
+                    break
+            size = os.fstat(f.fileno()).st_size
+        if corrupt:
+            # Damage followed by more data: don't destroy it, and don't
+            # append where consumers would skip the records
+            logger.error(f"Corrupt record in {path} at offset {offset}; appending to a new segment")
+            self._open(self._segment + 1)
+            return 0
+        if offset < size:
+            logger.warning(f"Truncating {size - offset} torn bytes from {path}")
+            os.truncate(path, offset)
+        self._end = offset
+        return offset
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+        os.close(self._lock_fd)
+
+
+class IngestQueue:
+    """
+    Producer side. enqueue() resolves once the entry is on disk.
+    """
+
+    def __init__(
+        self,
+        queue_dir: str = config.QUEUE_DIR,
+        partitions: int = config.QUEUE_PARTITIONS,
+        segment_bytes: int = config.QUEUE_SEGMENT_BYTES,
+        max_batch: int = config.QUEUE_COMMIT_BATCH,
+    ):
+        self.queue_dir = queue_dir
+        self.partitions = partitions
+        self.segment_bytes = segment_bytes
+        self.max_batch = max_batch
+        self.enqueued = 0
+        self.commits = 0
+        self._writers: Dict[int, _PartitionWriter] = {}
+        self._pending: Optional[asyncio.Queue] = None
+        self._runner: Optional[asyncio.Task] = None
+        self._listeners: List[Callable[[int], None]] = []
+
+    def log(self, partition: int) -> PartitionLog:
+        return PartitionLog(os.path.join(self.queue_dir, f"p{partition:03d}"))
+
+    def partition_for(self, subscription_id: int) -> int:
+        # Keeps each subscription's entries in order within one partition
+        return subscription_id % self.partitions
+
+    def _records(self, deliveries: List[Tuple[int, str]], body: bytes) -> List[Tuple[int, bytes]]:
+        """
+        (partition, record) pairs for one entry: one record per partition
+        its subscriptions map to.
+        """
+        by_partition: Dict[int, List[Tuple[int, str]]] = {}
+        for delivery in deliveries:
+            by_partition.setdefault(self.partition_for(delivery[0]), []).append(delivery)
+        return [(partition, encode_record(group, body)) for partition, group in by_partition.items()]
+
+    def add_listener(self, callback: Callable[[int], None]):
+        """
+        Call callback(partition) after each commit, so in-process consumers
+        don't have to wait for their next poll.
+        """
+        self._listeners.append(callback)
+
+    def start(self):
+        if self._runner is None:
+            self._pending = asyncio.Queue()
+            self._runner = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._runner is None:
+            return
+        await self._pending.put(None)
+        await self._runner
+        self._runner = None
+        for writer in self._writers.values():
+            writer.close()
+        self._writers.clear()
+
+    async def enqueue(self, deliveries: List[Tuple[int, str]], body: bytes):
+        await self.enqueue_many([(deliveries, body)])
+
+    async def enqueue_many(self, entries: List[Tuple[List[Tuple[int, str]], bytes]]):
+        """
+        enqueue() for a batch of (deliveries, body) entries. They are queued
+        together, so they share group commits (one fsync per partition
+        unless the batch exceeds max_batch).
+        """
+        self.start()
+        loop = asyncio.get_running_loop()
+        futures = []
+        for deliveries, body in entries:
+            for partition, record in self._records(deliveries, body):
+                future = loop.create_future()
+                self._pending.put_nowait((partition, record, future))
+                futures.append(future)
+        await asyncio.gather(*futures)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while True:
+            # No timer: whatever queued up during the last fsync is the batch
+            batch = [await self._pending.get()]
+            while len(batch) < self.max_batch and not self._pending.empty():
+                batch.append(self._pending.get_nowait())
+
+            items = [b for b in batch if b is not None]
+            stopping = stopping or len(items) != len(batch)
+            if items:
+                try:
+                    partitions = await loop.run_in_executor(None, self._commit, items)
+                except Exception as e:
+                    logger.error(f"Failed to append {len(items)} queue entries: {str(e)}")
+                    for _, _, future in items:
+                        if not future.done():
+                            future.set_exception(e)
+                else:
+                    self.enqueued += len(items)
+                    for _, _, future in items:
+                        if not future.done():
+                            future.set_result(None)
+                    for partition in partitions:
+                        for listener in self._listeners:
+                            listener(partition)
+
+            if stopping and self._pending.empty():
+                return
+
+    def _commit(self, items) -> Set[int]:
+        by_partition: Dict[int, List[bytes]] = {}
+        for partition, record, _ in items:
+            by_partition.setdefault(partition, []).append(record)
+        for partition, records in by_partition.items():
+            writer = self._writers.get(partition)
+            if writer is None:
+                writer = self._writers[partition] = _PartitionWriter(self.log(partition), self.segment_bytes)
+            writer.append(b"".join(records))
+            self.commits += 1
+        return set(by_partition)
+
+
+async def _completion(handed_off):
+    # What a dispatch returned: its error, its completion, or nothing to wait for
+    if isinstance(handed_off, BaseException):
+        raise handed_off
+    if inspect.isawaitable(handed_off):
+        return await handed_off
+    return handed_off
+
+
+class PartitionConsumer:
+    """
+    Delivers one partition's entries. Only constructed while this process
+    holds the partition's consumer.lock.
+    """
+
+    def __init__(
+        self,
+        log: PartitionLog,
+        dispatch: Callable,
+        concurrency: int,
+        max_pending: int = config.QUEUE_CONSUMER_MAX_PENDING,
+        max_attempts: int = config.QUEUE_DISPATCH_MAX_ATTEMPTS,
+        retry_backoff: float = config.QUEUE_DISPATCH_BACKOFF,
+        retry_max_backoff: float = config.QUEUE_DISPATCH_MAX_BACKOFF,
+    ):
+        self.log = log
+        self.dispatch = dispatch
+        self.concurrency = concurrency
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.retry_max_backoff = retry_max_backoff
+        self.position: Position = (1, 0)
+        self.pending: Set[Position] = set()
+        self.acked: Set[Position] = set()
+        self.delivered = 0
+        self.dead_lettered = 0
+        self.wakeup = asyncio.Event()
+        self._unsynced: List[Position] = []
+        self._file = None
+        self._ack_fd: Optional[int] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    def recover(self) -> int:
+        """
+        Load the checkpoint and ack log. Returns how many acked positions
+        will be skipped when the partition is replayed.
+        """
+        try:
+            with open(self.log.file("checkpoint"), "rb") as f:
+                self.position = POSITION.unpack(f.read(POSITION.size))
+        except (FileNotFoundError, struct.error):
+            segments = self.log.segments()
+            self.position = (segments[0] if segments else 1, 0)
+        try:
+            with open(self.log.file("acks"), "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            data = b""
+        # A torn trailing ack is simply dropped (and redelivered)
+        usable = len(data) - len(data) % POSITION.size
+        self.acked = {p for p in POSITION.iter_unpack(data[:usable]) if p >= self.position}
+        self._ack_fd = os.open(self.log.file("acks"), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        return len(self.acked)
+
+    async def run(self, poll_interval: float = config.QUEUE_POLL_INTERVAL):
+        loop = asyncio.get_running_loop()
+        slots = asyncio.Semaphore(self.concurrency)
+        outstanding = asyncio.Semaphore(self.max_pending)
+        try:
+            while True:
+                self.wakeup.clear()
+                entries, self.position = await loop.run_in_executor(None, self._read, self.position)
+                entries = [e for e in entries if e.position not in self.acked]
+                # Tracked as pending before they get a slot, so compaction
+                # never checkpoints past an entry that hasn't been delivered
+                self.pending.update(e.position for e in entries)
+                for entry in entries:
+                    await outstanding.acquire()
+                    await slots.acquire()
+                    task = asyncio.ensure_future(self._process(entry, slots, outstanding))
+                    self._tasks.add(task)
+                    task.add_done_callback(self._tasks.discard)
+                if not entries:
+                    try:
+                        await asyncio.wait_for(self.wakeup.wait(), poll_interval)
+                    except asyncio.TimeoutError:
+                        pass
+        finally:
+            for task in self._tasks:
+                task.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _process(self, entry: QueueEntry, slots: asyncio.Semaphore, outstanding: asyncio.Semaphore):
+        """
+        Deliver one entry (the caller took a slot for it) and ack it. A
+        dispatch that returns an awaitable has handed its delivery off (the
+        delivery scheduler's submit): the slot goes to the next entry while
+        it waits its turn, so a rate-limited or ordered subscription can't
+        hold every slot and stall the rest of the partition.
+        """
+        loop = asyncio.get_running_loop()
+        remaining = entry.deliveries
+        attempts = 0
+        try:
+            while remaining:
+                try:
+                    handed_off = await asyncio.gather(*(
+                        self.dispatch(subscription_id=subscription_id, payload=entry.body, webhook_id=webhook_id)
+                        for subscription_id, webhook_id in remaining
+                    ), return_exceptions=True)
+                finally:
+                    slots.release()
+                results = await asyncio.gather(*map(_completion, handed_off), return_exceptions=True)
+                failed = [d for d, result in zip(remaining, results) if isinstance(result, BaseException)]
+                if not failed:
+                    break
+                error = next(r for r in results if isinstance(r, BaseException))
+                attempts += 1
+                if attempts >= self.max_attempts:
+                    try:
+                        await loop.run_in_executor(None, self._dead_letter, failed, entry.body)
+                    except Exception as e:
+                        logger.error(f"Failed to dead-letter queue entry {entry.position}: {str(e)}")
+                    else:
+                        logger.error(
+                            f"Dead-lettered {len(failed)} deliveries of queue entry {entry.position} "
+                            f"after {attempts} attempts: {str(error)}"
+                        )
+                        self.dead_lettered += len(failed)
+                        break
+                # Only the failed deliveries of a fan-out are tried again; a
+                # cancelled consumer leaves the entry unacked for replay
+                delay = min(self.retry_backoff * 2 ** (attempts - 1), self.retry_max_backoff)
+                logger.warning(
+                    f"Delivery of queue entry {entry.position} failed ({len(failed)} of {len(remaining)}), "
+                    f"retrying in {delay:.1f}s: {str(error)}"
+                )
+                remaining = failed
+                await asyncio.sleep(delay)
+                await slots.acquire()
+        finally:
+            outstanding.release()
+        self.pending.discard(entry.position)
+        self.acked.add(entry.position)
+        self._unsynced.append(entry.position)
+        self.delivered += 1
+
+    def _read(self, position: Position) -> Tuple[List[QueueEntry], Position]:
+        segment, offset = position
+        rechecked = False
+        while True:
+            if self._file is None or self._file.name != self.log.segment_path(segment):
+                if self._file is not None:
+                    self._file.close()
+                    self._file = None
+                try:
+                    self._file = open(self.log.segment_path(segment), "rb")
+                except FileNotFoundError:
+                    later = [s for s in self.log.segments() if s > segment]
+                    if not later:
+                        return [], (segment, offset)
+                    segment, offset = later[0], 0
+                    continue
+
+            entries, offset, corrupt = self.log.scan(self._file, offset, self.concurrency)
+            if entries:
+                return entries, (segment, offset)
+            size = os.fstat(self._file.fileno()).st_size
+            if corrupt:
+                logger.error(f"Corrupt record in {self._file.name} at offset {offset}; skipping the rest of the segment")
+                offset = size
+
+            later = [s for s in self.log.segments() if s > segment]
+            if not later:
+                return [], (segment, offset)
+            # Segment N is final once N+1 exists, but may have grown since
+            # the scan above; look once more before moving on
+            if offset < size and not rechecked:
+                rechecked = True
+                continue
+            if offset < size:
+                logger.error(f"Skipping {size - offset} incomplete bytes at the end of {self._file.name}")
+            segment, offset, rechecked = later[0], 0, False
+
+    def _dead_letter(self, deliveries: List[Tuple[int, str]], body: bytes):
+        fd = os.open(self.log.file("dead-letter"), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            _write_all(fd, encode_record(deliveries, body))
+            _datasync(fd)
+        finally:
+            os.close(fd)
+
+    def take_acks(self) -> List[Position]:
+        acks, self._unsynced = self._unsynced, []
+        return acks
+
+    def write_acks(self, acks: List[Position]):
+        if acks:
+            _write_all(self._ack_fd, b"".join(POSITION.pack(*p) for p in acks))
+            _datasync(self._ack_fd)
+
+    def watermark(self) -> Position:
+        return min(self.pending) if self.pending else self.position
+
+    def compact(self, watermark: Position, acked: List[Position]):
+        """
+        Persist the checkpoint, then drop segments behind it and rewrite the
+        ack log with only the acks after it.
+        """
+        tmp = self.log.file("checkpoint.tmp")
+        with open(tmp, "wb") as f:
+            f.write(POSITION.pack(*watermark))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.log.file("checkpoint"))
+
+        for segment in self.log.segments():
+            if segment >= watermark[0]:
+                break
+            os.remove(self.log.segment_path(segment))
+
+        tmp = self.log.file("acks.tmp")
+        with open(tmp, "wb") as f:
+            f.write(b"".join(POSITION.pack(*p) for p in acked))
+            f.flush()
+            os.fsync(f.fileno())
+        os.close(self._ack_fd)
+        os.replace(tmp, self.log.file("acks"))
+        self._ack_fd = os.open(self.log.file("acks"), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        _fsync_dir(self.log.path)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self._ack_fd is not None:
+            os.close(self._ack_fd)
+            self._ack_fd = None
+
+
+class QueueConsumer:
+    """
+    Claims free partitions (up to max_partitions, 0 = all) and delivers
+    them. Partitions released by a stopped or crashed process are picked
+    up on the next rebalance.
+    """
+
+    def __init__(
+        self,
+        queue: IngestQueue,
+        max_partitions: int = config.QUEUE_CONSUMER_PARTITIONS,
+        concurrency: int = config.QUEUE_CONSUMER_CONCURRENCY,
+        ack_interval: float = config.QUEUE_ACK_INTERVAL,
+        compact_interval: float = config.QUEUE_COMPACT_INTERVAL,
+        rebalance_interval: float = 1.0,
+    ):
+        self.queue = queue
+        self.max_partitions = max_partitions
+        self.concurrency = concurrency
+        self.ack_interval = ack_interval
+        self.compact_interval = compact_interval
+        self.rebalance_interval = rebalance_interval
+        self.owned: Dict[int, Tuple[int, PartitionConsumer, asyncio.Task]] = {}
+        self._dispatch: Optional[Callable] = None
+        self._runner: Optional[asyncio.Task] = None
+        self._acker: Optional[asyncio.Task] = None
+        queue.add_listener(self._notify)
+
+    @property
+    def pending(self) -> int:
+        return sum(len(consumer.pending) for _, consumer, _ in self.owned.values())
+
+    def start(self, dispatch: Callable):
+        if self._runner is None:
+            self._dispatch = dispatch
+            self._runner = asyncio.ensure_future(self._rebalance())
+            self._acker = asyncio.ensure_future(self._ack_loop())
+
+    async def stop(self):
+        """
+        Stop delivering. Unacked entries stay on disk for the next owner.
+        """
+        if self._runner is None:
+            return
+        self._runner.cancel()
+        tasks = [task for _, _, task in self.owned.values()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(self._runner, *tasks, return_exceptions=True)
+        self._acker.cancel()
+        await asyncio.gather(self._acker, return_exceptions=True)
+        loop = asyncio.get_running_loop()
+        for lock_fd, consumer, _ in self.owned.values():
+            await loop.run_in_executor(None, consumer.write_acks, consumer.take_acks())
+            consumer.close()
+            os.close(lock_fd)
+        self.owned.clear()
+        self._runner = None
+
+    def _notify(self, partition: int):
+        owned = self.owned.get(partition)
+        if owned is not None:
+            owned[1].wakeup.set()
+
+    def _partitions(self) -> List[int]:
+        # Directories beyond QUEUE_PARTITIONS (left by a larger setting) are drained too
+        found = set(range(self.queue.partitions))
+        if os.path.isdir(self.queue.queue_dir):
+            for name in os.listdir(self.queue.queue_dir):
+                if name.startswith("p") and name[1:].isdigit():
+                    found.add(int(name[1:]))
+        return sorted(found)
+
+    def _try_lock(self, partition: int) -> Optional[int]:
+        log = self.queue.log(partition)
+        os.makedirs(log.path, exist_ok=True)
+        lock_fd = os.open(log.file("consumer.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(lock_fd)
+            return None
+        return lock_fd
+
+    async def _rebalance(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            for partition in self._partitions():
+                if partition in self.owned:
+                    continue
+                if self.max_partitions and len(self.owned) >= self.max_partitions:
+                    break
+                lock_fd = await loop.run_in_executor(None, self._try_lock, partition)
+                if lock_fd is None:
+                    continue
+                consumer = PartitionConsumer(self.queue.log(partition), self._dispatch, self.concurrency)
+                skipped = await loop.run_in_executor(None, consumer.recover)
+                logger.info(f"Consuming queue partition {partition} from {consumer.position} ({skipped} acked entries to skip)")
+                self.owned[partition] = (lock_fd, consumer, asyncio.ensure_future(consumer.run()))
+            await asyncio.sleep(self.rebalance_interval)
+
+    async def _ack_loop(self):
+        loop = asyncio.get_running_loop()
+        since_compact = 0.0
+        while True:
+            await asyncio.sleep(self.ack_interval)
+            since_compact += self.ack_interval
+            compact = since_compact >= self.compact_interval
+            if compact:
+                since_compact = 0.0
+            for partition, (_, consumer, _) in list(self.owned.items()):
+                try:
+                    await loop.run_in_executor(None, consumer.write_acks, consumer.take_acks())
+                    if compact:
+                        watermark = consumer.watermark()
+                        consumer.acked = {p for p in consumer.acked if p >= watermark}
+                        await loop.run_in_executor(None, consumer.compact, watermark, sorted(consumer.acked))
+                except Exception as e:
+                    logger.error(f"Ack/compaction for queue partition {partition} failed: {str(e)}")
+
+
+ingest_queue = IngestQueue()
+queue_consumer = QueueConsumer(ingest_queue)
+
+metrics.CallbackMetric(
+    "ingest_queue_enqueued_total", "Records durably appended to the ingest queue by this process (one per partition an entry fans out to)",
+    lambda: ingest_queue.enqueued, type="counter",
+)
+metrics.CallbackMetric(
+    "ingest_queue_commits_total", "Group-committed appends (one fsync each)",
+    lambda: ingest_queue.commits, type="counter",
+)
+metrics.CallbackMetric(
+    "ingest_queue_dead_lettered_total", "Deliveries moved to a dead-letter file by the partitions this process owns",
+    lambda: sum(consumer.dead_lettered for _, consumer, _ in queue_consumer.owned.values()), type="counter",
+)
+metrics.CallbackMetric(
+    "ingest_queue_pending_entries", "Entries read from owned partitions and not yet acked",
+    lambda: queue_consumer.pending,
+)
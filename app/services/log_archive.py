@@ -0,0 +1,220 @@
+import asyncio
+import gzip
+import json
+import logging
+import os
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import func, select
+
+from app import config
+from app.database import SessionLocal, run_db
+from app.models import DeliveryLog, DeliveryStatus
+from app.services.ids import webhook_id_time
+
+logger = logging.getLogger(__name__)
+
+_log_table = DeliveryLog.__table__
+_status_table = DeliveryStatus.__table__
+
+
+class LogArchiver:
+    """
+    Moves expired delivery_logs rows into per-day gzip NDJSON files.
+
+    Rows older than retention_days are read in timestamp order, chunk_size
+    at a time, appended to delivery_logs-YYYY-MM-DD.ndjson.gz (one gzip
+    member per chunk, fsynced) and only then deleted, each chunk in its own
+    short transaction. A crash between append and delete can leave a row in
+    both places; readers de-duplicate by id.
+
+    Attempts archived more than a day after their webhook id was issued
+    (long retry backoff, breaker parking) are also listed in
+    delivery_logs-index-YYYY-MM-DD.ndjson.gz under the issue day, so a
+    lookup knows which later day files to read.
+
+    delivery_statuses rows are expired in the same pass once their last
+    attempt is past the cutoff and every attempt they summarise has been
+    archived; a status poll then rebuilds the summary from the archive.
+    """
+
+    def __init__(
+        self,
+        session_factory=SessionLocal,
+        archive_dir: str = config.LOG_ARCHIVE_DIR,
+        retention_days: float = config.LOG_RETENTION_DAYS,
+        chunk_size: int = config.LOG_ARCHIVE_CHUNK,
+        interval: float = config.LOG_ARCHIVE_INTERVAL,
+    ):
+        self.session_factory = session_factory
+        self.archive_dir = archive_dir
+        self.retention_days = retention_days
+        self.chunk_size = chunk_size
+        self.interval = interval
+        self.rows_archived = 0
+        self.statuses_expired = 0
+        self._runner: Optional[asyncio.Task] = None
+
+    def path_for(self, day: date) -> str:
+        return os.path.join(self.archive_dir, f"delivery_logs-{day.isoformat()}.ndjson.gz")
+
+    def index_path_for(self, day: date) -> str:
+        return os.path.join(self.archive_dir, f"delivery_logs-index-{day.isoformat()}.ndjson.gz")
+
+    def archive_chunk(self, cutoff: Optional[datetime] = None) -> int:
+        """
+        Archive up to chunk_size expired log rows and expire up to chunk_size
+        status rows. Returns the larger of the two counts, so callers keep
+        going while either is a full chunk.
+        """
+        if cutoff is None:
+            cutoff = datetime.utcnow() - timedelta(days=self.retention_days)
+        moved = self._archive_logs(cutoff)
+        return max(moved, self._expire_statuses(cutoff))
+
+    def _archive_logs(self, cutoff: datetime) -> int:
+        db = self.session_factory()
+        try:
+            rows = db.execute(
+                select(_log_table)
+                .where(_log_table.c.timestamp < cutoff)
+                .order_by(_log_table.c.timestamp)
+                .limit(self.chunk_size)
+            ).mappings().all()
+            if not rows:
+                return 0
+
+            by_day: Dict[date, List[dict]] = defaultdict(list)
+            late: Dict[date, List[dict]] = defaultdict(list)
+            for row in rows:
+                day = row["timestamp"].date()
+                by_day[day].append(row)
+                issued = webhook_id_time(row["webhook_id"])
+                if issued is not None and day not in (issued.date(), issued.date() + timedelta(days=1)):
+                    late[issued.date()].append({"webhook_id": row["webhook_id"], "day": day.isoformat()})
+            for day, day_rows in by_day.items():
+                self._append(self.path_for(day), [
+                    {**row, "timestamp": row["timestamp"].isoformat()} for row in day_rows
+                ])
+            # Written before the rows are deleted, like the rows themselves
+            for day, entries in late.items():
+                self._append(self.index_path_for(day), entries)
+
+            ids = [row["id"] for row in rows]
+            for i in range(0, len(ids), 500):
+                db.execute(_log_table.delete().where(_log_table.c.id.in_(ids[i:i + 500])))
+            db.commit()
+            self.rows_archived += len(rows)
+            return len(rows)
+        finally:
+            db.close()
+
+    def _expire_statuses(self, cutoff: datetime) -> int:
+        db = self.session_factory()
+        try:
+            # Logs are archived oldest first: a status whose last attempt is
+            # older than the oldest remaining log row has all of its
+            # attempts in the archive
+            oldest = db.execute(select(func.min(_log_table.c.timestamp))).scalar()
+            if oldest is not None:
+                cutoff = min(cutoff, oldest)
+            ids = db.execute(
+                select(_status_table.c.webhook_id)
+                .where(_status_table.c.last_attempt_at < cutoff)
+                .limit(self.chunk_size)
+            ).scalars().all()
+            for i in range(0, len(ids), 500):
+                db.execute(_status_table.delete().where(_status_table.c.webhook_id.in_(ids[i:i + 500])))
+            db.commit()
+            self.statuses_expired += len(ids)
+            return len(ids)
+        finally:
+            db.close()
+
+    def _append(self, path: str, records: List[dict]):
+        os.makedirs(self.archive_dir, exist_ok=True)
+        lines = "".join(json.dumps(record) + "\n" for record in records).encode()
+        with open(path, "ab") as f:
+            f.write(gzip.compress(lines, compresslevel=6))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def archive_expired(self) -> int:
+        total = 0
+        while True:
+            moved = self.archive_chunk()
+            total += moved
+            if moved < self.chunk_size:
+                return total
+
+    def find_attempts(self, webhook_id: str, around: Optional[datetime] = None) -> List[dict]:
+        """
+        Stream archived attempts for one webhook. Read are the day the
+        webhook id was issued and the next (retries can straddle midnight),
+        any later days the issue day's index lists for it, and with `around`
+        (e.g. the status row's last_attempt_at) that day and the one before.
+        An id without a timestamp is only looked up around `around`.
+        """
+        days = set()
+        issued = webhook_id_time(webhook_id)
+        if issued is not None:
+            days.update((issued.date(), issued.date() + timedelta(days=1)))
+            days.update(self._late_days(webhook_id, issued.date()))
+        if around is not None:
+            days.update((around.date() - timedelta(days=1), around.date()))
+
+        # Cheap substring test first; only candidate lines are parsed
+        needle = json.dumps(webhook_id)
+        found = {}
+        for path in map(self.path_for, sorted(days)):
+            if not os.path.exists(path):
+                continue
+            with gzip.open(path, "rt") as f:
+                for line in f:
+                    if needle not in line:
+                        continue
+                    record = json.loads(line)
+                    if record["webhook_id"] == webhook_id:
+                        record["timestamp"] = datetime.fromisoformat(record["timestamp"])
+                        found[record["id"]] = record
+        return sorted(found.values(), key=lambda r: r["attempt_number"])
+
+    def _late_days(self, webhook_id: str, issued: date) -> List[date]:
+        path = self.index_path_for(issued)
+        if not os.path.exists(path):
+            return []
+        needle = json.dumps(webhook_id)
+        days = set()
+        with gzip.open(path, "rt") as f:
+            for line in f:
+                if needle in line:
+                    entry = json.loads(line)
+                    if entry["webhook_id"] == webhook_id:
+                        days.add(date.fromisoformat(entry["day"]))
+        return list(days)
+
+    def start(self):
+        if self._runner is None:
+            self._runner = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._runner is not None:
+            self._runner.cancel()
+            await asyncio.gather(self._runner, return_exceptions=True)
+            self._runner = None
+
+    async def _run(self):
+        while True:
+            try:
+                # Chunk by chunk in a thread, yielding between chunks so
+                # delivery log writers are never locked out for long
+                while await run_db(self.archive_chunk) == self.chunk_size:
+                    await asyncio.sleep(0.1)
+            except Exception as e:
+                logger.error(f"Delivery log archiving failed: {str(e)}")
+            await asyncio.sleep(self.interval)
+
+
+log_archiver = LogArchiver()
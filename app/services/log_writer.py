@@ -0,0 +1,171 @@
+import asyncio
+import logging
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+from app import config
+from app.database import SessionLocal, run_db
+from app.services import metrics
+from app.services.delivery_status import record_attempts
+
+logger = logging.getLogger(__name__)
+
+
+class DeliveryLogWriter:
+    """
+    Group-commit writer for delivery_logs and delivery_statuses.
+
+    Attempt records from every in-flight delivery are queued and inserted in
+    one executemany per batch (batch_size rows or flush_interval seconds,
+    whichever comes first). The queue is bounded, so write() waits when the
+    database falls behind. Records stay visible through pending() until
+    their batch is committed.
+
+    A batch that fails (e.g. "database is locked" past the busy timeout) is
+    kept and retried with backoff; meanwhile the queue fills and write()
+    blocks. After retry_attempts failures its records are written one per
+    transaction, and only those that still fail are dropped and counted.
+    """
+
+    def __init__(
+        self,
+        batch_size: int = config.LOG_WRITER_BATCH_SIZE,
+        flush_interval: float = config.LOG_WRITER_FLUSH_INTERVAL,
+        max_queue: int = config.LOG_WRITER_MAX_QUEUE,
+        retry_attempts: int = config.LOG_WRITER_RETRY_ATTEMPTS,
+        retry_backoff: float = config.LOG_WRITER_RETRY_BACKOFF,
+        retry_max_backoff: float = config.LOG_WRITER_RETRY_MAX_BACKOFF,
+    ):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.retry_attempts = retry_attempts
+        self.retry_backoff = retry_backoff
+        self.retry_max_backoff = retry_max_backoff
+        self.rows_written = 0
+        self.batches_written = 0
+        self.batch_failures = 0
+        self.rows_dropped = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._runner: Optional[asyncio.Task] = None
+        self._unflushed: Dict[str, List[dict]] = defaultdict(list)
+
+    def start(self):
+        if self._runner is None:
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+            self._runner = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        """
+        Flush everything still queued, then stop the flusher.
+        """
+        if self._runner is None:
+            return
+        await self._queue.put(None)
+        await self._runner
+        self._runner = None
+
+    async def write(self, record: dict):
+        self.start()
+        self._unflushed[record["webhook_id"]].append(record)
+        await self._queue.put(record)
+
+    async def flush(self):
+        if self._queue is not None:
+            await self._queue.join()
+
+    def pending(self, webhook_id: str) -> List[dict]:
+        return list(self._unflushed.get(webhook_id, ()))
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def _run(self):
+        stopping = False
+        while True:
+            batch = [await self._queue.get()]
+            if batch[0] is not None and self._queue.qsize() < self.batch_size - 1:
+                # Let the window fill so one commit covers many attempts
+                await asyncio.sleep(self.flush_interval)
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            records = [r for r in batch if r is not None]
+            stopping = stopping or len(records) != len(batch)
+            if records:
+                await self._write(records)
+                self._release(records)
+            for _ in batch:
+                self._queue.task_done()
+
+            if stopping and self._queue.empty():
+                return
+
+    async def _write(self, records: List[dict]):
+        delay = self.retry_backoff
+        for attempt in range(1, self.retry_attempts + 1):
+            try:
+                await run_db(self._insert, records)
+                return
+            except Exception as e:
+                self.batch_failures += 1
+                logger.error(
+                    f"Failed to write {len(records)} delivery logs "
+                    f"(attempt {attempt}/{self.retry_attempts}): {str(e)}"
+                )
+            if attempt < self.retry_attempts:
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.retry_max_backoff)
+
+        # Isolate the records that can't be written from the ones that can
+        for record in records:
+            try:
+                await run_db(self._insert, [record])
+            except Exception as e:
+                self.rows_dropped += 1
+                logger.error(
+                    f"Dropping delivery log for webhook {record['webhook_id']} "
+                    f"attempt {record['attempt_number']}: {str(e)}"
+                )
+
+    def _insert(self, records: List[dict]):
+        db = SessionLocal()
+        try:
+            record_attempts(db, records)
+            db.commit()
+            self.rows_written += len(records)
+            self.batches_written += 1
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _release(self, records: List[dict]):
+        for record in records:
+            pending = self._unflushed.get(record["webhook_id"])
+            if pending is None:
+                continue
+            pending[:] = [r for r in pending if r is not record]
+            if not pending:
+                del self._unflushed[record["webhook_id"]]
+
+
+log_writer = DeliveryLogWriter()
+
+metrics.CallbackMetric(
+    "delivery_log_queue_depth", "Attempt records waiting to be written", lambda: log_writer.queue_depth
+)
+metrics.CallbackMetric(
+    "delivery_log_rows_written_total", "Attempt records written to delivery_logs",
+    lambda: log_writer.rows_written, type="counter",
+)
+metrics.CallbackMetric(
+    "delivery_log_batch_failures_total", "Failed delivery log batch writes (each is retried)",
+    lambda: log_writer.batch_failures, type="counter",
+)
+metrics.CallbackMetric(
+    "delivery_log_rows_dropped_total", "Attempt records given up on after repeated write failures",
+    lambda: log_writer.rows_dropped, type="counter",
+)
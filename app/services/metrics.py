@@ -0,0 +1,276 @@
+"""
+Low-overhead metrics with Prometheus text exposition.
+
+Counters and histograms accumulate into per-thread shards, so the hot path
+never takes a lock: a thread only ever writes its own shard, and shards are
+summed when /metrics is scraped. Gauges are callbacks evaluated at scrape
+time. With METRICS_ENABLED=false every recording method is a no-op.
+"""
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from app import config
+
+ENABLED = config.METRICS_ENABLED
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+_registry: List["_Metric"] = []
+
+
+def _noop(*args, **kwargs):
+    pass
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Tuple, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_float(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        _registry.append(self)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class _Sharded(_Metric):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._local = threading.local()
+        self._shards: List[dict] = []
+        self._shards_lock = threading.Lock()
+
+    def _shard(self) -> dict:
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = {}
+            # Taken once per thread, never on the recording path afterwards
+            with self._shards_lock:
+                self._shards.append(shard)
+            return shard
+
+
+class Counter(_Sharded):
+    type = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if not ENABLED:
+            self.inc = _noop
+
+    def inc(self, *labelvalues, amount: float = 1):
+        shard = self._shard()
+        shard[labelvalues] = shard.get(labelvalues, 0) + amount
+
+    def values(self) -> Dict[Tuple, float]:
+        totals: Dict[Tuple, float] = {}
+        for shard in list(self._shards):
+            for key, value in list(shard.items()):
+                totals[key] = totals.get(key, 0) + value
+        return totals
+
+    def render(self) -> List[str]:
+        return self.header() + [
+            f"{self.name}{_labels(self.labelnames, key)} {_format_float(value)}"
+            for key, value in sorted(self.values().items())
+        ]
+
+
+class Histogram(_Sharded):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        if not ENABLED:
+            self.observe = _noop
+
+    def observe(self, value: float, *labelvalues):
+        shard = self._shard()
+        state = shard.get(labelvalues)
+        if state is None:
+            # [per-bucket counts..., +Inf count, sum]
+            state = shard[labelvalues] = [0] * (len(self.buckets) + 1) + [0.0]
+        state[bisect_left(self.buckets, value)] += 1
+        state[-1] += value
+
+    def time(self, *labelvalues) -> "_Timer":
+        return _Timer(self, labelvalues)
+
+    def render(self) -> List[str]:
+        merged: Dict[Tuple, list] = {}
+        for shard in list(self._shards):
+            for key, state in list(shard.items()):
+                total = merged.get(key)
+                if total is None:
+                    merged[key] = list(state)
+                else:
+                    for i, v in enumerate(state):
+                        total[i] += v
+
+        lines = self.header()
+        for key, state in sorted(merged.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), state):
+                cumulative += count
+                le = 'le="' + _format_float(bound) + '"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_format_float(state[-1])}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class _Timer:
+    __slots__ = ("histogram", "labelvalues", "start")
+
+    def __init__(self, histogram: Histogram, labelvalues: Tuple):
+        self.histogram = histogram
+        self.labelvalues = labelvalues
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labelvalues)
+
+
+class CallbackMetric(_Metric):
+    """
+    Value read from the owning component at scrape time. The callback
+    returns a number, or a {labelvalues tuple: number} dict.
+    """
+
+    def __init__(self, name: str, documentation: str, callback: Callable, labelnames: Sequence[str] = (), type: str = "gauge"):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+        self.type = type
+
+    def render(self) -> List[str]:
+        value = self.callback()
+        if not isinstance(value, dict):
+            value = {(): value}
+        return self.header() + [
+            f"{self.name}{_labels(self.labelnames, key)} {_format_float(v)}"
+            for key, v in sorted(value.items())
+        ]
+
+
+def render() -> str:
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+class RequestTimingMiddleware:
+    """
+    Plain ASGI middleware timing requests whose path starts with one of
+    `routes` (prefix -> label), up to the start of the response. Other
+    paths pass straight through.
+    """
+
+    def __init__(self, app, routes: Dict[str, str], histogram: Optional[Histogram] = None):
+        self.app = app
+        self.routes = tuple(routes.items())
+        self.histogram = histogram or INGEST_LATENCY
+
+    async def __call__(self, scope, receive, send):
+        label = None
+        if scope["type"] == "http":
+            path = scope["path"]
+            for prefix, name in self.routes:
+                if path.startswith(prefix):
+                    label = name
+                    break
+        if label is None:
+            return await self.app(scope, receive, send)
+
+        start = time.perf_counter()
+        observed = False
+
+        async def timed_send(message):
+            nonlocal observed
+            if message["type"] == "http.response.start" and not observed:
+                observed = True
+                self.histogram.observe(time.perf_counter() - start, label)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, timed_send)
+        finally:
+            if not observed:
+                self.histogram.observe(time.perf_counter() - start, label)
+
+
+def instrument_engine(engine):
+    """
+    Time every statement run through a SQLAlchemy engine, by statement type.
+    """
+    if not ENABLED:
+        return
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        DB_QUERY_LATENCY.observe(elapsed, statement.lstrip().split(" ", 1)[0].upper())
+
+
+# Hot-path metrics recorded by the service
+INGEST_LATENCY = Histogram(
+    "webhook_ingest_duration_seconds", "Ingest handler latency", ["route"]
+)
+PAYLOAD_SIZE = Histogram(
+    "webhook_payload_size_bytes", "Size of ingested payloads", ["route"], buckets=SIZE_BUCKETS
+)
+DB_QUERY_LATENCY = Histogram(
+    "db_query_duration_seconds", "Database statement latency", ["operation"]
+)
+DB_POOL_WAIT = Histogram(
+    "db_pool_checkout_wait_seconds", "Time spent waiting for a pooled database connection",
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0),
+)
+SCHEDULER_WAIT = Histogram(
+    "webhook_scheduler_wait_duration_seconds", "Time deliveries wait in the fair scheduler before dispatch",
+    buckets=(0.001, 0.01, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0),
+)
+DELIVERY_LATENCY = Histogram(
+    "webhook_delivery_duration_seconds", "Outbound delivery latency per target host", ["host"]
+)
+DELIVERY_ATTEMPTS = Counter(
+    "webhook_delivery_attempts_total", "Delivery attempts by result and status class", ["result", "status_class"]
+)
+DELIVERY_PARKED = Counter(
+    "webhook_deliveries_parked_total", "Deliveries deferred by an open circuit breaker", ["host"]
+)
@@ -0,0 +1,266 @@
+import asyncio
+import heapq
+import logging
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, List, Optional, Set, Tuple
+
+from sqlalchemy.orm import Session
+
+from app import config
+from app.database import SessionLocal, run_db
+from app.models import RetryEntry
+from app.services import metrics
+from app.services.payloads import as_body
+
+logger = logging.getLogger(__name__)
+
+
+def backoff_schedule(subscription) -> List[float]:
+    raw = subscription.retry_backoff or config.DEFAULT_RETRY_BACKOFF
+    return [float(step) for step in raw.split(",") if step.strip()]
+
+
+def next_retry_delay(subscription, attempt: int) -> Optional[float]:
+    """
+    Seconds to wait before the attempt after `attempt`, or None once the
+    subscription's max_retries has been used up.
+    """
+    max_retries = subscription.max_retries
+    if max_retries is None:
+        max_retries = config.DEFAULT_MAX_RETRIES
+    if attempt >= max_retries:
+        return None
+
+    schedule = backoff_schedule(subscription)
+    base = schedule[min(attempt - 1, len(schedule) - 1)]
+    jitter = subscription.retry_jitter
+    if jitter is None:
+        jitter = config.DEFAULT_RETRY_JITTER
+    return max(0.0, base * (1 + random.uniform(-jitter, jitter)))
+
+
+def _to_epoch(value: datetime) -> float:
+    return (value - datetime(1970, 1, 1)).total_seconds()
+
+
+class RetryScheduler:
+    """
+    Durable delayed retries.
+
+    Every retry is written to the retry_entries table; in memory only a heap
+    of (due_time, entry_id) pairs is kept, drained by a single timer task.
+    Entries are deleted once their attempt has run, so anything still in the
+    table after a crash is re-dispatched by recover() on the next start. An
+    attempt that raises (its log row or next retry couldn't be written) keeps
+    its entry and is run again after error_delay seconds.
+    """
+
+    def __init__(
+        self,
+        lease_seconds: float = config.RETRY_LEASE_SECONDS,
+        error_delay: float = config.RETRY_ERROR_DELAY,
+    ):
+        self.lease_seconds = lease_seconds
+        self.error_delay = error_delay
+        self._heap: List[Tuple[float, int]] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._runner: Optional[asyncio.Task] = None
+        self._inflight: Set[asyncio.Task] = set()
+        self._dispatch: Optional[Callable[..., Awaitable]] = None
+
+    @property
+    def pending(self) -> int:
+        return len(self._heap) + len(self._inflight)
+
+    async def schedule(
+        self,
+        db: Session,
+        webhook_id: str,
+        subscription_id: int,
+        payload: bytes,
+        attempt: int,
+        delay: float,
+    ) -> int:
+        due = time.time() + delay
+        entry = RetryEntry(
+            webhook_id=webhook_id,
+            subscription_id=subscription_id,
+            payload=payload.decode(),
+            attempt=attempt,
+            due_at=datetime.utcfromtimestamp(due),
+        )
+        entry_id = await run_db(self._insert, db, entry)
+        self._push(due, entry_id)
+        return entry_id
+
+    def _insert(self, db: Session, entry: RetryEntry) -> int:
+        db.add(entry)
+        db.commit()
+        return entry.id
+
+    def _push(self, due: float, entry_id: int):
+        heapq.heappush(self._heap, (due, entry_id))
+        # Only an earlier head changes how long the runner should sleep
+        if self._wakeup is not None and self._heap[0][1] == entry_id:
+            self._wakeup.set()
+
+    def recover(self) -> int:
+        db = SessionLocal()
+        try:
+            rows = db.query(RetryEntry.id, RetryEntry.due_at).all()
+        finally:
+            db.close()
+        self._heap = [(_to_epoch(due_at), entry_id) for entry_id, due_at in rows]
+        heapq.heapify(self._heap)
+        return len(self._heap)
+
+    def start(self, dispatch: Callable[..., Awaitable]):
+        self._dispatch = dispatch
+        self._wakeup = asyncio.Event()
+        recovered = self.recover()
+        if recovered:
+            logger.info(f"Recovered {recovered} pending retries")
+        self._runner = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        # Unfinished entries stay in the table and are picked up on restart
+        tasks = list(self._inflight)
+        if self._runner is not None:
+            tasks.append(self._runner)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._runner = None
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            now = time.time()
+            while self._heap and self._heap[0][0] <= now:
+                _, entry_id = heapq.heappop(self._heap)
+                task = asyncio.ensure_future(self._fire(entry_id))
+                self._inflight.add(task)
+                task.add_done_callback(self._inflight.discard)
+
+            timeout = self._heap[0][0] - now if self._heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def _claim(self, entry_id: int) -> Tuple[Optional[dict], Optional[float]]:
+        """
+        Take a lease on the entry so other API workers that recovered the
+        same table skip it. Returns the dispatch arguments, or None and the
+        time the other worker's lease runs out (None if the entry is gone).
+        """
+        db = SessionLocal()
+        try:
+            now = datetime.utcnow()
+            claimed = db.query(RetryEntry).filter(
+                RetryEntry.id == entry_id,
+                (RetryEntry.locked_until == None) | (RetryEntry.locked_until < now),  # noqa: E711
+            ).update(
+                {RetryEntry.locked_until: now + timedelta(seconds=self.lease_seconds)},
+                synchronize_session=False,
+            )
+            db.commit()
+            entry = db.query(RetryEntry).get(entry_id)
+            if entry is None:
+                return None, None
+            if not claimed:
+                return None, _to_epoch(entry.locked_until)
+            return dict(
+                subscription_id=entry.subscription_id,
+                payload=as_body(entry.payload),
+                webhook_id=entry.webhook_id,
+                attempt=entry.attempt,
+            ), None
+        finally:
+            # Don't hold a connection for the length of the HTTP attempt
+            db.close()
+
+    def _delete(self, entry_id: int):
+        db = SessionLocal()
+        try:
+            db.query(RetryEntry).filter(RetryEntry.id == entry_id).delete(
+                synchronize_session=False
+            )
+            db.commit()
+        finally:
+            db.close()
+
+    def _renew(self, entry_id: int):
+        db = SessionLocal()
+        try:
+            # A renewal still in flight after _release must not re-lock it
+            db.query(RetryEntry).filter(
+                RetryEntry.id == entry_id, RetryEntry.locked_until != None  # noqa: E711
+            ).update(
+                {RetryEntry.locked_until: datetime.utcnow() + timedelta(seconds=self.lease_seconds)},
+                synchronize_session=False,
+            )
+            db.commit()
+        finally:
+            db.close()
+
+    async def _keep_lease(self, entry_id: int):
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                await run_db(self._renew, entry_id)
+            except Exception as e:
+                logger.error(f"Could not renew lease on retry entry {entry_id}: {str(e)}")
+
+    def _release(self, entry_id: int, due: float):
+        db = SessionLocal()
+        try:
+            db.query(RetryEntry).filter(RetryEntry.id == entry_id).update(
+                {RetryEntry.locked_until: None, RetryEntry.due_at: datetime.utcfromtimestamp(due)},
+                synchronize_session=False,
+            )
+            db.commit()
+        finally:
+            db.close()
+
+    async def _fire(self, entry_id: int):
+        kwargs, leased_until = await run_db(self._claim, entry_id)
+        if kwargs is None:
+            if leased_until is not None:
+                # Check back when the other worker's lease runs out
+                self._push(leased_until, entry_id)
+            return
+
+        # The dispatch can wait in the delivery scheduler (tenant queue, rate
+        # limit) for longer than one lease: keep renewing it until it's done
+        renewer = asyncio.ensure_future(self._keep_lease(entry_id))
+        try:
+            await self._dispatch(**kwargs)
+        except Exception as e:
+            renewer.cancel()
+            # The attempt's outcome (or its next retry) wasn't recorded: keep
+            # the entry and run it again rather than lose the delivery
+            due = time.time() + self.error_delay
+            logger.error(
+                f"Retry of webhook {kwargs['webhook_id']} failed, trying again in {self.error_delay:.0f}s: {str(e)}"
+            )
+            try:
+                await run_db(self._release, entry_id, due)
+            except Exception as e:
+                # Still leased: other workers pick it up once the lease runs out
+                logger.error(f"Could not release retry entry {entry_id}: {str(e)}")
+            self._push(due, entry_id)
+            return
+        finally:
+            renewer.cancel()
+
+        await run_db(self._delete, entry_id)
+
+
+retry_scheduler = RetryScheduler()
+
+metrics.CallbackMetric(
+    "webhook_retries_scheduled", "Retries waiting in the in-memory timer", lambda: retry_scheduler.pending
+)
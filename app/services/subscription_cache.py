@@ -0,0 +1,231 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional
+
+from sqlalchemy.orm import Session
+
+from app import config
+from app.database import run_db
+from app.models import Subscription
+from app.services import metrics
+
+logger = logging.getLogger(__name__)
+
+INVALIDATION_CHANNEL = "webhook-service:subscription-invalidations"
+
+
+class CachedSubscription(NamedTuple):
+    """
+    Read-only snapshot of a Subscription row, safe to share across sessions.
+    """
+    id: int
+    target_url: str
+    secret: Optional[str]
+    event_type: Optional[str]
+    max_retries: int
+    retry_backoff: str
+    retry_jitter: float
+    delivery_weight: float = 1.0
+    rate_limit: Optional[float] = None
+    rate_limit_burst: Optional[int] = None
+    ordered_delivery: bool = False
+
+    @classmethod
+    def from_row(cls, row: Subscription) -> "CachedSubscription":
+        return cls(
+            id=row.id,
+            target_url=row.target_url,
+            secret=row.secret,
+            event_type=row.event_type,
+            max_retries=row.max_retries,
+            retry_backoff=row.retry_backoff,
+            retry_jitter=row.retry_jitter,
+            delivery_weight=row.delivery_weight,
+            rate_limit=row.rate_limit,
+            rate_limit_burst=row.rate_limit_burst,
+            ordered_delivery=row.ordered_delivery,
+        )
+
+
+class SubscriptionCache:
+    """
+    Bounded LRU + TTL cache of subscriptions by id.
+
+    Writers must call invalidate() after committing a change; the TTL only
+    bounds staleness for writes made by other processes when no invalidation
+    channel is configured.
+    """
+
+    def __init__(self, maxsize: int = config.SUBSCRIPTION_CACHE_SIZE, ttl: float = config.SUBSCRIPTION_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()
+        # Invalidation generations, so a load that raced an invalidate()
+        # doesn't cache the row it read before the change. Ids trimmed from
+        # the bounded map are treated as invalidated at the floor.
+        self._generation = 0
+        self._invalidated: "OrderedDict[int, int]" = OrderedDict()
+        self._invalidated_floor = 0
+        self._lock = threading.Lock()
+        self._channel = None
+        self._listeners: List[Callable[[int], None]] = []
+
+    def get(self, db: Session, subscription_id: int) -> Optional[CachedSubscription]:
+        found, missing = self._lookup((subscription_id,))
+        if missing:
+            return self._load(db, missing).get(subscription_id)
+        return found[subscription_id]
+
+    def get_many(self, db: Session, subscription_ids: Iterable[int]) -> Dict[int, CachedSubscription]:
+        """
+        Look up many subscriptions, loading all misses with one IN query per
+        chunk. Ids that do not exist are left out of the result.
+        """
+        found, missing = self._lookup(subscription_ids)
+        found.update(self._load(db, missing))
+        return found
+
+    async def get_async(self, db: Session, subscription_id: int) -> Optional[CachedSubscription]:
+        """
+        get() for the event loop: hits are answered in place, misses are
+        loaded on the database thread pool.
+        """
+        found, missing = self._lookup((subscription_id,))
+        if missing:
+            return (await run_db(self._load, db, missing)).get(subscription_id)
+        return found[subscription_id]
+
+    async def get_many_async(self, db: Session, subscription_ids: Iterable[int]) -> Dict[int, CachedSubscription]:
+        found, missing = self._lookup(subscription_ids)
+        if missing:
+            found.update(await run_db(self._load, db, missing))
+        return found
+
+    def _lookup(self, subscription_ids: Iterable[int]):
+        found = {}
+        missing = []
+        now = time.monotonic()
+        with self._lock:
+            for subscription_id in subscription_ids:
+                entry = self._entries.get(subscription_id)
+                if entry is not None and entry[0] > now:
+                    self._entries.move_to_end(subscription_id)
+                    found[subscription_id] = entry[1]
+                else:
+                    missing.append(subscription_id)
+            self.hits += len(found)
+            self.misses += len(missing)
+        return found, missing
+
+    def _load(self, db: Session, missing: List[int]) -> Dict[int, CachedSubscription]:
+        found = {}
+        generation = self._generation
+        for i in range(0, len(missing), 500):
+            chunk = missing[i:i + 500]
+            for row in db.query(Subscription).filter(Subscription.id.in_(chunk)):
+                value = CachedSubscription.from_row(row)
+                self.put(value, generation)
+                found[value.id] = value
+        return found
+
+    def put(self, value: CachedSubscription, generation: Optional[int] = None):
+        """
+        Cache a subscription. A value read from the table passes the
+        generation seen before the read; it is dropped if the subscription
+        was invalidated since, as it may predate the change.
+        """
+        with self._lock:
+            if generation is not None and self._invalidated.get(value.id, self._invalidated_floor) > generation:
+                return
+            self._entries[value.id] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(value.id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, subscription_id: int, broadcast: bool = True):
+        with self._lock:
+            self._entries.pop(subscription_id, None)
+            self._generation += 1
+            self._invalidated[subscription_id] = self._generation
+            self._invalidated.move_to_end(subscription_id)
+            while len(self._invalidated) > self.maxsize:
+                _, generation = self._invalidated.popitem(last=False)
+                self._invalidated_floor = generation
+        for listener in self._listeners:
+            listener(subscription_id)
+        if broadcast and self._channel is not None:
+            self._channel.publish(subscription_id)
+
+    def add_listener(self, callback: Callable[[int], None]):
+        """
+        Call callback(subscription_id) on every invalidation, local or remote,
+        so derived structures can stay in sync with the table.
+        """
+        self._listeners.append(callback)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+    def enable_invalidation_channel(self, url: Optional[str] = config.SUBSCRIPTION_CACHE_INVALIDATION_URL):
+        """
+        Share invalidations with other processes over Redis pub/sub. Optional:
+        without a URL or the redis package the cache stays process-local.
+        """
+        if not url or self._channel is not None:
+            return
+        try:
+            self._channel = RedisInvalidationChannel(url, self)
+        except ImportError:
+            logger.warning("redis package not installed; subscription cache invalidation stays local")
+
+
+class RedisInvalidationChannel:
+    def __init__(self, url: str, cache: SubscriptionCache):
+        import redis
+
+        self._redis = redis.Redis.from_url(url)
+        self._cache = cache
+        self._pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+        self._pubsub.subscribe(**{INVALIDATION_CHANNEL: self._on_message})
+        self._thread = self._pubsub.run_in_thread(sleep_time=1.0, daemon=True)
+
+    def _on_message(self, message):
+        try:
+            self._cache.invalidate(int(message["data"]), broadcast=False)
+        except (TypeError, ValueError):
+            logger.warning(f"Ignoring malformed invalidation message: {message!r}")
+
+    def publish(self, subscription_id: int):
+        try:
+            self._redis.publish(INVALIDATION_CHANNEL, str(subscription_id))
+        except Exception as e:
+            # Peers fall back to the TTL; the local entry is already gone
+            logger.error(f"Failed to broadcast invalidation for subscription {subscription_id}: {str(e)}")
+
+
+subscription_cache = SubscriptionCache()
+
+metrics.CallbackMetric(
+    "subscription_cache_lookups_total", "Subscription cache lookups by result",
+    lambda: {("hit",): subscription_cache.hits, ("miss",): subscription_cache.misses},
+    labelnames=["result"], type="counter",
+)
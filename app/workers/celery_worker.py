@@ -1,59 +1,93 @@
 from celery import Celery
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from ..models import Subscription, DeliveryLog
-import requests
+from celery.signals import worker_process_init
+from .. import config
+from ..database import SessionLocal, engine
+from ..services.delivery import deliver_sync
+from ..services.delivery_status import record_attempts
+from ..services.payloads import as_body, delivery_headers
+from ..services.retry_scheduler import next_retry_delay
+from ..services.subscription_cache import subscription_cache
 from datetime import datetime
+import os
 import time
 
-celery_app = Celery('tasks', broker_url = 'redis://kv-store-url:6379')
+celery_app = Celery('tasks', broker_url = config.CELERY_BROKER_URL)
+if config.CELERY_BROKER_URL.startswith("filesystem://"):
+    os.makedirs(config.CELERY_BROKER_DIR, exist_ok=True)
+    celery_app.conf.broker_transport_options = {
+        "data_folder_in": config.CELERY_BROKER_DIR,
+        "data_folder_out": config.CELERY_BROKER_DIR,
+        "polling_interval": 0.1,
+    }
 
-# Database setup for workers
-SQLALCHEMY_DATABASE_URL = "postgresql://postgres:postgres@db:5432/webhook_db"
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+subscription_cache.enable_invalidation_channel()
 
-@celery_app.task(bind=True, max_retries=5)
-def deliver_webhook(self, subscription_id, payload):
+@worker_process_init.connect
+def reset_db_pool(**kwargs):
+    # Forked pool processes must not reuse connections opened by the parent
+    engine.dispose()
+
+# No Celery-level retry cap: the subscription's max_retries is enforced by
+# next_retry_delay, and circuit-breaker parks must never count against it
+@celery_app.task(bind=True, max_retries=None)
+def deliver_webhook(self, subscription_id, payload, webhook_id=None, attempt=None):
     db = SessionLocal()
+    webhook_id = webhook_id or self.request.id
     
     try:
-        subscription = db.query(Subscription).filter(Subscription.id == subscription_id).first()
+        subscription = subscription_cache.get(db, subscription_id)
         if not subscription:
             raise ValueError("Subscription not found")
         
         # Attempt delivery
-        attempt_number = self.request.retries + 1
-        try:
-            response = requests.post(
-                subscription.target_url,
-                json=payload,
-                timeout=10
+        attempt_number = attempt or self.request.retries + 1
+        retry_kwargs = dict(subscription_id=subscription_id, payload=payload, webhook_id=webhook_id)
+        # Raw body text from the API; older messages may still carry a dict
+        body = as_body(payload)
+        result = deliver_sync(
+            subscription.target_url,
+            content=body,
+            headers=delivery_headers(subscription, webhook_id, attempt_number, body)
+        )
+        if result.retry_after is not None:
+            # Circuit open: park until the breaker lets traffic through,
+            # without spending an attempt. Parks bump request.retries, which
+            # is why the task itself has no max_retries
+            raise self.retry(
+                countdown=result.retry_after,
+                args=(),
+                kwargs=dict(retry_kwargs, attempt=attempt_number)
             )
-            success = response.status_code // 100 == 2
-            status_code = response.status_code
-            error = None if success else response.text
-        except Exception as e:
-            success = False
-            status_code = None
-            error = str(e)
+
+        success = result.success
+        status_code = result.status_code
+        error = result.error
         
         # Log attempt
-        log = DeliveryLog(
+        log = dict(
             subscription_id=subscription_id,
-            webhook_id=self.request.id,
+            webhook_id=webhook_id,
             target_url=subscription.target_url,
             attempt_number=attempt_number,
             success=success,
             status_code=status_code,
-            error=error
+            error=error,
+            timestamp=datetime.utcnow()
         )
-        db.add(log)
+        record_attempts(db, [log])
         db.commit()
         
-        # Retry if failed
+        # Retry if failed, following the subscription's backoff policy
         if not success:
-            raise self.retry(exc=Exception(error), countdown=min(10 * (2 ** attempt_number), 900))
+            delay = next_retry_delay(subscription, attempt_number)
+            if delay is None:
+                return {"status": "failed"}
+            raise self.retry(
+                exc=Exception(error),
+                countdown=delay,
+                args=(),
+                kwargs=dict(retry_kwargs, attempt=attempt_number + 1)
+            )
         
         return {"status": "delivered"}
     finally:
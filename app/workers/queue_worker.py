@@ -0,0 +1,52 @@
+"""
+Standalone consumer for the on-disk ingest queue (DELIVERY_BACKEND=queue).
+
+    python -m app.workers.queue_worker
+
+Start as many as needed on the node that owns QUEUE_DIR. Each takes up to
+QUEUE_CONSUMER_PARTITIONS free partitions (set QUEUE_CONSUME_IN_API=false
+to leave them all to workers); partitions of a worker that exits are
+picked up by the others within a second.
+"""
+import asyncio
+import logging
+import signal
+
+from ..database import init_db
+from ..routers.webhooks import deliver_webhook
+from ..services.delivery import engine as delivery_engine
+from ..services.delivery_scheduler import delivery_scheduler
+from ..services.ingest_queue import queue_consumer
+from ..services.log_writer import log_writer
+from ..services.retry_scheduler import retry_scheduler
+from ..services.subscription_cache import subscription_cache
+
+logger = logging.getLogger(__name__)
+
+
+async def run():
+    init_db()
+    subscription_cache.enable_invalidation_channel()
+    subscription_cache.add_listener(delivery_scheduler.refresh)
+    log_writer.start()
+    delivery_scheduler.start(dispatch=deliver_webhook)
+    retry_scheduler.start(dispatch=delivery_scheduler.deliver)
+    queue_consumer.start(dispatch=delivery_scheduler.submit)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    logger.info("Queue worker started")
+    await stop.wait()
+
+    logger.info("Queue worker stopping")
+    await queue_consumer.stop()
+    await retry_scheduler.stop()
+    await delivery_scheduler.stop()
+    await delivery_engine.aclose()
+    await log_writer.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(run())
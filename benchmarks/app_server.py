@@ -0,0 +1,158 @@
+"""
+Runs the FastAPI app under uvicorn in a subprocess with its own scratch
+directory, so benchmarks never touch the repository's sql_app.db.
+"""
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class AppServer:
+    def __init__(self, port: int = None, env: dict = None, startup_timeout: float = 30.0, workdir: str = None):
+        self.port = port or free_port()
+        self.env = env or {}
+        self.startup_timeout = startup_timeout
+        self.workdir = workdir
+        self._owns_workdir = workdir is None
+        self._process = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def start(self) -> "AppServer":
+        if self._owns_workdir:
+            self.workdir = tempfile.mkdtemp(prefix="webhook-bench-")
+        env = {**os.environ, "PYTHONPATH": REPO_ROOT, **self.env}
+        self._process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app",
+             "--port", str(self.port), "--log-level", "warning"],
+            cwd=self.workdir,
+            env=env,
+        )
+        deadline = time.time() + self.startup_timeout
+        while time.time() < deadline:
+            if self._process.poll() is not None:
+                raise RuntimeError("app server exited during startup")
+            try:
+                requests.get(f"{self.base_url}/openapi.json", timeout=1)
+                return self
+            except requests.ConnectionError:
+                time.sleep(0.1)
+        self.stop()
+        raise RuntimeError("app server did not start in time")
+
+    def stop(self):
+        if self._process is not None:
+            self._process.terminate()
+            self._process.wait()
+            self._process = None
+        if self._owns_workdir and self.workdir is not None:
+            shutil.rmtree(self.workdir, ignore_errors=True)
+            self.workdir = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class CeleryWorker:
+    """
+    Runs app.workers.celery_worker in a subprocess sharing an AppServer's
+    scratch directory and environment.
+    """
+
+    def __init__(self, workdir: str, env: dict = None, concurrency: int = 4):
+        self.workdir = workdir
+        self.env = env or {}
+        self.concurrency = concurrency
+        self._process = None
+
+    def start(self) -> "CeleryWorker":
+        env = {**os.environ, "PYTHONPATH": REPO_ROOT, **self.env}
+        self._process = subprocess.Popen(
+            [sys.executable, "-m", "celery", "-A", "app.workers.celery_worker", "--quiet", "worker",
+             "--pool=prefork", f"--concurrency={self.concurrency}", "--loglevel=warning",
+             "--without-heartbeat", "--without-gossip", "--without-mingle"],
+            cwd=self.workdir,
+            env=env,
+        )
+        return self
+
+    def stop(self):
+        if self._process is not None:
+            self._process.terminate()
+            try:
+                self._process.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                self._process.kill()
+                self._process.wait()
+            self._process = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class QueueWorker:
+    """
+    Runs app.workers.queue_worker in a subprocess sharing an AppServer's
+    scratch directory (and so its QUEUE_DIR) and environment.
+    """
+
+    def __init__(self, workdir: str, env: dict = None):
+        self.workdir = workdir
+        self.env = env or {}
+        self._process = None
+
+    def start(self) -> "QueueWorker":
+        env = {**os.environ, "PYTHONPATH": REPO_ROOT, **self.env}
+        self._process = subprocess.Popen(
+            [sys.executable, "-m", "app.workers.queue_worker"],
+            cwd=self.workdir,
+            env=env,
+        )
+        return self
+
+    def kill(self):
+        """
+        SIGKILL, to simulate a crash.
+        """
+        if self._process is not None:
+            self._process.kill()
+            self._process.wait()
+            self._process = None
+
+    def stop(self):
+        if self._process is not None:
+            self._process.terminate()
+            try:
+                self._process.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                self._process.kill()
+                self._process.wait()
+            self._process = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
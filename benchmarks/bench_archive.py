@@ -0,0 +1,134 @@
+"""
+Delivery log archive throughput.
+
+    python -m benchmarks.bench_archive --rows 200000 --chunk 5000
+
+Fills a scratch SQLite database with expired delivery_logs rows (and their
+delivery_statuses summaries), moves them all into gzip NDJSON archives with
+LogArchiver, and reports rows/sec, compression and the cost of an archive
+lookup for one archived webhook and for an unknown one.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Base
+from app.models import DeliveryLog, DeliveryStatus
+from app.services.ids import new_webhook_id
+from app.services.log_archive import LogArchiver
+
+
+def webhook_id(i: int, start: datetime, step: timedelta) -> str:
+    # Old-style "wh_<unix>_<n>" ids carry the issue time the archive lookup uses
+    issued = start + step * (i // 3 * 3)
+    return f"wh_{int((issued - datetime(1970, 1, 1)).total_seconds())}_{i // 3}"
+
+
+def seed(session_factory, rows: int, days: int):
+    start = datetime.utcnow() - timedelta(days=days + 30)
+    step = timedelta(days=days) / rows
+    db = session_factory()
+    batch = []
+    statuses = []
+    for i in range(rows):
+        success = random.random() > 0.2
+        if i % 3 == 2 or i == rows - 1:
+            statuses.append(dict(
+                webhook_id=webhook_id(i, start, step), subscription_id=i % 1000, attempts=i % 3 + 1,
+                delivered=success, final_status="delivered" if success else "failed",
+                last_attempt_at=start + step * i,
+            ))
+        batch.append(dict(
+            subscription_id=i % 1000,
+            webhook_id=webhook_id(i, start, step),
+            target_url=f"https://subscriber-{i % 1000}.example.com/hooks",
+            timestamp=start + step * i,
+            attempt_number=i % 3 + 1,
+            success=success,
+            status_code=200 if success else 503,
+            error=None if success else "<html><body>Service Unavailable</body></html>" * 4,
+        ))
+        if len(batch) == 10000:
+            db.execute(DeliveryLog.__table__.insert(), batch)
+            db.execute(DeliveryStatus.__table__.insert(), statuses)
+            batch, statuses = [], []
+    if batch:
+        db.execute(DeliveryLog.__table__.insert(), batch)
+        db.execute(DeliveryStatus.__table__.insert(), statuses)
+    db.commit()
+    db.close()
+    return start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--days", type=int, default=14, help="spread rows across this many days")
+    parser.add_argument("--chunk", type=int, default=5000)
+    parser.add_argument("--json", dest="json_out", help="write results to this file")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="webhook-archive-bench-")
+    try:
+        db_path = os.path.join(workdir, "bench.db")
+        engine = create_engine(f"sqlite:///{db_path}", connect_args={"check_same_thread": False})
+        Base.metadata.create_all(bind=engine)
+        session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        first_timestamp = seed(session_factory, args.rows, args.days)
+        db_bytes = os.path.getsize(db_path)
+
+        archiver = LogArchiver(
+            session_factory=session_factory,
+            archive_dir=os.path.join(workdir, "archive"),
+            retention_days=7,
+            chunk_size=args.chunk,
+        )
+        start = time.perf_counter()
+        moved = archiver.archive_expired()
+        elapsed = time.perf_counter() - start
+
+        archive_bytes = sum(
+            os.path.getsize(os.path.join(archiver.archive_dir, name))
+            for name in os.listdir(archiver.archive_dir)
+        )
+        step = timedelta(days=args.days) / args.rows
+        lookup_start = time.perf_counter()
+        found = archiver.find_attempts(webhook_id(args.rows // 2, first_timestamp, step))
+        lookup = time.perf_counter() - lookup_start
+        miss_start = time.perf_counter()
+        archiver.find_attempts(new_webhook_id())
+        miss = time.perf_counter() - miss_start
+
+        results = {
+            "rows": moved,
+            "seconds": elapsed,
+            "rows_per_sec": moved / elapsed,
+            "statuses_expired": archiver.statuses_expired,
+            "chunk_size": args.chunk,
+            "db_bytes_before": db_bytes,
+            "archive_bytes": archive_bytes,
+            "archive_files": len(os.listdir(archiver.archive_dir)),
+            "lookup_ms": lookup * 1000,
+            "lookup_attempts_found": len(found),
+            "unknown_id_lookup_ms": miss * 1000,
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    for key, value in results.items():
+        print(f"{key:<24}{value:>16.1f}" if isinstance(value, float) else f"{key:<24}{value:>16}")
+    if args.json_out:
+        with open(args.json_out, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
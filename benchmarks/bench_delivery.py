@@ -0,0 +1,135 @@
+"""
+Delivery throughput and event-loop lag: blocking requests.post vs DeliveryEngine.
+
+    python -m benchmarks.bench_delivery --deliveries 2000 --concurrency 100 --latency 0.005
+
+Each mode fires the deliveries as concurrent tasks on one event loop (as
+BackgroundTasks does) while a ticker measures how late the loop wakes up.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+import requests
+
+from app.services.delivery import DeliveryEngine
+from benchmarks.stub_receiver import StubReceiver
+
+PAYLOAD = {"event": "benchmark", "data": {"value": 42}}
+
+
+class LoopLagMonitor:
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.samples = []
+        self._task = None
+        self._expected = None
+
+    async def _tick(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            self._expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, loop.time() - self._expected))
+
+    def start(self):
+        self._task = asyncio.ensure_future(self._tick())
+
+    async def stop(self):
+        # A loop that never yielded leaves one tick outstanding for the whole run
+        lag = asyncio.get_running_loop().time() - self._expected
+        if lag > self.interval:
+            self.samples.append(lag)
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+    def summary(self) -> dict:
+        samples = sorted(self.samples) or [0.0]
+        return {
+            "lag_p50_ms": statistics.median(samples) * 1000,
+            "lag_p99_ms": samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1000,
+            "lag_max_ms": samples[-1] * 1000,
+        }
+
+
+async def _run(deliver, deliveries: int, concurrency: int) -> dict:
+    monitor = LoopLagMonitor()
+    monitor.start()
+    gate = asyncio.Semaphore(concurrency)
+    ok = 0
+
+    async def one():
+        nonlocal ok
+        async with gate:
+            if await deliver():
+                ok += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(deliveries)))
+    elapsed = time.perf_counter() - start
+    await monitor.stop()
+    return {
+        "deliveries": deliveries,
+        "succeeded": ok,
+        "seconds": elapsed,
+        "deliveries_per_sec": deliveries / elapsed,
+        **monitor.summary(),
+    }
+
+
+async def bench_blocking(url: str, deliveries: int, concurrency: int) -> dict:
+    async def deliver():
+        # The pre-engine implementation: blocking call, new connection each time
+        response = requests.post(url, json=PAYLOAD, timeout=10)
+        return response.status_code // 100 == 2
+
+    return await _run(deliver, deliveries, concurrency)
+
+
+async def bench_engine(url: str, deliveries: int, concurrency: int) -> dict:
+    engine = DeliveryEngine()
+
+    async def deliver():
+        return (await engine.deliver(url, json=PAYLOAD)).success
+
+    try:
+        return await _run(deliver, deliveries, concurrency)
+    finally:
+        await engine.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--deliveries", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.005, help="stub receiver latency (s)")
+    parser.add_argument("--json", dest="json_out", help="write results to this file")
+    args = parser.parse_args()
+
+    results = {}
+    with StubReceiver(latency=args.latency) as stub:
+        results["blocking_requests"] = asyncio.run(
+            bench_blocking(stub.url, args.deliveries, args.concurrency)
+        )
+        results["delivery_engine"] = asyncio.run(
+            bench_engine(stub.url, args.deliveries, args.concurrency)
+        )
+
+    print(f"{'mode':<20}{'deliv/s':>10}{'lag p50':>10}{'lag p99':>10}{'lag max':>10}")
+    for mode, r in results.items():
+        print(
+            f"{mode:<20}{r['deliveries_per_sec']:>10.0f}{r['lag_p50_ms']:>9.1f}ms"
+            f"{r['lag_p99_ms']:>8.1f}ms{r['lag_max_ms']:>8.1f}ms"
+        )
+    if args.json_out:
+        with open(args.json_out, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Fan-out latency for event-type ingest (POST /api/webhooks/events/{event_type}).
+
+    python -m benchmarks.bench_fanout --sizes 1,100,10000
+
+For each subscriber count a fresh event type is subscribed that many times,
+then one event is ingested. Reports the ingest response time and the time
+until the stub receiver has seen every delivery.
+"""
+import argparse
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from benchmarks.app_server import AppServer
+from benchmarks.stub_receiver import StubReceiver
+
+PAYLOAD = {"event": "benchmark", "data": {"value": 42, "blob": "x" * 1024}}
+
+
+def subscribe(base_url: str, target_url: str, event_type: str, count: int):
+    session = requests.Session()
+
+    def create(_):
+        r = session.post(f"{base_url}/subscriptions/", json={"target_url": target_url, "event_type": event_type})
+        r.raise_for_status()
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(create, range(count)))
+
+
+def bench_size(base_url: str, stub: StubReceiver, size: int, timeout: float) -> dict:
+    event_type = f"bench.fanout.{size}"
+    subscribe(base_url, stub.url, event_type, size)
+
+    before = stub.requests
+    start = time.perf_counter()
+    response = requests.post(f"{base_url}/api/webhooks/events/{event_type}", json=PAYLOAD)
+    ingest = time.perf_counter() - start
+    response.raise_for_status()
+    queued = len(response.json()["deliveries"])
+
+    deadline = time.time() + timeout
+    while stub.requests - before < queued and time.time() < deadline:
+        time.sleep(0.005)
+    completed = time.perf_counter() - start
+    delivered = stub.requests - before
+
+    return {
+        "subscribers": size,
+        "queued": queued,
+        "delivered": delivered,
+        "ingest_ms": ingest * 1000,
+        "all_delivered_ms": completed * 1000,
+        "deliveries_per_sec": delivered / completed if completed else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1,100,10000")
+    parser.add_argument("--latency", type=float, default=0.0, help="stub receiver latency (s)")
+    parser.add_argument("--timeout", type=float, default=300.0)
+    parser.add_argument("--json", dest="json_out", help="write results to this file")
+    args = parser.parse_args()
+
+    results = []
+    with StubReceiver(latency=args.latency) as stub, AppServer() as server:
+        for size in (int(s) for s in args.sizes.split(",")):
+            results.append(bench_size(server.base_url, stub, size, args.timeout))
+
+    print(f"{'subscribers':>12}{'ingest':>12}{'delivered':>12}{'all done':>12}{'deliv/s':>10}")
+    for r in results:
+        print(
+            f"{r['subscribers']:>12}{r['ingest_ms']:>10.1f}ms{r['delivered']:>12}"
+            f"{r['all_delivered_ms']:>10.0f}ms{r['deliveries_per_sec']:>10.0f}"
+        )
+    if args.json_out:
+        with open(args.json_out, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Per-request cost of webhook id generation and the Idempotency-Key check.
+
+    python -m benchmarks.bench_idempotency [--keys 100000] [--cache-size 10000]
+
+Times new_webhook_id(), then IdempotencyStore.begin() for three cases:
+
+  new        a key never seen (answered by the Bloom filter)
+  replay     a key whose response is still in the LRU
+  evicted    a key pushed out of the LRU (answered by the table)
+
+Runs against a scratch SQLite database, so the repository's sql_app.db is
+never touched.
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+
+
+def per_call_us(elapsed: float, calls: int) -> str:
+    return f"{elapsed / calls * 1e6:>8.2f} us/call"
+
+
+async def run(args):
+    from app.database import Base, SessionLocal, engine
+    from app.services.idempotency import IdempotencyStore
+    from app.services.ids import new_webhook_id
+
+    Base.metadata.create_all(bind=engine)
+
+    start = time.perf_counter()
+    ids = [new_webhook_id() for _ in range(args.keys)]
+    print(f"{'new_webhook_id':<16}{per_call_us(time.perf_counter() - start, args.keys)}")
+    assert len(set(ids)) == len(ids) and ids == sorted(ids)
+
+    store = IdempotencyStore(cache_size=args.cache_size, filter_capacity=args.keys * 2)
+    store.start()
+    while not store._filter_loaded:
+        await asyncio.sleep(0.01)
+    db = SessionLocal()
+    try:
+        keys = [f"ingest:1:{n}" for n in range(args.keys)]
+        start = time.perf_counter()
+        for key, webhook_id in zip(keys, ids):
+            await store.begin(db, key)
+            store.finish(key, {"status": "queued", "webhook_id": webhook_id, "subscription_id": 1})
+        print(f"{'new':<16}{per_call_us(time.perf_counter() - start, args.keys)}  (begin + finish)")
+
+        recent = keys[-args.cache_size:]
+        start = time.perf_counter()
+        for key in recent:
+            assert await store.begin(db, key) is not None
+        print(f"{'replay':<16}{per_call_us(time.perf_counter() - start, len(recent))}")
+
+        await store.stop()
+        evicted = keys[:min(1000, args.keys - args.cache_size)]
+        if evicted:
+            start = time.perf_counter()
+            for key in evicted:
+                assert await store.begin(db, key) is not None
+            print(f"{'evicted':<16}{per_call_us(time.perf_counter() - start, len(evicted))}")
+        print(f"filter: {store._filter.size / 8 / 1024:.0f} KB for {store._filter.count} keys, "
+              f"{store._filter.hashes} hashes")
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--keys", type=int, default=100_000)
+    parser.add_argument("--cache-size", type=int, default=10_000)
+    args = parser.parse_args()
+
+    # The app opens ./sql_app.db, so import it from a scratch directory
+    workdir = tempfile.mkdtemp(prefix="webhook-idempotency-bench-")
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        asyncio.run(run(args))
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+CPU per delivery: re-serialized JSON vs raw-body pass-through.
+
+    python -m benchmarks.bench_payloads [--attempts 5] [--sizes 1024,102400,5242880]
+
+For each payload size, N deliveries of `attempts` attempts each are made
+through DeliveryEngine to a local stub receiver, two ways:
+
+  reserialize   parse the body at ingest, let the client encode the dict
+                again on every attempt (the previous behaviour)
+  passthrough   validate once, send the original bytes on every attempt
+                with a cached HMAC-SHA256 signature header
+
+CPU is thread time of the delivering thread only (the receiver runs on
+its own thread). "queued" is the memory one waiting event holds: the parsed
+object for reserialize, the raw bytes for passthrough.
+"""
+import argparse
+import asyncio
+import json
+import time
+import tracemalloc
+
+from app.services import payloads
+from app.services.delivery import DeliveryEngine
+from app.services.subscription_cache import CachedSubscription
+from benchmarks.stub_receiver import StubReceiver
+
+SUBSCRIPTION = CachedSubscription(
+    id=1, target_url="", secret="s3cret", event_type=None,
+    max_retries=5, retry_backoff="1", retry_jitter=0.0,
+)
+
+
+def make_body(size: int) -> bytes:
+    record = {"id": 0, "name": "customer", "email": "someone@example.com", "tags": ["a", "b"], "score": 12.5}
+    per_record = len(json.dumps(record)) + 2
+    records = [dict(record, id=i) for i in range(max(1, size // per_record))]
+    return json.dumps({"event": "bench", "records": records}).encode()
+
+
+def deliveries_for(size: int) -> int:
+    return max(5, min(500, 2_000_000 // size))
+
+
+def queued_bytes(build) -> int:
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    value = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del value
+    return after - before
+
+
+async def run(engine: DeliveryEngine, url: str, body: bytes, mode: str, deliveries: int, attempts: int) -> float:
+    start = time.thread_time()
+    for n in range(deliveries):
+        webhook_id = f"wh_bench_{mode}_{n}"
+        if mode == "reserialize":
+            payload = json.loads(body)
+            for attempt in range(1, attempts + 1):
+                await engine.deliver(url, json=payload, headers={"X-Webhook-Attempt": str(attempt), "X-Webhook-ID": webhook_id})
+        else:
+            payloads.validate(body)
+            for attempt in range(1, attempts + 1):
+                headers = payloads.delivery_headers(SUBSCRIPTION, webhook_id, attempt, body)
+                await engine.deliver(url, content=body, headers=headers)
+    return (time.thread_time() - start) / deliveries
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--attempts", type=int, default=5, help="attempts per delivery")
+    parser.add_argument("--sizes", default="1024,102400,5242880")
+    args = parser.parse_args()
+
+    print(f"json backend: {payloads.JSON_BACKEND}, attempts per delivery: {args.attempts}")
+    print(f"{'size':>10}{'mode':>13}{'cpu/delivery':>15}{'queued':>12}")
+    with StubReceiver() as stub:
+        for size in (int(s) for s in args.sizes.split(",")):
+            body = make_body(size)
+            memory = {
+                "reserialize": queued_bytes(lambda: json.loads(body)),
+                "passthrough": len(body),
+            }
+            for mode in ("reserialize", "passthrough"):
+                engine = DeliveryEngine()
+
+                async def measure():
+                    # Warm the connection pool before timing
+                    await engine.deliver(stub.url, content=b"{}")
+                    try:
+                        return await run(engine, stub.url, body, mode, deliveries_for(len(body)), args.attempts)
+                    finally:
+                        await engine.aclose()
+
+                cpu = asyncio.run(measure())
+                print(f"{len(body):>10}{mode:>13}{cpu * 1000:>13.2f}ms{memory[mode] / 1024:>10.0f}KB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Durable enqueue and drain throughput of the on-disk ingest queue.
+
+    python -m benchmarks.bench_queue [--entries 100000] [--concurrency 2000]
+        [--processes 1] [--partitions 4] [--body-bytes 512]
+
+Producers call IngestQueue.enqueue() from `concurrency` coroutines per
+process; every call returns only after its group commit is fsynced. With
+--processes > 1 the producers are separate processes appending to the same
+partitions. A consumer with a no-op dispatch then drains and acks
+everything. Runs in a scratch directory on the same filesystem as the
+working directory (pass --dir to choose another disk).
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+
+from app.services.ingest_queue import IngestQueue, QueueConsumer
+
+
+async def produce(queue_dir: str, partitions: int, entries: int, concurrency: int, body: bytes) -> dict:
+    queue = IngestQueue(queue_dir=queue_dir, partitions=partitions)
+    latencies = []
+    remaining = entries
+
+    async def producer(worker: int):
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            start = time.perf_counter()
+            await queue.enqueue([(remaining, f"wh_bench_{os.getpid()}_{remaining}")], body)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(producer(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    await queue.stop()
+    latencies.sort()
+    return {
+        "entries": len(latencies),
+        "elapsed": elapsed,
+        "commits": queue.commits,
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99)] * 1000,
+    }
+
+
+def produce_process(args, body: bytes, entries: int, results):
+    results.append(asyncio.run(produce(args.queue_dir, args.partitions, entries, args.concurrency, body)))
+
+
+async def drain(queue_dir: str, partitions: int, expected: int) -> float:
+    queue = IngestQueue(queue_dir=queue_dir, partitions=partitions)
+    consumer = QueueConsumer(queue, concurrency=1000)
+
+    async def dispatch(subscription_id, payload, webhook_id):
+        pass
+
+    start = time.perf_counter()
+    consumer.start(dispatch)
+    while sum(c.delivered for _, c, _ in consumer.owned.values()) < expected:
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - start
+    await consumer.stop()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entries", type=int, default=100_000)
+    parser.add_argument("--concurrency", type=int, default=2000, help="enqueue coroutines per process")
+    parser.add_argument("--processes", type=int, default=1)
+    parser.add_argument("--partitions", type=int, default=4)
+    parser.add_argument("--body-bytes", type=int, default=512)
+    parser.add_argument("--dir", default=".", help="parent directory for the scratch queue")
+    args = parser.parse_args()
+
+    body = b'{"data":"' + b"x" * max(0, args.body_bytes - 11) + b'"}'
+    workdir = tempfile.mkdtemp(prefix="webhook-queue-bench-", dir=args.dir)
+    args.queue_dir = os.path.join(workdir, "queue")
+    try:
+        per_process = args.entries // args.processes
+        start = time.perf_counter()
+        if args.processes == 1:
+            results = [asyncio.run(produce(args.queue_dir, args.partitions, per_process, args.concurrency, body))]
+        else:
+            with multiprocessing.Manager() as manager:
+                shared = manager.list()
+                procs = [
+                    multiprocessing.Process(target=produce_process, args=(args, body, per_process, shared))
+                    for _ in range(args.processes)
+                ]
+                for p in procs:
+                    p.start()
+                for p in procs:
+                    p.join()
+                results = list(shared)
+        wall = time.perf_counter() - start
+
+        total = sum(r["entries"] for r in results)
+        commits = sum(r["commits"] for r in results)
+        print(f"enqueue: {total} entries of {len(body)} B in {wall:.2f}s = {total / wall:,.0f}/s durable "
+              f"({args.processes} process(es), {args.partitions} partitions)")
+        print(f"         {commits} fsynced appends, {total / commits:.0f} entries per fsync")
+        for r in results:
+            print(f"         latency p50 {r['p50_ms']:.1f}ms p99 {r['p99_ms']:.1f}ms")
+
+        elapsed = asyncio.run(drain(args.queue_dir, args.partitions, total))
+        print(f"drain:   {total} entries acked in {elapsed:.2f}s = {total / elapsed:,.0f}/s")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""
+Fairness, rate limiting and per-event overhead of the delivery scheduler.
+
+    python -m benchmarks.bench_scheduler [--queued 1000000] [--tenants 10000]
+        [--burst 20000] [--quiet 20] [--delivery-ms 5] [--concurrency 50]
+
+overhead   enqueue and dequeue cost with `queued` deliveries spread over
+           `tenants` subscriptions, all waiting at once; repeated with
+           fractional weights (0.01, and a mix of 0.01 and 1), where the
+           slowest single dequeue is reported too
+fairness   one subscription sends `burst` events, then `quiet` others send
+           one each; how long the quiet ones wait behind the burst with a
+           single FIFO (the previous behaviour) vs the fair scheduler
+rate       a subscription limited to 200/s with a burst of 20
+ordered    deliveries of an ordered subscription arrive in sequence
+
+Deliveries are simulated (asyncio.sleep of --delivery-ms); no network or
+database is used.
+"""
+import argparse
+import asyncio
+import time
+
+from app.services.delivery_scheduler import DeliveryScheduler
+from app.services.subscription_cache import CachedSubscription, subscription_cache
+
+
+def subscription(subscription_id: int, **settings) -> CachedSubscription:
+    value = CachedSubscription(
+        id=subscription_id, target_url="", secret=None, event_type=None,
+        max_retries=1, retry_backoff="1", retry_jitter=0.0, **settings,
+    )
+    subscription_cache.put(value)
+    return value
+
+
+def percentile(values, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+async def overhead(queued: int, tenants: int, weight=lambda i: 1.0, label: str = ""):
+    scheduler = DeliveryScheduler()
+    for i in range(tenants):
+        subscription(i + 1, delivery_weight=weight(i))
+    start = time.perf_counter()
+    for n in range(queued):
+        await scheduler.enqueue(n % tenants + 1, b"{}", "wh_bench")
+    enqueued = time.perf_counter() - start
+
+    start = time.perf_counter()
+    popped = 0
+    slowest = 0.0
+    while True:
+        before = time.perf_counter()
+        if scheduler._pop() is None:
+            break
+        slowest = max(slowest, time.perf_counter() - before)
+        popped += 1
+    dequeued = time.perf_counter() - start
+    print(f"overhead: {queued:,} queued over {tenants:,} subscriptions{label}: "
+          f"enqueue {enqueued / queued * 1e6:.2f} us, dequeue {dequeued / popped * 1e6:.2f} us per delivery "
+          f"(slowest {slowest * 1e6:.0f} us)")
+
+
+async def fairness(args):
+    noisy, quiet = 1, range(2, 2 + args.quiet)
+    for subscription_id in (noisy, *quiet):
+        subscription(subscription_id)
+    delay = args.delivery_ms / 1000
+
+    async def fifo() -> list:
+        queue: asyncio.Queue = asyncio.Queue()
+        waits = []
+
+        async def worker():
+            while True:
+                subscription_id, enqueued_at = await queue.get()
+                if subscription_id != noisy:
+                    waits.append(time.monotonic() - enqueued_at)
+                await asyncio.sleep(delay)
+                queue.task_done()
+
+        workers = [asyncio.ensure_future(worker()) for _ in range(args.concurrency)]
+        for _ in range(args.burst):
+            queue.put_nowait((noisy, time.monotonic()))
+        for subscription_id in quiet:
+            queue.put_nowait((subscription_id, time.monotonic()))
+        while len(waits) < len(quiet):
+            await asyncio.sleep(0.01)
+        for w in workers:
+            w.cancel()
+        return waits
+
+    async def fair() -> list:
+        waits = []
+        enqueued = {}
+
+        async def dispatch(subscription_id, payload, webhook_id, attempt):
+            if subscription_id != noisy:
+                waits.append(time.monotonic() - enqueued[webhook_id])
+            await asyncio.sleep(delay)
+
+        scheduler = DeliveryScheduler(concurrency=args.concurrency)
+        scheduler.start(dispatch)
+        for n in range(args.burst):
+            await scheduler.enqueue(noisy, b"{}", f"wh_noisy_{n}")
+        for subscription_id in quiet:
+            enqueued[f"wh_quiet_{subscription_id}"] = time.monotonic()
+            await scheduler.enqueue(subscription_id, b"{}", f"wh_quiet_{subscription_id}")
+        while len(waits) < len(quiet):
+            await asyncio.sleep(0.01)
+        await scheduler.stop()
+        return waits
+
+    print(f"fairness: {args.burst:,}-event burst, {args.quiet} quiet subscriptions, "
+          f"{args.delivery_ms}ms deliveries, concurrency {args.concurrency}")
+    for name, run in (("fifo", fifo), ("fair", fair)):
+        waits = await run()
+        print(f"  {name}: quiet subscriptions waited p50 {percentile(waits, 0.5) * 1000:,.0f}ms "
+              f"max {max(waits) * 1000:,.0f}ms")
+
+
+async def rate_limit(count: int = 300):
+    subscription(100_001, rate_limit=200.0, rate_limit_burst=20)
+    sent = []
+
+    async def dispatch(subscription_id, payload, webhook_id, attempt):
+        sent.append(time.monotonic())
+
+    scheduler = DeliveryScheduler()
+    scheduler.start(dispatch)
+    start = time.monotonic()
+    for n in range(count):
+        await scheduler.enqueue(100_001, b"{}", f"wh_rate_{n}")
+    while len(sent) < count:
+        await asyncio.sleep(0.01)
+    await scheduler.stop()
+    elapsed = sent[-1] - start
+    print(f"rate:     {count} deliveries limited to 200/s (burst 20) took {elapsed:.2f}s "
+          f"= {(count - 20) / elapsed:.0f}/s after the burst")
+
+
+async def ordered(count: int = 200):
+    subscription(100_002, ordered_delivery=True)
+    seen = []
+
+    async def dispatch(subscription_id, payload, webhook_id, attempt):
+        await asyncio.sleep(0.0005 * (len(seen) % 3))
+        seen.append(int(webhook_id.rsplit("_", 1)[1]))
+
+    scheduler = DeliveryScheduler(concurrency=50)
+    scheduler.start(dispatch)
+    for n in range(count):
+        await scheduler.enqueue(100_002, b"{}", f"wh_ordered_{n}")
+    while len(seen) < count:
+        await asyncio.sleep(0.01)
+    await scheduler.stop()
+    print(f"ordered:  {count} deliveries, in order: {seen == sorted(seen)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queued", type=int, default=1_000_000)
+    parser.add_argument("--tenants", type=int, default=10_000)
+    parser.add_argument("--burst", type=int, default=20_000)
+    parser.add_argument("--quiet", type=int, default=20)
+    parser.add_argument("--delivery-ms", type=float, default=5.0)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+
+    asyncio.run(overhead(args.queued, args.tenants))
+    asyncio.run(overhead(args.queued // 10, 2000, lambda i: 0.01, ", weight 0.01"))
+    asyncio.run(overhead(args.queued // 10, 2000, lambda i: 0.01 if i % 2 else 1.0, ", weights 0.01/1"))
+    asyncio.run(fairness(args))
+    asyncio.run(rate_limit())
+    asyncio.run(ordered())
+
+
+if __name__ == "__main__":
+    main()
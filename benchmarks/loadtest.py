@@ -0,0 +1,286 @@
+"""
+End-to-end load test for ingest and delivery. Runs fully offline.
+
+    python -m benchmarks.loadtest --rate 200 --duration 10 --modes background,celery \
+        --error-rate 0.05 --out results.json
+    python -m benchmarks.loadtest ... --compare baseline.json --tolerance 0.2
+
+Each mode starts the app (and for "celery" a worker on the filesystem://
+broker stand-in) in a scratch directory with a local stub receiver as the
+only subscriber. It then drives POST /api/webhooks/ingest/{id} at a fixed
+open-loop rate and waits for deliveries to settle. Reported per mode:
+
+  ingest      p50/p95/p99/max latency of the ingest request, non-202 count
+  delivery    end-to-end latency (send -> first 2xx at the receiver),
+              deliveries/sec, undelivered count
+  retries     attempts beyond the first, from delivery_logs
+  db          delivery_logs rows written and rows/sec
+
+Results are written as JSON. With --compare, key metrics are checked
+against a previous results file and the exit status is 1 on regression.
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import httpx
+import requests
+
+from benchmarks.app_server import REPO_ROOT, AppServer, CeleryWorker
+from benchmarks.stub_receiver import StubReceiver
+
+# metric path -> True when higher is better
+REGRESSION_METRICS = {
+    ("ingest", "p99_ms"): False,
+    ("delivery", "p99_ms"): False,
+    ("delivery", "deliveries_per_sec"): True,
+}
+
+
+def percentiles(values) -> dict:
+    values = sorted(values)
+    if not values:
+        return {"count": 0}
+
+    def pick(q):
+        return values[min(len(values) - 1, int(len(values) * q))] * 1000
+
+    return {
+        "count": len(values),
+        "p50_ms": pick(0.50),
+        "p95_ms": pick(0.95),
+        "p99_ms": pick(0.99),
+        "max_ms": values[-1] * 1000,
+    }
+
+
+async def drive(url: str, rate: float, duration: float, payload_bytes: int):
+    """
+    Open-loop load: request i is sent at start + i / rate regardless of how
+    long earlier requests take, so a slow server shows up as latency.
+    """
+    filler = "x" * payload_bytes
+    sent = {}
+    latencies = []
+    errors = 0
+    limits = httpx.Limits(max_connections=256, max_keepalive_connections=256)
+
+    async with httpx.AsyncClient(limits=limits, timeout=30) as client:
+        async def send(seq: int):
+            nonlocal errors
+            sent[seq] = time.time()
+            start = time.perf_counter()
+            try:
+                response = await client.post(url, json={"seq": seq, "data": filler})
+                if response.status_code != 202:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        tasks = []
+        for seq in range(int(rate * duration)):
+            delay = start + seq / rate - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.ensure_future(send(seq)))
+        await asyncio.gather(*tasks)
+
+    return sent, latencies, errors
+
+
+def wait_for_deliveries(stub: StubReceiver, expected: int, settle: float, timeout: float):
+    """
+    Wait until every event arrived, or the receiver has been idle for
+    `settle` seconds (remaining events exhausted their retries), or timeout.
+    """
+    deadline = time.time() + timeout
+    last_count, last_change = stub.requests, time.time()
+    while time.time() < deadline and len(stub.arrivals) < expected:
+        time.sleep(0.05)
+        if stub.requests != last_count:
+            last_count, last_change = stub.requests, time.time()
+        elif time.time() - last_change > settle:
+            break
+
+
+def db_stats(db_path: str, window: float) -> dict:
+    con = sqlite3.connect(db_path)
+    try:
+        rows, retries = con.execute(
+            "SELECT COUNT(*), COALESCE(SUM(attempt_number > 1), 0) FROM delivery_logs"
+        ).fetchone()
+    finally:
+        con.close()
+    return {
+        "delivery_log_rows": rows,
+        "retries": retries,
+        "rows_per_sec": rows / window if window else 0.0,
+    }
+
+
+def run_mode(mode: str, args) -> dict:
+    workdir = tempfile.mkdtemp(prefix=f"webhook-loadtest-{mode}-")
+    env = {
+        "DELIVERY_BACKEND": mode,
+        "DELIVERY_READ_TIMEOUT": str(args.read_timeout),
+        "CELERY_BROKER_URL": "filesystem://",
+        "CELERY_BROKER_DIR": os.path.join(workdir, "broker"),
+        "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'sql_app.db')}",
+    }
+    stub = StubReceiver(
+        latency=args.latency,
+        error_rate=args.error_rate,
+        timeout_rate=args.timeout_rate,
+        hang=args.read_timeout * 2,
+    )
+    server = AppServer(env=env, workdir=workdir)
+    worker = CeleryWorker(workdir, env=env, concurrency=args.workers) if mode == "celery" else None
+    try:
+        stub.start()
+        server.start()
+        if worker is not None:
+            worker.start()
+
+        subscription = requests.post(
+            f"{server.base_url}/subscriptions/",
+            json={
+                "target_url": stub.url,
+                "retry_backoff": args.retry_backoff,
+                "max_retries": args.max_retries,
+                "retry_jitter": 0.1,
+            },
+        ).json()
+        ingest_url = f"{server.base_url}/api/webhooks/ingest/{subscription['id']}"
+
+        started = time.time()
+        sent, latencies, errors = asyncio.run(
+            drive(ingest_url, args.rate, args.duration, args.payload_bytes)
+        )
+        wait_for_deliveries(stub, len(sent), args.settle, args.drain_timeout)
+        # Let the last buffered delivery log batch reach the database
+        time.sleep(1.0)
+        window = time.time() - started
+
+        e2e = [stub.arrivals[seq] - sent_at for seq, sent_at in sent.items() if seq in stub.arrivals]
+        delivered_span = (max(stub.arrivals.values()) - started) if stub.arrivals else 0.0
+        delivery = percentiles(e2e)
+        delivery.update({
+            "sent": len(sent),
+            "delivered": len(e2e),
+            "undelivered": len(sent) - len(e2e),
+            "deliveries_per_sec": len(e2e) / delivered_span if delivered_span else 0.0,
+        })
+
+        ingest = percentiles(latencies)
+        ingest.update({
+            "errors": errors,
+            "achieved_rate": len(sent) / args.duration,
+        })
+
+        return {
+            "ingest": ingest,
+            "delivery": delivery,
+            "receiver": {"requests": stub.requests, "responses": dict(stub.responses)},
+            "db": db_stats(os.path.join(workdir, "sql_app.db"), window),
+        }
+    finally:
+        if worker is not None:
+            worker.stop()
+        server.stop()
+        stub.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    regressions = []
+    for mode, metrics in results["modes"].items():
+        base = baseline.get("modes", {}).get(mode)
+        if base is None:
+            continue
+        for (section, key), higher_is_better in REGRESSION_METRICS.items():
+            new, old = metrics[section].get(key), base[section].get(key)
+            if not new or not old:
+                continue
+            change = (new - old) / old
+            if (change < -tolerance) if higher_is_better else (change > tolerance):
+                regressions.append(f"{mode} {section}.{key}: {old:.1f} -> {new:.1f} ({change:+.0%})")
+    return regressions
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", default="background", help="comma-separated: background,celery")
+    parser.add_argument("--rate", type=float, default=100.0, help="ingest requests per second")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of load")
+    parser.add_argument("--payload-bytes", type=int, default=512)
+    parser.add_argument("--latency", type=float, default=0.01, help="receiver latency (s)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction answered with 500")
+    parser.add_argument("--timeout-rate", type=float, default=0.0, help="fraction that hang past the read timeout")
+    parser.add_argument("--read-timeout", type=float, default=2.0, help="service DELIVERY_READ_TIMEOUT (s)")
+    parser.add_argument("--retry-backoff", default="0.5,1,2")
+    parser.add_argument("--max-retries", type=int, default=4)
+    parser.add_argument("--workers", type=int, default=4, help="celery worker processes")
+    parser.add_argument("--settle", type=float, default=5.0, help="idle seconds that end the drain wait")
+    parser.add_argument("--drain-timeout", type=float, default=120.0)
+    parser.add_argument("--out", help="write JSON results to this file")
+    parser.add_argument("--compare", help="baseline JSON results to check against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression")
+    args = parser.parse_args()
+
+    results = {
+        "meta": {
+            "revision": git_revision(),
+            "started_at": datetime.utcnow().isoformat(),
+            "python": sys.version.split()[0],
+            "params": vars(args),
+        },
+        "modes": {},
+    }
+    for mode in args.modes.split(","):
+        results["modes"][mode] = run_mode(mode, args)
+
+    print(f"{'mode':<12}{'ingest p50':>12}{'ingest p99':>12}{'e2e p50':>10}{'e2e p99':>10}"
+          f"{'deliv/s':>9}{'lost':>6}{'retries':>9}{'db rows/s':>11}")
+    for mode, r in results["modes"].items():
+        print(
+            f"{mode:<12}{r['ingest'].get('p50_ms', 0):>10.1f}ms{r['ingest'].get('p99_ms', 0):>10.1f}ms"
+            f"{r['delivery'].get('p50_ms', 0):>8.0f}ms{r['delivery'].get('p99_ms', 0):>8.0f}ms"
+            f"{r['delivery']['deliveries_per_sec']:>9.0f}{r['delivery']['undelivered']:>6}"
+            f"{r['db']['retries']:>9}{r['db']['rows_per_sec']:>11.0f}"
+        )
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
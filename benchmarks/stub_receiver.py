@@ -0,0 +1,162 @@
+"""
+Minimal keep-alive HTTP/1.1 receiver used as a webhook target in benchmarks.
+
+Runs on its own event loop in a background thread so it never competes with
+the loop being measured. It can inject failures: error_rate answers 500,
+timeout_rate holds the request for `hang` seconds (longer than the
+service's read timeout) before answering.
+
+Payloads carrying a numeric "seq" field are tracked so load tests can
+measure end-to-end latency: `arrivals` maps seq to the time of its first
+successful delivery.
+"""
+import asyncio
+import json
+import random
+import threading
+import time
+from collections import Counter
+
+
+class StubReceiver:
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.0,
+        error_rate: float = 0.0,
+        timeout_rate: float = 0.0,
+        hang: float = 30.0,
+    ):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.error_rate = error_rate
+        self.timeout_rate = timeout_rate
+        self.hang = hang
+        self.requests = 0
+        self.responses = Counter()
+        self.arrivals = {}
+        self._loop = None
+        self._server = None
+        self._writers = set()
+        self._ready = threading.Event()
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}/webhook"
+
+    def start(self) -> "StubReceiver":
+        self._thread = threading.Thread(target=self._run, name="stub-receiver", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        return self
+
+    def stop(self):
+        if self._loop is not None:
+            asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+
+    async def _shutdown(self):
+        self._server.close()
+        self._closing.set()
+        # Closing the transports lets each handler see EOF and exit on its own
+        for writer in list(self._writers):
+            writer.close()
+        tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._closing = asyncio.Event()
+        self._server = self._loop.run_until_complete(
+            asyncio.start_server(self._handle, self.host, self.port, backlog=1024)
+        )
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._ready.set()
+        try:
+            self._loop.run_forever()
+        finally:
+            self._loop.close()
+
+    async def _respond(self, body: bytes) -> bytes:
+        roll = random.random()
+        if roll < self.timeout_rate:
+            try:
+                await asyncio.wait_for(self._closing.wait(), self.hang)
+            except asyncio.TimeoutError:
+                pass
+            status = "504 Gateway Timeout"
+        elif roll < self.timeout_rate + self.error_rate:
+            status = "500 Internal Server Error"
+        else:
+            status = "200 OK"
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        self.responses[status[:3]] += 1
+        if status[0] == "2" and b'"seq"' in body:
+            try:
+                self.arrivals.setdefault(json.loads(body)["seq"], time.time())
+            except (ValueError, KeyError, TypeError):
+                pass
+        return f"HTTP/1.1 {status}\r\nContent-Length: 2\r\nConnection: keep-alive\r\n\r\nok".encode()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._writers.add(writer)
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                length = 0
+                for line in head.split(b"\r\n"):
+                    if line[:15].lower() == b"content-length:":
+                        length = int(line[15:].strip())
+                body = await reader.readexactly(length) if length else b""
+                self.requests += 1
+                writer.write(await self._respond(body))
+                try:
+                    await writer.drain()
+                except ConnectionError:
+                    break
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--timeout-rate", type=float, default=0.0)
+    parser.add_argument("--hang", type=float, default=30.0)
+    args = parser.parse_args()
+
+    with StubReceiver(
+        port=args.port,
+        latency=args.latency,
+        error_rate=args.error_rate,
+        timeout_rate=args.timeout_rate,
+        hang=args.hang,
+    ) as stub:
+        print(f"Listening on {stub.url}")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
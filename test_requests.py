@@ -4,18 +4,23 @@ BASE_URL = "http://localhost:8000"
 
 # Create subscription
 print("Creating subscription:")
-print(requests.post(
+subscription = requests.post(
     f"{BASE_URL}/subscriptions/",
     json={"target_url": "http://localhost:9000/webhook", "secret": "test123"}
-).json())
+).json()
+print(subscription)
 
 # Send webhook
 print("\nSending webhook:")
-print(requests.post(
-    f"{BASE_URL}/webhooks/1",
+queued = requests.post(
+    f"{BASE_URL}/api/webhooks/ingest/{subscription['id']}",
     json={"event": "test", "data": "value"}
-).json())
+).json()
+print(queued)
 
-# Check logs
-print("\nChecking logs:")
-print(requests.get(f"{BASE_URL}/logs/1").json())
+# Check status
+print("\nChecking status:")
+print(requests.get(
+    f"{BASE_URL}/api/webhooks/status/{queued['webhook_id']}",
+    params={"include_attempts": True}
+).json())
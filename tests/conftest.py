@@ -0,0 +1,5 @@
+import os
+import tempfile
+
+# The app opens DATABASE_URL when first imported: keep tests off ./sql_app.db
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp(prefix='webhook-tests-')}/test.db")
@@ -0,0 +1,102 @@
+"""
+Incremental bulk body parsers (app/services/bulk_ingest.py): however the
+body is split into chunks, the items (or the framing error) must be the
+same as for the body in one piece.
+"""
+import asyncio
+import json
+import random
+
+import pytest
+
+from app.services.bulk_ingest import BulkBodyTooLarge, BulkFormatError, iter_json_array, iter_ndjson
+
+MAX_BYTES = 1024 * 1024
+
+ARRAYS = [
+    b"[]",
+    b'[{"a": 1}, {"b": [1, 2, {"c": null}]}]',
+    b"[1.5, -0.25e-3, 1E+10, 12345678901234567890, 0, -7]",
+    b'[1.5e3, {"n": 2.5E-2}, 3]',
+    b'[true, false, null, "x"]',
+    b' \n[ {"s": "quote \\" backslash \\\\ newline \\n unicode \\u00e9 \\ud83d\\ude00"} ,\t"]", "[,"]\n ',
+    '[{"text": "café ☃ \U0001f600"}, "é"]'.encode(),
+    b'[[], {}, [[[]]], {"": {"": {}}}]',
+]
+
+INVALID = [
+    (b"[1.]", "Expected ',' or ']' after item 0"),
+    (b"[1 2]", "Expected ',' or ']' after item 0"),
+    (b"[1e]", "Expected ',' or ']' after item 0"),
+    (b'[{"a": 1}', "Unexpected end of JSON array"),
+    (b'[{"a": }]', "Invalid JSON in item 0"),
+    (b"[1] 2", "Unexpected data after JSON array"),
+    (b'{"a": 1}', "Expected a JSON array or NDJSON body"),
+]
+
+
+def split(body: bytes, rng: random.Random, max_chunk: int):
+    chunks, pos = [], 0
+    while pos < len(body):
+        size = rng.randint(1, max_chunk)
+        chunks.append(body[pos:pos + size])
+        pos += size
+    return chunks
+
+
+def collect(parser, chunks, max_bytes: int = MAX_BYTES):
+    async def stream():
+        for chunk in chunks:
+            yield chunk
+
+    async def run():
+        items = []
+        try:
+            async for item in parser(stream(), max_bytes):
+                items.append(item)
+        except BulkFormatError as e:
+            return items, str(e)
+        return items, None
+    return asyncio.run(run())
+
+
+def fuzz(parser, body: bytes, expected, rounds: int = 100):
+    rng = random.Random(body)
+    for max_chunk in (1, 2, 3, 7):
+        for _ in range(rounds // 4):
+            chunks = split(body, rng, max_chunk)
+            assert collect(parser, chunks) == expected, chunks
+
+
+@pytest.mark.parametrize("body", ARRAYS)
+def test_json_array_any_chunking(body):
+    values = json.loads(body)
+    expected = ([(i, value, None) for i, value in enumerate(values)], None)
+    assert collect(iter_json_array, [body]) == expected
+    fuzz(iter_json_array, body, expected)
+
+
+def test_number_split_at_chunk_boundary():
+    assert collect(iter_json_array, [b"[1.", b"5]"]) == ([(0, 1.5, None)], None)
+    assert collect(iter_json_array, [b"[1", b"e3, 2", b"]"]) == ([(0, 1000.0, None), (1, 2, None)], None)
+    assert collect(iter_json_array, [b"[-", b"1]"]) == ([(0, -1, None)], None)
+
+
+@pytest.mark.parametrize("body, error", INVALID)
+def test_json_array_framing_errors(body, error):
+    items, message = collect(iter_json_array, [body])
+    assert message == error
+    fuzz(iter_json_array, body, (items, message))
+
+
+def test_ndjson_any_chunking():
+    lines = [json.dumps(value) for value in json.loads(ARRAYS[1]) + json.loads(ARRAYS[2])]
+    body = ("\n".join(lines[:3]) + "\n\n  \nnot json\n" + "\n".join(lines[3:])).encode()
+    expected = collect(iter_ndjson, [body])
+    assert [error for _, _, error in expected[0]] == [None] * 3 + ["Invalid JSON"] + [None] * (len(lines) - 3)
+    fuzz(iter_ndjson, body, expected)
+
+
+def test_body_over_limit():
+    with pytest.raises(BulkBodyTooLarge):
+        collect(iter_json_array, [b"[1, 2, ", b"3]"], max_bytes=8)
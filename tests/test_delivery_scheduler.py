@@ -0,0 +1,125 @@
+"""
+Delivery scheduler (app/services/delivery_scheduler.py): weighted fairness,
+rate limits, ordered delivery, and a queue partition shared by a throttled
+and an idle subscription. Deliveries are simulated; subscriptions come from
+the in-memory subscription cache.
+"""
+import asyncio
+import time
+
+from app.services.delivery_scheduler import DeliveryScheduler
+from app.services.ingest_queue import IngestQueue, PartitionConsumer
+from app.services.subscription_cache import CachedSubscription, subscription_cache
+
+
+def subscription(subscription_id: int, **settings) -> CachedSubscription:
+    value = CachedSubscription(
+        id=subscription_id, target_url="", secret=None, event_type=None,
+        max_retries=1, retry_backoff="1", retry_jitter=0.0, **settings,
+    )
+    subscription_cache.put(value)
+    return value
+
+
+def test_weights_share_dispatches():
+    subscription(201, delivery_weight=1.0)
+    subscription(202, delivery_weight=3.0)
+    subscription(203, delivery_weight=0.5)
+
+    async def run():
+        scheduler = DeliveryScheduler()
+        for n in range(100):
+            for subscription_id in (201, 202, 203):
+                await scheduler.enqueue(subscription_id, b"{}", f"wh_{subscription_id}_{n}")
+        picked = [scheduler._pop()[0].subscription_id for _ in range(90)]
+        return {s: picked.count(s) for s in (201, 202, 203)}
+
+    # 1 : 3 : 0.5 of the first 90 dispatches
+    assert asyncio.run(run()) == {201: 20, 202: 60, 203: 10}
+
+
+def test_rate_limit():
+    subscription(211, rate_limit=20.0, rate_limit_burst=5)
+    sent = []
+
+    async def dispatch(subscription_id, payload, webhook_id, attempt):
+        sent.append(time.monotonic())
+
+    async def run():
+        scheduler = DeliveryScheduler()
+        scheduler.start(dispatch)
+        start = time.monotonic()
+        for n in range(15):
+            await scheduler.enqueue(211, b"{}", f"wh_rate_{n}")
+        while len(sent) < 15:
+            await asyncio.sleep(0.01)
+        await scheduler.stop()
+        return [t - start for t in sent]
+
+    elapsed = asyncio.run(run())
+    # The burst goes out at once, the other 10 at 20/s
+    assert elapsed[4] < 0.1
+    assert 0.4 < elapsed[-1] < 1.5
+
+
+def test_ordered_delivery():
+    subscription(221, ordered_delivery=True)
+    seen = []
+    running = []
+
+    async def dispatch(subscription_id, payload, webhook_id, attempt):
+        running.append(webhook_id)
+        assert len(running) == 1
+        await asyncio.sleep(0.001 * (len(seen) % 3))
+        seen.append(int(webhook_id.rsplit("_", 1)[1]))
+        running.remove(webhook_id)
+
+    async def run():
+        scheduler = DeliveryScheduler(concurrency=20)
+        scheduler.start(dispatch)
+        for n in range(50):
+            await scheduler.enqueue(221, b"{}", f"wh_ordered_{n}")
+        while len(seen) < 50:
+            await asyncio.sleep(0.01)
+        await scheduler.stop()
+
+    asyncio.run(run())
+    assert seen == list(range(50))
+
+
+def test_throttled_subscription_does_not_stall_its_partition(tmp_path):
+    # Both in the one partition; 231 gets a token every half second
+    subscription(231, rate_limit=2.0, rate_limit_burst=1)
+    subscription(232)
+    queue = IngestQueue(queue_dir=str(tmp_path / "queue"), partitions=1)
+    delivered = {}
+
+    async def dispatch(subscription_id, payload, webhook_id, attempt):
+        delivered[webhook_id] = time.monotonic()
+
+    async def run():
+        for n in range(30):
+            await queue.enqueue([(231, f"wh_throttled_{n}")], b"{}")
+        await queue.enqueue([(232, "wh_other")], b"{}")
+        await queue.stop()
+
+        scheduler = DeliveryScheduler()
+        scheduler.start(dispatch)
+        consumer = PartitionConsumer(queue.log(0), scheduler.submit, concurrency=4)
+        consumer.recover()
+        start = time.monotonic()
+        task = asyncio.ensure_future(consumer.run(poll_interval=0.01))
+        while "wh_other" not in delivered and time.monotonic() - start < 4:
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.05)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        await scheduler.stop()
+        consumer.close()
+        return start, consumer
+
+    start, consumer = asyncio.run(run())
+    assert delivered["wh_other"] - start < 0.5
+    # Acked; the throttled entries are still waiting their turn, unacked
+    assert consumer.delivered == 1 + sum(1 for w in delivered if w.startswith("wh_throttled"))
+    assert len(consumer.pending) == 30 - consumer.delivered + 1
@@ -0,0 +1,110 @@
+"""
+Idempotency-Key handling (app/services/idempotency.py) against a scratch
+SQLite database: replays, concurrent duplicates and Bloom filter false
+positives.
+"""
+import asyncio
+
+import pytest
+
+from app.database import Base, SessionLocal, engine
+from app.models import IdempotencyKey
+from app.services.idempotency import IdempotencyStore
+
+
+@pytest.fixture
+def db():
+    Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    session.query(IdempotencyKey).delete()
+    session.commit()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+def make_store(**kwargs) -> IdempotencyStore:
+    return IdempotencyStore(flush_interval=0.01, refresh_interval=60, **kwargs)
+
+
+async def loaded(store: IdempotencyStore) -> IdempotencyStore:
+    store.start()
+    while not store._filter_loaded:
+        await asyncio.sleep(0.01)
+    return store
+
+
+def test_replay_gets_the_stored_response(db):
+    response = {"status": "queued", "webhook_id": "wh_1"}
+
+    async def run():
+        store = await loaded(make_store())
+        assert await store.begin(db, "ingest:1:a") is None
+        store.finish("ingest:1:a", response)
+        assert await store.begin(db, "ingest:1:a") == response
+        assert store.replays == 1
+        await store.stop()
+
+        # Another process (empty LRU) finds it through the filter and table
+        other = await loaded(make_store())
+        assert await other.begin(db, "ingest:1:a") == response
+        assert other.db_lookups == 1
+        await other.stop()
+    asyncio.run(run())
+
+
+def test_concurrent_duplicates_enqueue_once(db):
+    enqueued = []
+
+    async def request(store):
+        response = await store.begin(db, "ingest:1:b")
+        if response is None:
+            enqueued.append(1)
+            await asyncio.sleep(0.01)
+            store.finish("ingest:1:b", {"n": len(enqueued)})
+        return response
+
+    async def run():
+        # Filter not loaded yet: every lookup goes to the table and yields
+        store = make_store()
+        results = await asyncio.gather(*(request(store) for _ in range(5)))
+        await store.stop()
+        return results
+
+    results = asyncio.run(run())
+    assert len(enqueued) == 1
+    assert results.count(None) == 1
+    assert [r for r in results if r is not None] == [{"n": 1}] * 4
+
+
+def test_aborted_key_is_handed_to_the_next_duplicate(db):
+    async def run():
+        store = make_store()
+        assert await store.begin(db, "ingest:1:c") is None
+        waiting = asyncio.ensure_future(store.begin(db, "ingest:1:c"))
+        await asyncio.sleep(0.01)
+        assert not waiting.done()
+        store.abort("ingest:1:c")
+        assert await waiting is None
+        assert "ingest:1:c" in store._in_flight
+        store.abort("ingest:1:c")
+    asyncio.run(run())
+
+
+def test_bloom_false_positive_falls_through_to_the_table(db):
+    async def run():
+        store = await loaded(make_store())
+        # Not in the filter: answered without touching the table
+        assert await store.begin(db, "ingest:1:new") is None
+        assert store.db_lookups == 0
+        store.abort("ingest:1:new")
+
+        # A filter hit for a key that was never recorded
+        store._filter.add("ingest:1:d")
+        assert await store.begin(db, "ingest:1:d") is None
+        assert store.db_lookups == 1
+        assert store.replays == 0
+        store.abort("ingest:1:d")
+        await store.stop()
+    asyncio.run(run())
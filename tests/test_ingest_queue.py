@@ -0,0 +1,216 @@
+"""
+Crash-recovery paths of the on-disk ingest queue (app/services/ingest_queue.py).
+
+Each test drives the real files under a temporary QUEUE_DIR; a "crash" is
+simulated by dropping a consumer without writing its outstanding acks.
+"""
+import asyncio
+import os
+
+from app.services.ingest_queue import IngestQueue, PartitionConsumer, QueueConsumer, _PartitionWriter, encode_record
+
+
+def make_queue(tmp_path, segment_bytes: int = 1024 * 1024) -> IngestQueue:
+    return IngestQueue(queue_dir=str(tmp_path / "queue"), partitions=1, segment_bytes=segment_bytes)
+
+
+def enqueue(queue: IngestQueue, count: int, start: int = 0):
+    async def run():
+        # One commit each, so segment rotation can happen between entries
+        for n in range(start, start + count):
+            await queue.enqueue([(1, f"wh_{n}")], b'{"n": %d}' % n)
+        await queue.stop()
+    asyncio.run(run())
+
+
+def consume(queue: IngestQueue, until: int, consumer: PartitionConsumer = None, timeout: float = 5.0,
+            failures: dict = None, max_attempts: int = 10):
+    """
+    Recover partition 0 (or continue with `consumer`) and run it until
+    `until` entries have been delivered. Returns (consumer, webhook ids).
+    `failures` maps a webhook id to how many times its dispatch raises.
+    """
+    delivered = []
+    failures = dict(failures or {})
+
+    async def dispatch(subscription_id, payload, webhook_id):
+        if failures.get(webhook_id):
+            failures[webhook_id] -= 1
+            raise RuntimeError("database is locked")
+        delivered.append(webhook_id)
+
+    if consumer is None:
+        consumer = PartitionConsumer(
+            queue.log(0), dispatch, concurrency=4, max_attempts=max_attempts, retry_backoff=0.01
+        )
+        consumer.recover()
+    else:
+        consumer.dispatch = dispatch
+
+    async def run():
+        task = asyncio.ensure_future(consumer.run(poll_interval=0.01))
+        deadline = asyncio.get_running_loop().time() + timeout
+        while len(delivered) < until and asyncio.get_running_loop().time() < deadline:
+            await asyncio.sleep(0.01)
+        # Give an over-delivery the chance to show up
+        await asyncio.sleep(0.05)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(run())
+    return consumer, delivered
+
+
+def test_replay_after_torn_tail(tmp_path):
+    queue = make_queue(tmp_path)
+    enqueue(queue, 3)
+    segment = queue.log(0).segment_path(queue.log(0).segments()[-1])
+    # A crash in the middle of an append leaves half a record behind
+    torn = encode_record([(1, "wh_torn")], b'{"torn": true}')
+    with open(segment, "ab") as f:
+        f.write(torn[:len(torn) // 2])
+
+    consumer, delivered = consume(queue, until=3)
+    consumer.close()
+    assert delivered == ["wh_0", "wh_1", "wh_2"]
+
+    # The next producer cuts the torn bytes off before appending
+    queue = make_queue(tmp_path)
+    enqueue(queue, 1, start=3)
+    consumer, delivered = consume(queue, until=4)
+    consumer.close()
+    assert delivered == ["wh_0", "wh_1", "wh_2", "wh_3"]
+
+
+def test_replays_entries_not_yet_acked(tmp_path):
+    queue = make_queue(tmp_path)
+    enqueue(queue, 5)
+
+    consumer, delivered = consume(queue, until=5)
+    assert sorted(delivered) == [f"wh_{n}" for n in range(5)]
+    acks = sorted(consumer.take_acks())
+    # Crash after only the first two acks reached the ack log
+    consumer.write_acks(acks[:2])
+    consumer.close()
+
+    consumer = PartitionConsumer(queue.log(0), None, concurrency=4)
+    assert consumer.recover() == 2
+    consumer, delivered = consume(queue, until=3, consumer=consumer)
+    consumer.close()
+    assert sorted(delivered) == ["wh_2", "wh_3", "wh_4"]
+
+
+def test_compaction_keeps_pending_entries(tmp_path):
+    # Tiny segments: every entry gets its own
+    queue = make_queue(tmp_path, segment_bytes=16)
+    enqueue(queue, 6)
+    log = queue.log(0)
+    assert len(log.segments()) == 6
+
+    consumer, delivered = consume(queue, until=6)
+    positions = sorted(consumer.take_acks())
+    # wh_2 is still being delivered; everything else is acked
+    pending = positions[2]
+    consumer.pending.add(pending)
+    consumer.acked.discard(pending)
+    acked = [p for p in positions if p != pending]
+    consumer.write_acks(acked)
+
+    watermark = consumer.watermark()
+    assert watermark == pending
+    consumer.compact(watermark, [p for p in acked if p >= watermark])
+    consumer.close()
+
+    # Segments before the pending entry are gone, its own is kept
+    assert log.segments() == [p[0] for p in positions[2:]]
+    consumer, delivered = consume(queue, until=1)
+    consumer.close()
+    assert consumer.position >= positions[-1]
+    assert delivered == ["wh_2"]
+
+
+def test_takeover_of_locked_partition(tmp_path):
+    queue = make_queue(tmp_path)
+    enqueue(queue, 3)
+    first = QueueConsumer(queue, max_partitions=0)
+    second = QueueConsumer(queue, max_partitions=0)
+
+    lock_fd = first._try_lock(0)
+    assert lock_fd is not None
+    # Held by the first consumer: nobody else may consume the partition
+    assert second._try_lock(0) is None
+
+    # The owner dies before acking anything: its lock goes with it
+    os.close(lock_fd)
+    lock_fd = second._try_lock(0)
+    assert lock_fd is not None
+    try:
+        consumer, delivered = consume(queue, until=3)
+        consumer.close()
+        assert delivered == ["wh_0", "wh_1", "wh_2"]
+    finally:
+        os.close(lock_fd)
+
+
+def test_fan_out_is_split_by_subscription_partition(tmp_path):
+    queue = IngestQueue(queue_dir=str(tmp_path / "queue"), partitions=2)
+
+    async def run():
+        await queue.enqueue([(1, "wh_a"), (2, "wh_b"), (3, "wh_c")], b"{}")
+        await queue.enqueue([(3, "wh_d")], b"{}")
+        await queue.stop()
+    asyncio.run(run())
+
+    def read(partition):
+        log = queue.log(partition)
+        with open(log.segment_path(log.segments()[0]), "rb") as f:
+            entries, _, _ = log.scan(f, 0, 100)
+        return [entry.deliveries for entry in entries]
+
+    # Subscription 3's fan-out and direct deliveries share a partition, in order
+    assert read(0) == [[(2, "wh_b")]]
+    assert read(1) == [[(1, "wh_a"), (3, "wh_c")], [(3, "wh_d")]]
+
+
+def test_torn_tail_left_by_another_producer(tmp_path):
+    queue = make_queue(tmp_path)
+    log = queue.log(0)
+    writer = _PartitionWriter(log, queue.segment_bytes)
+    writer.append(encode_record([(1, "wh_0")], b"{}"))
+    # Another producer dies mid-append while this one keeps running
+    torn = encode_record([(1, "wh_torn")], b'{"torn": true}')
+    with open(log.segment_path(log.segments()[-1]), "ab") as f:
+        f.write(torn[:len(torn) // 2])
+    writer.append(encode_record([(1, "wh_1")], b"{}"))
+    writer.close()
+
+    consumer, delivered = consume(queue, until=2)
+    consumer.close()
+    assert delivered == ["wh_0", "wh_1"]
+
+
+def test_failed_dispatch_is_retried_not_acked(tmp_path):
+    queue = make_queue(tmp_path)
+    enqueue(queue, 3)
+
+    consumer, delivered = consume(queue, until=3, failures={"wh_1": 2})
+    consumer.close()
+    assert sorted(delivered) == ["wh_0", "wh_1", "wh_2"]
+    assert len(consumer.take_acks()) == 3
+    assert consumer.dead_lettered == 0
+
+
+def test_dispatch_that_keeps_failing_is_dead_lettered(tmp_path):
+    queue = make_queue(tmp_path)
+    enqueue(queue, 3)
+
+    consumer, delivered = consume(queue, until=2, failures={"wh_1": 100}, max_attempts=3)
+    consumer.close()
+    assert sorted(delivered) == ["wh_0", "wh_2"]
+    # Acked once it is safely in the dead-letter file
+    assert len(consumer.take_acks()) == 3
+    assert consumer.dead_lettered == 1
+    with open(queue.log(0).file("dead-letter"), "rb") as f:
+        entries, _, corrupt = queue.log(0).scan(f, 0, 100)
+    assert not corrupt
+    assert [(e.deliveries, e.body) for e in entries] == [([(1, "wh_1")], b'{"n": 1}')]